@@ -0,0 +1,195 @@
+"""
+analytics.py
+Materialized aggregate views over the catalogue snapshot (catalogue.py).
+
+Each view is a pandas groupby kept as additive partial sums (row counts and
+metric sums), so when the snapshot changes only the added, removed or changed
+degrees are subtracted from / added to the stored partials instead of
+regrouping the whole catalogue. The display tables (counts and means) are
+derived from the partials and written next to them; the app only reads those.
+
+    python analytics.py refresh            # incremental
+    python analytics.py refresh --full     # recompute from scratch
+"""
+
+import os
+import json
+import time
+
+import pandas as pd
+
+from cache_store import DATA_DIR
+from catalogue import SNAPSHOT_PATH, load_snapshot, snapshot_version
+
+AGGREGATES_DIR = os.path.join(DATA_DIR, "aggregates")
+_ROWS_FILE = "_rows.csv.gz"          # contributing rows of the last refresh
+_MANIFEST_FILE = "manifest.json"
+
+ECTS_METRICS = ["ects_basica", "ects_obligatoria", "ects_optativa", "ects_practicas",
+                "ects_tfg_tfm", "ects_total"]
+
+# name -> (group columns, metrics averaged over the degrees with ECTS data)
+AGGREGATES = {
+    "ects_por_rama": (["nivel_academico", "rama"], ECTS_METRICS),
+    "titulos_por_ccaa": (["tipo", "ccaa"], []),
+    "titulos_por_universidad": (["tipo", "universidad"], []),
+}
+_GROUP_COLS = sorted({c for by, _ in AGGREGATES.values() for c in by})
+
+
+# ─── Partial sums ─────────────────────────────────────────────────────────────
+
+def _contributing_rows(snapshot: pd.DataFrame) -> pd.DataFrame:
+    """Only the columns the views depend on, one row per codigo, plus a row hash."""
+    rows = snapshot.reindex(columns=["codigo"] + _GROUP_COLS + ECTS_METRICS).copy()
+    rows[_GROUP_COLS] = rows[_GROUP_COLS].fillna("").astype(str)
+    rows[ECTS_METRICS] = rows[ECTS_METRICS].apply(pd.to_numeric, errors="coerce").fillna(0.0)
+    rows["codigo"] = rows["codigo"].astype(str)
+    rows = rows.drop_duplicates("codigo").reset_index(drop=True)
+    rows["_hash"] = pd.util.hash_pandas_object(rows, index=False).astype("uint64").astype(str)
+    return rows
+
+
+def _partials(rows: pd.DataFrame, by: list[str], metrics: list[str]) -> pd.DataFrame:
+    """Additive partials per group: n (degrees), n_ects (with ECTS data), sum_<metric>."""
+    cols = ["n", "n_ects"] + [f"sum_{m}" for m in metrics]
+    if rows.empty:
+        return pd.DataFrame(columns=cols, index=pd.MultiIndex.from_arrays([[]] * len(by), names=by))
+    has_ects = rows["ects_total"] > 0
+    frame = pd.DataFrame({"n": 1, "n_ects": has_ects.astype(int)}, index=rows.index)
+    for m in metrics:
+        frame[f"sum_{m}"] = rows[m].where(has_ects, 0.0)
+    frame[by] = rows[by]
+    return frame.groupby(by, sort=False)[cols].sum()
+
+
+def _view(partials: pd.DataFrame, metrics: list[str]) -> pd.DataFrame:
+    """Display table derived from the partials: counts and mean ECTS per group."""
+    out = partials[["n", "n_ects"]].astype(int).copy()
+    for m in metrics:
+        out[f"media_{m}"] = (partials[f"sum_{m}"] / partials["n_ects"].where(partials["n_ects"] > 0)).round(1)
+    return out.reset_index().sort_values("n", ascending=False, kind="stable").reset_index(drop=True)
+
+
+# ─── Storage ──────────────────────────────────────────────────────────────────
+
+def _write_csv(df: pd.DataFrame, path: str, **kwargs) -> None:
+    tmp = f"{path}.tmp"
+    df.to_csv(tmp, **kwargs)
+    os.replace(tmp, path)
+
+
+def _read_partials(path: str, by: list[str]) -> pd.DataFrame | None:
+    if not os.path.exists(path):
+        return None
+    df = pd.read_csv(path, dtype={c: str for c in by}, keep_default_na=False)
+    return df.set_index(by)
+
+
+def load_manifest(out_dir: str = AGGREGATES_DIR) -> dict:
+    try:
+        with open(os.path.join(out_dir, _MANIFEST_FILE), encoding="utf-8") as fh:
+            return json.load(fh)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def load_view(name: str, out_dir: str = AGGREGATES_DIR) -> pd.DataFrame:
+    """Read one precomputed display table (empty frame if it has not been built)."""
+    path = os.path.join(out_dir, f"{name}.csv")
+    if not os.path.exists(path):
+        return pd.DataFrame()
+    by, _ = AGGREGATES[name]
+    return pd.read_csv(path, dtype={c: str for c in by}, keep_default_na=False)
+
+
+# ─── Refresh ──────────────────────────────────────────────────────────────────
+
+def refresh_aggregates(
+    snapshot_path: str = SNAPSHOT_PATH,
+    out_dir: str = AGGREGATES_DIR,
+    full: bool = False,
+) -> dict:
+    """
+    Bring the aggregate tables up to date with the snapshot.
+
+    Rows are diffed by codigo and row hash against the rows used by the last
+    refresh; only the delta is regrouped. Returns a summary dict
+    {added, removed, changed, full, seconds}; a no-op if the snapshot is unchanged.
+    """
+    t0 = time.time()
+    manifest = load_manifest(out_dir)
+    version = snapshot_version(snapshot_path)
+    rows_path = os.path.join(out_dir, _ROWS_FILE)
+    if not full and version and manifest.get("source_version") == version:
+        return {"added": 0, "removed": 0, "changed": 0, "full": False, "seconds": 0.0}
+
+    new_rows = _contributing_rows(load_snapshot(snapshot_path))
+    old_rows = None
+    if not full and manifest and os.path.exists(rows_path):
+        old_rows = pd.read_csv(rows_path, dtype={c: str for c in ["codigo", "_hash"] + _GROUP_COLS},
+                               keep_default_na=False)
+        # A schema change (new view, new metric) invalidates the stored partials
+        if manifest.get("aggregates") != sorted(AGGREGATES) or set(old_rows.columns) != set(new_rows.columns):
+            old_rows = None
+    full = old_rows is None
+
+    if full:
+        removed = new_rows.iloc[:0]
+        added = new_rows
+        n_changed = 0
+    else:
+        old_hash = old_rows.set_index("codigo")["_hash"]
+        new_hash = new_rows.set_index("codigo")["_hash"]
+        gone = old_hash.index.difference(new_hash.index)
+        fresh = new_hash.index.difference(old_hash.index)
+        common = old_hash.index.intersection(new_hash.index)
+        changed = common[old_hash.loc[common].to_numpy() != new_hash.loc[common].to_numpy()]
+        removed = old_rows[old_rows["codigo"].isin(gone.union(changed))]
+        added = new_rows[new_rows["codigo"].isin(fresh.union(changed))]
+        n_changed = len(changed)
+
+    os.makedirs(out_dir, exist_ok=True)
+    for name, (by, metrics) in AGGREGATES.items():
+        part_path = os.path.join(out_dir, f"{name}.partial.csv")
+        base = None if full else _read_partials(part_path, by)
+        delta_add = _partials(added, by, metrics)
+        if base is None:
+            merged = delta_add
+        else:
+            merged = base.sub(_partials(removed, by, metrics), fill_value=0).add(delta_add, fill_value=0)
+        merged = merged[merged["n"] > 0]
+        _write_csv(merged, part_path)
+        _write_csv(_view(merged, metrics), os.path.join(out_dir, f"{name}.csv"), index=False)
+
+    _write_csv(new_rows, rows_path, index=False, compression="gzip")
+    with open(os.path.join(out_dir, f"{_MANIFEST_FILE}.tmp"), "w", encoding="utf-8") as fh:
+        json.dump({
+            "source_version": version,
+            "aggregates": sorted(AGGREGATES),
+            "rows": len(new_rows),
+            "refreshed_at": time.time(),
+        }, fh)
+    os.replace(os.path.join(out_dir, f"{_MANIFEST_FILE}.tmp"), os.path.join(out_dir, _MANIFEST_FILE))
+
+    return {
+        "added": len(added) - n_changed,
+        "removed": len(removed) - n_changed,
+        "changed": n_changed,
+        "full": full,
+        "seconds": round(time.time() - t0, 3),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Tablas agregadas del catálogo para la vista de estadísticas.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_ref = sub.add_parser("refresh", help="Actualizar las tablas con la instantánea actual")
+    p_ref.add_argument("--full", action="store_true", help="Recalcular desde cero")
+    args = parser.parse_args()
+
+    summary = refresh_aggregates(full=args.full)
+    print(f"{'Completo' if summary['full'] else 'Incremental'}: +{summary['added']} "
+          f"-{summary['removed']} ~{summary['changed']} en {summary['seconds']} s")
@@ -0,0 +1,330 @@
+"""
+api_server.py
+Headless JSON API over the RUCT search, the degree fichas, the study plans and
+their ECTS breakdown, sharing the on-disk caches with the Streamlit app. Stale
+entries are served and refreshed in the background (see resilience.py).
+
+Runs on the standard-library ThreadingHTTPServer (one thread per connection,
+HTTP/1.1 keep-alive), with page/per_page pagination and ETag revalidation.
+
+    python api_server.py serve --port 8765
+    python api_server.py bench "http://127.0.0.1:8765/ficha/2502090" -c 32 -d 10
+
+Endpoints (GET):
+    /search?q=&tipo=G&universidad=&rama=&estado=P&situacion=A&page=1&per_page=50
+    /ficha/<codigo>
+    /plan/<codigo>?page=1&per_page=200&texto=1
+    /ects/<codigo>
+    /suggest?q=informat&n=10
+    /health
+"""
+
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import autocomplete
+import comparator
+from cache_store import get_store
+from records import to_jsonable
+from ruct_scraper import BASE_URL, search_ruct_cached
+from session_store import memory_report
+from study_plan import get_study_plan
+from subject_index import plan_subjects
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PER_PAGE = 50
+MAX_PER_PAGE = 500
+
+_CODIGO_RE = re.compile(r"^\d{5,8}$")
+
+
+class ApiError(Exception):
+    """Error returned to the client as {"error": message} with an HTTP status."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+# ─── Data access ──────────────────────────────────────────────────────────────
+
+def _int_param(params: dict, name: str, default: int, lo: int = 1, hi: int | None = None) -> int:
+    raw = params.get(name, [""])[0]
+    if not raw:
+        return default
+    try:
+        value = int(raw)
+    except ValueError:
+        raise ApiError(400, f"'{name}' debe ser un número entero")
+    return max(lo, min(value, hi)) if hi else max(lo, value)
+
+
+def _paginate(items: list, params: dict, default_per_page: int = DEFAULT_PER_PAGE) -> dict:
+    per_page = _int_param(params, "per_page", default_per_page, hi=MAX_PER_PAGE)
+    page = _int_param(params, "page", 1)
+    pages = max(1, -(-len(items) // per_page))
+    start = (page - 1) * per_page
+    return {
+        "total": len(items),
+        "page": page,
+        "per_page": per_page,
+        "pages": pages,
+        "results": items[start:start + per_page],
+    }
+
+
+def _search_params(params: dict) -> dict:
+    """search_ruct filters from the query string (normalized again by the cache key)."""
+    def p(name, default=""):
+        return params.get(name, [default])[0].strip()
+
+    query = {
+        "descripcion": p("q"),
+        "universidad": p("universidad"),
+        "tipo": p("tipo", "G"),
+        "rama": p("rama"),
+        "estado": p("estado", "P"),
+        "situacion": p("situacion", "A"),
+    }
+    if not query["descripcion"] and not query["universidad"]:
+        raise ApiError(400, "Indica al menos 'q' o 'universidad'")
+    return query
+
+
+def search(params: dict) -> dict:
+    """Search the RUCT through the shared search cache and return one page of rows."""
+    df, warn, stale = search_ruct_cached(**_search_params(params), timeout=30, max_paginas=200)
+    return {**_paginate(df.to_dict("records"), params), "warning": warn, "stale": stale}
+
+
+def _degree_ref(codigo: str) -> dict:
+    """codigo + RUCT URLs for a degree, from the plan cache or built from the codigo."""
+    if not _CODIGO_RE.match(codigo):
+        raise ApiError(400, "Código RUCT no válido")
+    plan = get_store().get("plan", codigo) or {}
+    return {
+        "codigo": codigo,
+        "title": plan.get("titulo", ""),
+        "university": plan.get("universidad", ""),
+        "url_ruct": plan.get("url_ruct") or f"{BASE_URL}/estudio.action?codigoEstudio={codigo}&actual=estudios",
+        "url_plan": plan.get("url_plan") or f"{BASE_URL}/detalles.action?codigoEstudio={codigo}&actual=detallesbasicos",
+    }
+
+
+def ficha(codigo: str) -> dict:
+    """Degree metadata and credit distribution (quick ficha, cached by codigo)."""
+    result = comparator.fetch_fichas([_degree_ref(codigo)], workers=1)[0]
+    if not result or not (result.get("denominacion") or result.get("nivel")):
+        raise ApiError(502, "No se pudo obtener la ficha del RUCT")
+    return {"codigo": codigo, **result}
+
+
+def plan(codigo: str, params: dict) -> dict:
+    """Study plan subjects (paginated); the BOE text only with texto=1."""
+    ref = _degree_ref(codigo)
+    got = get_study_plan(codigo, ref["title"], ref["university"], ref["url_ruct"], ref["url_plan"])
+    if got.stored_at is None:
+        raise ApiError(502, "No se pudo obtener el plan de estudios")
+    data = got.value
+    subjects = plan_subjects(data)
+    out = {
+        "codigo": codigo,
+        "denominacion": data.get("ficha", {}).get("denominacion", ""),
+        "source_url": data.get("source_url", ""),
+        "fuente": "boe" if data.get("subjects_boe") else "ruct",
+        "stale": got.stale,
+        **_paginate(subjects, params, default_per_page=MAX_PER_PAGE),
+    }
+    if params.get("texto", ["0"])[0] == "1":
+        out["texto"] = data.get("page_text", "")
+    return out
+
+
+def ects(codigo: str) -> dict:
+    """ECTS per category, with the share of the total."""
+    f = ficha(codigo)
+    m = comparator.ects_matrix([f])[0]
+    total = float(m.sum())
+    return {
+        "codigo": codigo,
+        "denominacion": f.get("denominacion", ""),
+        "total": total,
+        "categorias": {
+            cat: {"ects": float(v), "porcentaje": round(100 * v / total, 1) if total else 0.0}
+            for cat, v in zip(comparator.ECTS_CATS, m)
+        },
+    }
+
+
+def suggest(params: dict) -> dict:
+    """Degree names of the catalogue starting with q (or with a word starting with q)."""
+    n = _int_param(params, "n", 10, hi=100)
+    return {"sugerencias": autocomplete.current().suggest(params.get("q", [""])[0], n)}
+
+
+# ─── HTTP layer ───────────────────────────────────────────────────────────────
+
+class ApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"     # keep-alive: clients reuse connections
+    server_version = "ECU-API/1.0"
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = parse_qs(url.query)
+        parts = [p for p in url.path.split("/") if p]
+        try:
+            if parts == ["health"]:
+                body, status = {
+                    "ok": True,
+                    "uptime": round(time.time() - self.server.started_at, 1),
+                    "memory": memory_report(),
+                }, 200
+            elif parts == ["search"]:
+                body, status = search(params), 200
+            elif parts == ["suggest"]:
+                body, status = suggest(params), 200
+            elif len(parts) == 2 and parts[0] == "ficha":
+                body, status = ficha(parts[1]), 200
+            elif len(parts) == 2 and parts[0] == "plan":
+                body, status = plan(parts[1], params), 200
+            elif len(parts) == 2 and parts[0] == "ects":
+                body, status = ects(parts[1]), 200
+            else:
+                raise ApiError(404, "Ruta no encontrada")
+        except ApiError as e:
+            body, status = {"error": str(e)}, e.status
+        except Exception:
+            logger.exception("Error handling %s", self.path)
+            body, status = {"error": "Error interno"}, 500
+        self._send_json(status, body)
+
+    def _send_json(self, status: int, body: dict) -> None:
+        payload = json.dumps(body, ensure_ascii=False, separators=(",", ":"),
+                             default=to_jsonable).encode("utf-8")
+        etag = f'"{hashlib.blake2b(payload, digest_size=12).hexdigest()}"'
+        if status == 200 and etag in self.headers.get("If-None-Match", ""):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        if status == 200:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "public, max-age=60")
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, fmt, *args):
+        logger.debug("%s - %s", self.address_string(), fmt % args)
+
+
+def make_server(host: str = "127.0.0.1", port: int = 8765) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), ApiHandler)
+    server.daemon_threads = True
+    server.started_at = time.time()
+    return server
+
+
+# ─── Load test ────────────────────────────────────────────────────────────────
+
+def bench(url: str, concurrency: int = 32, duration: float = 10.0, revalidate: bool = False) -> dict:
+    """
+    Hammer one URL from `concurrency` keep-alive connections for `duration` seconds.
+    With revalidate=True every request sends the last ETag (measures the 304 path).
+    Returns {requests, rps, p50_ms, p95_ms, p99_ms, status}.
+    """
+    import http.client
+
+    target = urlsplit(url)
+    path = target.path + (f"?{target.query}" if target.query else "")
+    deadline = time.perf_counter() + duration
+    latencies: list[float] = []
+    status: dict[int, int] = {}
+    lock = threading.Lock()
+
+    def worker():
+        conn = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=60)
+        etag = None
+        local_lat, local_status = [], {}
+        while time.perf_counter() < deadline:
+            headers = {"If-None-Match": etag} if revalidate and etag else {}
+            t0 = time.perf_counter()
+            try:
+                conn.request("GET", path, headers=headers)
+                resp = conn.getresponse()
+                resp.read()
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=60)
+                local_status[0] = local_status.get(0, 0) + 1
+                continue
+            local_lat.append(time.perf_counter() - t0)
+            local_status[resp.status] = local_status.get(resp.status, 0) + 1
+            etag = resp.getheader("ETag") or etag
+        conn.close()
+        with lock:
+            latencies.extend(local_lat)
+            for k, v in local_status.items():
+                status[k] = status.get(k, 0) + v
+
+    t_start = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t_start
+
+    latencies.sort()
+
+    def pct(q):
+        return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000, 2) if latencies else 0.0
+
+    return {
+        "requests": len(latencies),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": pct(0.50), "p95_ms": pct(0.95), "p99_ms": pct(0.99),
+        "status": status,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="API JSON del buscador de titulaciones (RUCT).")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_serve = sub.add_parser("serve", help="Arrancar el servidor")
+    p_serve.add_argument("--host", default="127.0.0.1")
+    p_serve.add_argument("--port", type=int, default=8765)
+    p_bench = sub.add_parser("bench", help="Prueba de carga contra una URL del servidor")
+    p_bench.add_argument("url")
+    p_bench.add_argument("-c", "--concurrency", type=int, default=32)
+    p_bench.add_argument("-d", "--duration", type=float, default=10.0)
+    p_bench.add_argument("--revalidate", action="store_true", help="Enviar If-None-Match (respuestas 304)")
+    args = parser.parse_args()
+
+    if args.cmd == "serve":
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+        httpd = make_server(args.host, args.port)
+        logger.info(f"API escuchando en http://{args.host}:{args.port}")
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            httpd.server_close()
+    else:
+        result = bench(args.url, args.concurrency, args.duration, args.revalidate)
+        print(f"{result['requests']} peticiones · {result['rps']} req/s · "
+              f"p50 {result['p50_ms']} ms · p95 {result['p95_ms']} ms · p99 {result['p99_ms']} ms")
+        print(f"Códigos de estado: {result['status']}")
@@ -2,13 +2,36 @@ import streamlit as st
 import pandas as pd
 import logging
 import re
-import requests
-from bs4 import BeautifulSoup
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 import ruct_scraper
-from ruct_scraper import _clean_text  # used throughout app.py
+from study_plan import (
+    _PLAN_VERSION,
+    _codigo_from_url,
+    _fetch_ruct_ficha_quick,
+    get_study_plan,
+)
+import subject_index
+from subject_index import SubjectIndex
+import similarity
+from similarity import SimilarityIndex
+from ranked_search import RankedIndex
+from autocomplete import Autocomplete
+from facets import FACETS, FacetIndex
+import comparator
+from session_store import deref, memory_report, session_lru, share
+import resilience
+import analytics
+import catalogue
+import profiling
+import warmup
+import refresher
 
 logging.basicConfig(level=logging.WARNING)
 
+# Opt-in profiling of this rerun (ECU_PROFILE=rerun|all); finished at the bottom
+profiling.start_rerun(st.session_state)
+
 # ─── Page configuration ───────────────────────────────────────────────────────
 st.set_page_config(
     page_title="Buscador de Carreras Universitarias Oficiales en España",
@@ -381,10 +404,14 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
-# ─── Load options (cached for 1 hour) ────────────────────────────────────────
+# ─── Load options (refreshed in the background by refresher.py) ──────────────
 @st.cache_data(ttl=3600, show_spinner="Conectando con el RUCT...")
+def _cached_options(version: str):
+    return refresher.load_options()
+
+
 def _load_options():
-    return ruct_scraper.load_form_options(timeout=20)
+    return _cached_options(refresher.options_version())
 
 
 def _prepare_options(items: list) -> tuple:
@@ -394,1369 +421,150 @@ def _prepare_options(items: list) -> tuple:
     return display, values
 
 
-# ─── Study plan scraper ───────────────────────────────────────────────────────
-_WEB_HEADERS = {
-    "User-Agent": (
-        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-        "AppleWebKit/537.36 (KHTML, like Gecko) "
-        "Chrome/120.0.0.0 Safari/537.36"
-    )
-}
-
-_RUCT_INIT_URL = "https://www.educacion.gob.es/ruct/consultaestudios.action"
-_RUCT_MODULES_URL = (
-    "https://www.educacion.gob.es/ruct/solicitud/datosModulo"
-    "?actual=menu.solicitud.planificacion.materiasSin&codModulo=0"
-)
-
-
-def _boe_pdf_to_html(pdf_url: str) -> str:
-    """Convert a BOE PDF URL to its HTML equivalent (txt.php).
-    e.g. .../pdfs/BOE-A-2013-7517.pdf -> https://www.boe.es/diario_boe/txt.php?id=BOE-A-2013-7517
-    """
-    m = re.search(r"(BOE-[A-Z]-\d{4}-\d+)\.pdf", pdf_url)
-    return f"https://www.boe.es/diario_boe/txt.php?id={m.group(1)}" if m else ""
+# ─── Shared caches ────────────────────────────────────────────────────────────
+@st.cache_resource(show_spinner=False)
+def _start_warmer():
+    """Scheduled cache warming of the most requested items (one per host)."""
+    try:
+        return warmup.start_background()
+    except Exception as e:
+        logging.getLogger(__name__).warning(f"Cache warmer not started: {e}")
+        return None
 
 
-def _fetch_ruct_ficha(url_ruct: str, url_plan: str) -> dict:
-    """
-    Fetch full degree metadata from RUCT and the BOE study plan URL.
+_start_warmer()
 
-    Session flow:
-      1. GET consultaestudios.action    — init session
-      2. GET url_plan (detalles.action) — datos basicos: denominacion, profesion regulada,
-                                         norma, menciones/especialidades
-      3. GET url_ruct (estudio.action)  — nivel, MECES, rama, campo, centro, CCAA, BOE URL
 
-    Returns a dict with all available fields (empty string/list when not found).
-    """
-    ficha = {
-        "denominacion": "", "universidad": "", "centro": "", "ccaa": "",
-        "nivel": "", "meces": "", "rama": "", "campo": "",
-        "habilita": "", "profesion_regulada": "", "acuerdo": "", "norma": "",
-        "menciones": [], "especialidades": [], "boe_plan_url": "",
-    }
-    if not url_ruct:
-        return ficha
-    # If url_plan is missing, try to construct it from the codigoEstudio in url_ruct
-    if not url_plan:
-        m = re.search(r"codigoEstudio=(\d+)", url_ruct)
-        if m:
-            cod = m.group(1)
-            url_plan = (
-                f"https://www.educacion.gob.es/ruct/detalles.action"
-                f"?codigoEstudio={cod}&actual=detallesbasicos"
-            )
+@st.cache_resource(show_spinner=False)
+def _start_refresher():
+    """Periodic refresh of options, snapshot and aggregates (ECU_REFRESH=off when run as a daemon)."""
     try:
-        session = requests.Session()
-        session.headers.update(_WEB_HEADERS)
-        session.get(_RUCT_INIT_URL, timeout=15)
-
-        # Step 2: detalles.action — datos basicos
-        r_det = session.get(url_plan, timeout=15)
-        if r_det.status_code < 400:
-            soup_det = BeautifulSoup(r_det.text, "lxml")
-
-            def _inp(name):
-                el = soup_det.find("input", {"name": name})
-                return el["value"].strip() if el and el.get("value") else ""
-
-            ficha["denominacion"] = _inp("denominacion")
-            ficha["habilita"] = _inp("habilita")
-            ficha["profesion_regulada"] = _inp("codigoProfesionRegulada")
-
-            for for_val, key in [("acuerdo", "acuerdo"), ("norma", "norma")]:
-                lbl = soup_det.find("label", {"for": for_val})
-                if lbl:
-                    a = lbl.find("a")
-                    if a:
-                        ficha[key] = a.get_text(strip=True)
-
-            for fs in soup_det.find_all("fieldset"):
-                leg = fs.find("legend")
-                if not leg:
-                    continue
-                leg_text = leg.get_text(strip=True).lower()
-                tbl = fs.find("table")
-                if not tbl:
-                    continue
-                items = []
-                for tr in tbl.find_all("tr")[1:]:
-                    cells = tr.find_all("td")
-                    if len(cells) >= 2:
-                        nombre = cells[1].get_text(strip=True)
-                        cred = cells[2].get_text(strip=True) if len(cells) > 2 else ""
-                        if nombre:
-                            items.append({"nombre": nombre, "creditos": cred})
-                if "menci" in leg_text:
-                    ficha["menciones"] = items
-                elif "especialidad" in leg_text:
-                    ficha["especialidades"] = items
-
-        # Step 2b: fetch subject list (datosModulo) + details (datosMateria)
-        try:
-            # Navigate to materiasSin context before datosModulo
-            if url_plan:
-                nav_url = re.sub(r"actual=[^&]*", "actual=menu.solicitud.planificacion.materiasSin", url_plan)
-                session.get(nav_url, timeout=15)
-            r_mod = session.get(_RUCT_MODULES_URL, timeout=15)
-            if r_mod.status_code == 200:
-                soup_mod = BeautifulSoup(r_mod.text, "lxml")
-                mod_table = soup_mod.find("table")
-                if mod_table:
-                    import urllib.parse as _uparse
-                    # Each entry: (absolute_url, codModulo, codMateria)
-                    subject_triples = []
-                    top_ids = []
-                    rows = mod_table.find_all("tr")[1:]
-                    for tr in rows:
-                        cells = tr.find_all("td")
-                        if not cells:
-                            continue
-                        found = False
-                        for td in cells:
-                            a = td.find("a", href=True)
-                            if a and "datosMateria" in a["href"]:
-                                href = a["href"]
-                                if href.startswith("http"):
-                                    abs_url = href
-                                elif href.startswith("/"):
-                                    abs_url = f"https://www.educacion.gob.es{href}"
-                                else:
-                                    abs_url = f"https://www.educacion.gob.es/ruct/solicitud/{href}"
-                                qs = _uparse.parse_qs(_uparse.urlparse(abs_url).query)
-                                cm = qs.get("codMateria", [""])[0]
-                                mo = qs.get("codModulo", ["0"])[0]
-                                if cm.isdigit():
-                                    subject_triples.append((abs_url, mo, cm))
-                                    found = True
-                                break
-                        if not found:
-                            sid = cells[0].get_text(strip=True)
-                            if sid.isdigit():
-                                top_ids.append(sid)
-
-                    # Fallback when no hrefs found in table
-                    if not subject_triples:
-                        if len(top_ids) > 10:
-                            for sid in top_ids:
-                                url_fb = (
-                                    "https://www.educacion.gob.es/ruct/solicitud/"
-                                    f"datosMateria!consulta.action?codModulo=0&codMateria={sid}"
-                                    "&actual=menu.solicitud.planificacion.materias.datos"
-                                )
-                                subject_triples.append((url_fb, "0", sid))
-                        else:
-                            for mod_id in top_ids:
-                                sub_url = (
-                                    "https://www.educacion.gob.es/ruct/solicitud/datosModulo"
-                                    f"?actual=menu.solicitud.planificacion.materiasSin&codModulo={mod_id}"
-                                )
-                                r_sub = session.get(sub_url, timeout=15)
-                                if r_sub.status_code == 200:
-                                    soup_sub = BeautifulSoup(r_sub.text, "lxml")
-                                    sub_table = soup_sub.find("table")
-                                    if sub_table:
-                                        for tr2 in sub_table.find_all("tr")[1:]:
-                                            cells2 = tr2.find_all("td")
-                                            if cells2:
-                                                sid2 = cells2[0].get_text(strip=True)
-                                                if sid2.isdigit():
-                                                    url_fb = (
-                                                        "https://www.educacion.gob.es/ruct/solicitud/"
-                                                        f"datosMateria!consulta.action?codModulo={mod_id}&codMateria={sid2}"
-                                                        "&actual=menu.solicitud.planificacion.materias.datos"
-                                                    )
-                                                    subject_triples.append((url_fb, mod_id, sid2))
-                            if not subject_triples:
-                                for sid in top_ids:
-                                    url_fb = (
-                                        "https://www.educacion.gob.es/ruct/solicitud/"
-                                        f"datosMateria!consulta.action?codModulo=0&codMateria={sid}"
-                                        "&actual=menu.solicitud.planificacion.materias.datos"
-                                    )
-                                    subject_triples.append((url_fb, "0", sid))
-
-                    def _fetch_subject(mat_url):
-                        rr = session.get(mat_url, timeout=10)
-                        if rr.status_code != 200:
-                            return None
-                        sp = BeautifulSoup(rr.text, "lxml")
-                        el = sp.find("input", {"name": "descripcion"})
-                        nom = _clean_text(el.get("value", "")) if el else ""
-                        if not nom:
-                            return None
-                        el = sp.find("input", {"name": "datosBasicos.caracter.codigo"})
-                        car = _clean_text(el.get("value", "")) if el else ""
-                        el = sp.find("input", {"name": "datosBasicos.ectsMateria"})
-                        ects_val = 0.0
-                        if el:
-                            try:
-                                ects_val = float(el.get("value", "0").replace(",", "."))
-                            except ValueError:
-                                pass
-                        sem_num = 0
-                        periodos = [inp.get("value", "") for inp in sp.find_all("input", {"name": "periodo"})]
-                        ects_pp  = [inp.get("value", "") for inp in sp.find_all("input", {"name": "ects"})]
-                        for p_str, e_str in zip(periodos, ects_pp):
-                            try:
-                                if float(e_str.replace(",", ".")) > 0:
-                                    sem_num = int(p_str)
-                                    break
-                            except (ValueError, TypeError):
-                                pass
-                        curso    = f"{(sem_num + 1) // 2}º" if sem_num > 0 else ""
-                        semestre = f"S{sem_num}" if sem_num > 0 else ""
-                        cat = _categorize_ects(car) or "otros"
-                        return {
-                            "nombre": nom, "caracter": car, "categoria": cat,
-                            "ects": ects_val, "curso": curso, "semestre": semestre,
-                        }
+        return refresher.start_in_process()
+    except Exception as e:
+        logging.getLogger(__name__).warning(f"Refresher not started: {e}")
+        return None
 
-                    _subjects = []
-                    for mat_url, mo, cm in subject_triples:
-                        try:
-                            result = _fetch_subject(mat_url)
-                            if result:
-                                _subjects.append(result)
-                        except Exception:
-                            continue
 
-                    if _subjects:
-                        ficha["modules"] = _subjects
-        except Exception:
-            pass
-
-        # Step 3: estudio.action — nivel, MECES, rama, campo, centro, CCAA, BOE URL
-        r_est = session.get(url_ruct, timeout=15)
-        r_est.raise_for_status()
-        soup_est = BeautifulSoup(r_est.text, "lxml")
-
-        def _sid(span_id):
-            el = soup_est.find(id=span_id)
-            return el.get_text(strip=True) if el else ""
-
-        nivel_raw = _sid("estudio_descripcionTipo")
-        meces = _sid("estudio_nivelMeces")
-        nivel_clean = nivel_raw.split(" - ")[0].strip() if " - " in nivel_raw else nivel_raw
-        ficha["nivel"] = nivel_clean
-        ficha["meces"] = meces
-        ficha["rama"] = _sid("estudio_descripcionRama")
-        ficha["campo"] = _sid("estudio_descripcionAmbito")
-
-        # Extract ECTS credit distribution by type
-        _ects_labels = [
-            ("estudio_creditos_fbasic",  "Formación Básica",           "basica"),
-            ("estudio_creditos_obl",     "Obligatorios",                "obligatoria"),
-            ("estudio_creditos_opt",     "Optativos",                   "optativa"),
-            ("estudio_creditos_pracext", "Prácticas Externas",          "practicas"),
-            ("estudio_creditos_trbfin",  "Trabajo Fin de Grado/Máster", "tfg_tfm"),
-        ]
-        creditos = {}
-        for lbl_for, nombre, cat in _ects_labels:
-            el = soup_est.find("label", {"for": lbl_for})
-            if el:
-                txt = el.get_text(strip=True)
-                idx = txt.rfind(":")
-                if idx >= 0:
-                    try:
-                        creditos[cat] = {"nombre": nombre, "ects": float(txt[idx+1:].strip().replace(",", "."))}
-                    except ValueError:
-                        pass
-        if creditos:
-            ficha["creditos"] = creditos
-
-        tthree = soup_est.find("div", id="tthree")
-        if tthree:
-            tbl = tthree.find("table", id="centro")
-            if tbl:
-                rows = tbl.find_all("tr")[1:]
-                if rows:
-                    cells = rows[0].find_all("td")
-                    if len(cells) >= 3:
-                        ficha["universidad"] = cells[0].get_text(strip=True)
-                        ficha["centro"] = cells[2].get_text(strip=True)
-
-        ttwo = soup_est.find("div", id="ttwo")
-        if ttwo:
-            ccaa_tbl = ttwo.find("table", id="ccaa")
-            if ccaa_tbl:
-                rows = ccaa_tbl.find_all("tr")[1:]
-                if rows:
-                    cells = rows[0].find_all("td")
-                    if len(cells) >= 3:
-                        ficha["ccaa"] = cells[2].get_text(strip=True)
-            plan_label = ttwo.find("label", {"for": "f_plan"})
-            if plan_label:
-                a = plan_label.find("a", href=True)
-                if a:
-                    ficha["boe_plan_url"] = _boe_pdf_to_html(a["href"])
-            if not ficha["boe_plan_url"]:
-                for label in ttwo.find_all("label"):
-                    if "Plan Estudios" in label.get_text():
-                        a = label.find("a", href=True)
-                        if a and "boe.es" in a["href"] and ".pdf" in a["href"]:
-                            ficha["boe_plan_url"] = _boe_pdf_to_html(a["href"])
-                            break
-    except Exception:
-        pass
-    return ficha
+_start_refresher()
 
 
-def _fetch_ruct_ficha_quick(url_ruct: str, url_plan: str = "") -> dict:
-    """
-    Lightweight version of _fetch_ruct_ficha that skips subject fetching (step 2b).
-    Only retrieves metadata + ECTS credit distribution. Used for the comparator.
-    """
-    ficha: dict = {"boe_plan_url": ""}
-    if not url_plan and url_ruct:
-        m = re.search(r"codigoEstudio=(\d+)", url_ruct)
-        if m:
-            url_plan = (
-                f"https://www.educacion.gob.es/ruct/detalles.action"
-                f"?codigoEstudio={m.group(1)}&actual=detallesbasicos"
-            )
+def _journal_plan(codigo: str, plan: dict, title: str, university: str) -> None:
+    """Journal a cached plan the subject index does not have yet (e.g. stored before the journal)."""
     try:
-        session = requests.Session()
-        session.headers.update(_WEB_HEADERS)
-        session.get(_RUCT_INIT_URL, timeout=15)
-        r_det = session.get(url_plan, timeout=15)
-        if r_det.status_code < 400:
-            soup_det = BeautifulSoup(r_det.text, "lxml")
-            def _inp(name):
-                el = soup_det.find("input", {"name": name})
-                return el["value"].strip() if el and el.get("value") else ""
-            ficha["denominacion"] = _inp("denominacion")
-            ficha["habilita"] = _inp("habilita")
-            ficha["profesion_regulada"] = _inp("codigoProfesionRegulada")
-        r_est = session.get(url_ruct, timeout=15)
-        r_est.raise_for_status()
-        soup_est = BeautifulSoup(r_est.text, "lxml")
-        def _sid(span_id):
-            el = soup_est.find(id=span_id)
-            return el.get_text(strip=True) if el else ""
-        nivel_raw = _sid("estudio_descripcionTipo")
-        ficha["nivel"] = nivel_raw.split(" - ")[0].strip() if " - " in nivel_raw else nivel_raw
-        ficha["meces"] = _sid("estudio_nivelMeces")
-        ficha["rama"] = _sid("estudio_descripcionRama")
-        ficha["campo"] = _sid("estudio_descripcionAmbito")
-        _ects_labels = [
-            ("estudio_creditos_fbasic",  "Formación Básica",           "basica"),
-            ("estudio_creditos_obl",     "Obligatorios",                "obligatoria"),
-            ("estudio_creditos_opt",     "Optativos",                   "optativa"),
-            ("estudio_creditos_pracext", "Prácticas Externas",          "practicas"),
-            ("estudio_creditos_trbfin",  "Trabajo Fin de Grado/Máster", "tfg_tfm"),
-        ]
-        creditos = {}
-        for lbl_for, nombre, cat in _ects_labels:
-            el = soup_est.find("label", {"for": lbl_for})
-            if el:
-                txt = el.get_text(strip=True)
-                idx = txt.rfind(":")
-                if idx >= 0:
-                    try:
-                        creditos[cat] = {"nombre": nombre, "ects": float(txt[idx+1:].strip().replace(",", "."))}
-                    except ValueError:
-                        pass
-        if creditos:
-            ficha["creditos"] = creditos
-        tthree = soup_est.find("div", id="tthree")
-        if tthree:
-            tbl = tthree.find("table", id="centro")
-            if tbl:
-                rows = tbl.find_all("tr")[1:]
-                if rows:
-                    cells = rows[0].find_all("td")
-                    if len(cells) >= 3:
-                        ficha["universidad"] = cells[0].get_text(strip=True)
-                        ficha["centro"] = cells[2].get_text(strip=True)
-        ttwo = soup_est.find("div", id="ttwo")
-        if ttwo:
-            ccaa_tbl = ttwo.find("table", id="ccaa")
-            if ccaa_tbl:
-                rows = ccaa_tbl.find_all("tr")[1:]
-                if rows:
-                    cells = rows[0].find_all("td")
-                    if len(cells) >= 3:
-                        ficha["ccaa"] = cells[2].get_text(strip=True)
+        subject_index.record_plan(codigo, plan, title, university)
     except Exception:
-        pass
-    return ficha
+        logging.getLogger(__name__).warning("Could not index plan %s", codigo, exc_info=True)
 
 
-def _html_table_to_md(table) -> str:
-    """Convert a BS4 table tag to a Markdown table string."""
-    rows = []
-    for i, tr in enumerate(table.find_all("tr")):
-        cells = [td.get_text(separator=" ", strip=True) for td in tr.find_all(["th", "td"])]
-        if not cells:
-            continue
-        rows.append("| " + " | ".join(cells) + " |")
-        if i == 0:
-            rows.append("|" + "|".join([" --- "] * len(cells)) + "|")
-    return "\n".join(rows)
+def _share_fichas(degrees: list[dict], fichas: list) -> list:
+    """Session entries for fichas: SharedRefs by codigo; only fichas without one stay inline."""
+    return [share("ficha", d["codigo"], f) if f and d.get("codigo") else (f or {})
+            for d, f in zip(degrees, fichas)]
 
 
-def _detect_header_cols(cells_text: list[str]):
-    """Return (nom_col, car_col, ects_col, cur_col, sem_col) from a list of header cell texts.
+def _resolve_fichas(degrees: list[dict], entries: list) -> list[dict]:
+    """Fichas behind _share_fichas entries; the ones gone from both caches are fetched again."""
+    fichas = [deref(e) for e in entries]
+    missing = [i for i, f in enumerate(fichas) if f is None]
+    if missing:
+        again = comparator.fetch_fichas([degrees[i] for i in missing], _fetch_ruct_ficha_quick)
+        for i, f in zip(missing, again):
+            fichas[i] = f or {}
+    return fichas
 
-    Prioritises 'asignatura' / 'denominaci' over broader terms like 'módulo' / 'materia'
-    so that tables with [Módulo, Materia, Asignatura, ECTS, Carácter] headers correctly
-    use the 'Asignatura' column as the subject name (enabling rowspan offset to work).
-    """
-    nom_col = car_col = ects_col = cur_col = sem_col = None
-    specific_nom_col = None   # asignatura / denominacion — highest priority
-
-    for idx, h in enumerate(cells_text):
-        hl = h.lower()
-        if any(k in hl for k in ["asignatura", "denominaci"]):
-            if specific_nom_col is None:
-                specific_nom_col = idx
-        elif any(k in hl for k in ["nombre", "materia"]):
-            # Exclude "tipo de materia", "carácter de materia", etc. — those are type columns
-            if nom_col is None and not any(excl in hl for excl in ["tipo", "carácter", "caracter"]):
-                nom_col = idx
-        elif any(k in hl for k in ["módulo", "modulo"]):
-            # "módulo" is last resort: it names groups, not individual subjects
-            if nom_col is None:
-                nom_col = idx
-        elif any(k in hl for k in ["carácter", "caracter", "tipo", "naturaleza"]):
-            car_col = idx
-        elif any(k in hl for k in ["ects", "crédito", "credito"]):
-            if ects_col is None:
-                ects_col = idx
-        elif "curso" in hl and "recursos" not in hl:
-            cur_col = idx
-        elif any(k in hl for k in ["semestre", "período", "periodo", "cuatr"]):
-            sem_col = idx
-
-    # Prefer specific match ('asignatura'/'denominaci') over generic ('módulo'/'materia')
-    if specific_nom_col is not None:
-        nom_col = specific_nom_col
-
-    return nom_col, car_col, ects_col, cur_col, sem_col
-
-
-def _adj_col(col, n_header, n_cells):
-    """Adjust a column index for rows with fewer cells than the header (due to rowspan)."""
-    if col is None:
-        return None
-    adjusted = col - max(0, n_header - n_cells)
-    return adjusted if 0 <= adjusted < n_cells else None
-
-
-_ORDINAL_TO_CURSO = {
-    "primer": "1º", "primero": "1º", "first": "1º",
-    "segundo": "2º", "second": "2º",
-    "tercer": "3º", "tercero": "3º", "third": "3º",
-    "cuarto": "4º", "fourth": "4º",
-    "quinto": "5º", "fifth": "5º",
-    "sexto": "6º", "sixth": "6º",
-}
-
-
-def _section_to_curso(text: str) -> str:
-    """Convert a section header to a short course label ('1º', '2º', …).
-
-    Handles all BOE heading patterns:
-      - "PRIMER CURSO"          → keyword after ordinal  → prefix has ordinal
-      - "2.º Curso"             → keyword after digit    → prefix has digit
-      - "Curso 1.º"             → keyword before digit   → suffix has digit
-      - "Segundo curso (primer semestre)" → prefix has ordinal
-      - "Primero" / "Segundo"   → no keyword, ordinal word only
-
-    Safety rules:
-      - Digits (1-6) are only used when a course keyword (\bcurso\b|\baño\b|\byear\b)
-        is present in the text, preventing false positives from law article numbers,
-        ECTS credit counts, etc.
-      - Without a course keyword, only explicit ordinal words are matched.
-      - Uses word-boundary regex for keyword detection so 'años'/'cursos' don't match.
-    """
-    t = text.lower().strip().rstrip(".")
-
-    kw_match = re.search(r'\b(curso|año|year)\b', t)
-    if kw_match:
-        prefix = t[:kw_match.start()]
-        suffix = t[kw_match.end():]
-        # Search prefix first, then suffix (handles both "Primer Curso" and "Curso 1.º")
-        for segment in (prefix, suffix):
-            m = re.search(r"(\d+)", segment)
-            if m:
-                n = int(m.group(1))
-                if 1 <= n <= 6:
-                    return f"{n}º"
-            for word, label in _ORDINAL_TO_CURSO.items():
-                if re.search(r"\b" + re.escape(word) + r"\b", segment):
-                    return label
-        return ""  # Course keyword present but no year identifier found
-
-    # No course keyword → digits are never reliable; only match ordinal words
-    for word, label in _ORDINAL_TO_CURSO.items():
-        if re.search(r"\b" + re.escape(word) + r"\b", t):
-            return label
-    return ""
-
-
-_ROMAN_VALUES = {"I": 1, "V": 5, "X": 10, "L": 50, "C": 100}
-
-
-def _roman_to_int(s: str) -> int:
-    """Convert a Roman numeral string (I–XII) to an integer, or 0 if unrecognised."""
-    s = s.upper().strip()
-    result, prev = 0, 0
-    for ch in reversed(s):
-        val = _ROMAN_VALUES.get(ch, 0)
-        if not val:
-            return 0
-        result += val if val >= prev else -val
-        prev = val
-    return result
-
-
-def _sem_to_curso(sem: str) -> str:
-    """Derive the academic year from a semester label (2 semesters per year).
-
-    Handles Roman numerals (I, II, III, … VIII) and Arabic digits (1, 2, … 8),
-    including ranges like 'I-II' or '3-4' (takes the first value).
-    Returns '' if the label cannot be parsed as a semester number.
-    """
-    if not sem:
-        return ""
-    s = sem.strip()
-    # Take the first token before any separator (-, /, space, comma)
-    first = re.split(r"[-/\s,]", s)[0].strip()
-    # Try Roman numeral first (UAX style: I, II, III…)
-    n = _roman_to_int(first)
-    if not n:
-        # Try leading Arabic digits — re.match handles "1º", "2º" etc.
-        m = re.match(r"(\d+)", first)
-        n = int(m.group(1)) if m else 0
-    if 1 <= n <= 12:
-        return f"{(n + 1) // 2}º"
-    return ""
-
-
-def _parse_boe_subjects_from_content(content) -> list[dict]:
-    """
-    Extract per-subject rows from an already-fetched BOE #textoxslt BeautifulSoup element.
 
-    Iterates ALL direct children in DOM order so that <p>/<h*> elements immediately before
-    a <table> (e.g. "Curso 1.º") are captured as the course label for that table.
-    Also handles section-header rows inside tables and rowspan-shortened data rows.
-    """
-    from bs4 import Tag
-    subjects = []
-    seen_names: set = set()
-    current_curso = ""
-
-    for element in content.children:
-        if not isinstance(element, Tag):
-            continue
-
-        # ── Paragraph / heading: check for course indicator ────────────────────
-        if element.name in ("p", "h2", "h3", "h4", "h5"):
-            txt = element.get_text(" ", strip=True)
-            curso = _section_to_curso(txt)
-            if curso:
-                current_curso = curso
-            continue
-
-        if element.name != "table":
-            continue
-
-        if element.find_parent("table"):
-            continue
-
-        # ── Table ──────────────────────────────────────────────────────────────
-        rows = element.find_all("tr")
-        if len(rows) < 3:
-            continue
-
-        nom_col = car_col = ects_col = cur_col = sem_col = None
-        header_row_idx = 0
-        hcells = []
-        for try_idx in range(min(2, len(rows))):
-            hcells = [th.get_text(strip=True) for th in rows[try_idx].find_all(["th", "td"])]
-            nom_col, car_col, ects_col, cur_col, sem_col = _detect_header_cols(hcells)
-            if nom_col is not None and ects_col is not None:
-                header_row_idx = try_idx
-                break
-
-        if nom_col is None or ects_col is None:
-            continue
-
-        n_header = len(hcells)
-
-        # Course label priority: in-table section row > preceding <p>
-        section_curso = current_curso
-        if header_row_idx == 1:
-            sec_text = " ".join(rows[0].get_text(strip=True).split())
-            from_section = _section_to_curso(sec_text)
-            if from_section:
-                section_curso = from_section
-
-        table_subjects = []
-        for tr in rows[header_row_idx + 1:]:
-            cells = tr.find_all(["td", "th"])
-            if not cells:
-                continue
-            n = len(cells)
-            # Single-cell rows inside the body are section labels (year/course indicator)
-            if n == 1:
-                label = _section_to_curso(cells[0].get_text(" ", strip=True))
-                if label:
-                    section_curso = label
-                continue
-            nc  = _adj_col(nom_col,  n_header, n)
-            ec  = _adj_col(ects_col, n_header, n)
-            cc  = _adj_col(car_col,  n_header, n)
-            urc = _adj_col(cur_col,  n_header, n)
-            sc  = _adj_col(sem_col,  n_header, n)
-            if nc is None or ec is None:
-                continue
-            nom = _clean_text(cells[nc].get_text(strip=True))
-            if not nom or any(k in nom.lower() for k in ["total", "suma", "créditos"]):
-                continue
-            try:
-                ects_val = float(cells[ec].get_text(strip=True).replace(",", ".").strip())
-                if ects_val <= 0 or ects_val > 30:
-                    continue
-            except (ValueError, IndexError):
-                continue
-            car = _clean_text(cells[cc].get_text(strip=True))  if cc  is not None else ""
-            cur = _clean_text(cells[urc].get_text(strip=True)) if urc is not None else ""
-            sem = _clean_text(cells[sc].get_text(strip=True))  if sc  is not None else ""
-            # Normalize bare digit course number from "Curso" column (e.g. "1" → "1º")
-            if cur and re.fullmatch(r"\d+", cur):
-                n = int(cur)
-                if 1 <= n <= 6:
-                    cur = f"{n}º"
-            if not cur:
-                cur = section_curso or _sem_to_curso(sem)
-            cat = _categorize_ects(car) or "otros"
-            table_subjects.append({
-                "nombre": nom, "caracter": car, "categoria": cat,
-                "ects": ects_val, "curso": cur, "semestre": sem,
-            })
-
-        if len(table_subjects) >= 3:
-            # Skip module-summary tables: title row before headers, no course info,
-            # and we already have subject data from previous tables.
-            is_module_summary = (
-                header_row_idx == 1
-                and not section_curso
-                and subjects
-                and all(s["curso"] == "" for s in table_subjects)
-            )
-            if not is_module_summary:
-                existing_per_year: dict = {}
-                for s in subjects:
-                    if s["curso"]:
-                        existing_per_year[s["curso"]] = existing_per_year.get(s["curso"], 0) + 1
-                table_per_year: dict = {}
-                for s in table_subjects:
-                    if s["curso"]:
-                        table_per_year[s["curso"]] = table_per_year.get(s["curso"], 0) + 1
-                for s in table_subjects:
-                    if s["nombre"] not in seen_names:
-                        cur = s["curso"]
-                        if cur and existing_per_year.get(cur, 0) > table_per_year.get(cur, 0):
-                            continue
-                        subjects.append(s)
-                        seen_names.add(s["nombre"])
-    return subjects
+# ─── Progressive detail loading ───────────────────────────────────────────────
+_PLAN_INLINE_WAIT = 0.3     # seconds a plan may take (a cache hit) before the view renders without it
+_DETAIL_POLL = 0.5          # seconds between checks of the background detail loads
 
 
-def _parse_boe_subjects_from_xml(texto) -> list[dict]:
-    """
-    Extract per-subject rows from the <texto> element of a BOE xml.php response.
+@st.cache_resource(show_spinner=False)
+def _detail_pool() -> ThreadPoolExecutor:
+    """Background loads of the detail view (fichas and plans), shared by all sessions."""
+    return ThreadPoolExecutor(max_workers=8, thread_name_prefix="detail")
 
-    Iterates ALL direct children in DOM order so that <p> elements immediately before
-    a <table> (e.g. "Curso 1.º") are captured as the course label for that table.
-    Also handles section-header rows inside tables (e.g. 'PRIMER CURSO' as row 0)
-    and rowspan-shortened data rows.
-    """
-    subjects = []
-    seen_names: set = set()
-    current_curso = ""          # course label from a preceding <p>/<h*> element
-
-    for element in texto:       # iterate direct children IN ORDER
-        tag = element.tag
-
-        # ── Paragraph / heading: check for course indicator ────────────────────
-        if tag in ("p", "h2", "h3", "h4", "h5"):
-            txt = " ".join(element.itertext()).strip()
-            curso = _section_to_curso(txt)
-            if curso:
-                current_curso = curso
-            continue
-
-        if tag != "table":
-            continue
-
-        # ── Table ──────────────────────────────────────────────────────────────
-        rows = element.findall(".//tr")
-        if len(rows) < 3:
-            continue
-
-        # Try row 0, then row 1 as column-header row.
-        # Some BOEs use <th> for headers instead of <td>.
-        nom_col = car_col = ects_col = cur_col = sem_col = None
-        header_row_idx = 0
-        hcells_text = []
-        for try_idx in range(min(2, len(rows))):
-            ths = rows[try_idx].findall(".//th")
-            hcells_text = ([" ".join(th.itertext()).strip() for th in ths]
-                           if ths else
-                           [" ".join(td.itertext()).strip() for td in rows[try_idx].findall(".//td")])
-            nom_col, car_col, ects_col, cur_col, sem_col = _detect_header_cols(hcells_text)
-            if nom_col is not None and ects_col is not None:
-                header_row_idx = try_idx
-                break
-
-        if nom_col is None or ects_col is None:
-            continue
-
-        n_header = len(hcells_text)
-
-        # Course label priority: in-table section row > preceding <p>
-        section_curso = current_curso
-        if header_row_idx == 1:
-            sec_text = " ".join("".join(rows[0].itertext()).split())
-            from_section = _section_to_curso(sec_text)
-            if from_section:
-                section_curso = from_section
-
-        table_subjects = []
-        for tr in rows[header_row_idx + 1:]:
-            cells = tr.findall(".//td")
-            if not cells:
-                continue
-            n = len(cells)
-            # Single-cell rows inside the body are section labels (year/course indicator)
-            if n == 1:
-                label = _section_to_curso(" ".join(cells[0].itertext()).strip())
-                if label:
-                    section_curso = label
-                continue
-            nc  = _adj_col(nom_col,  n_header, n)
-            ec  = _adj_col(ects_col, n_header, n)
-            cc  = _adj_col(car_col,  n_header, n)
-            urc = _adj_col(cur_col,  n_header, n)
-            sc  = _adj_col(sem_col,  n_header, n)
-            if nc is None or ec is None:
-                continue
-            nom = _clean_text(" ".join(cells[nc].itertext()).strip())
-            if not nom or any(k in nom.lower() for k in ["total", "suma", "créditos"]):
-                continue
-            try:
-                ects_val = float(" ".join(cells[ec].itertext()).strip().replace(",", "."))
-                if ects_val <= 0 or ects_val > 30:
-                    continue
-            except (ValueError, IndexError):
-                continue
-            car = _clean_text(" ".join(cells[cc].itertext()).strip())  if cc  is not None else ""
-            cur = _clean_text(" ".join(cells[urc].itertext()).strip()) if urc is not None else ""
-            sem = _clean_text(" ".join(cells[sc].itertext()).strip())  if sc  is not None else ""
-            # Normalize bare digit course number from "Curso" column (e.g. "1" → "1º")
-            if cur and re.fullmatch(r"\d+", cur):
-                n = int(cur)
-                if 1 <= n <= 6:
-                    cur = f"{n}º"
-            if not cur:
-                cur = section_curso or _sem_to_curso(sem)
-            cat = _categorize_ects(car) or "otros"
-            table_subjects.append({"nombre": nom, "caracter": car, "categoria": cat,
-                                    "ects": ects_val, "curso": cur, "semestre": sem})
-
-        if len(table_subjects) >= 3:
-            # Skip module-summary tables: title row before headers, no course info on
-            # any entry, and we already have subject data from previous tables.
-            # Example: UCM "Plan de estudios resumido (por módulo)" table.
-            is_module_summary = (
-                header_row_idx == 1
-                and not section_curso
-                and subjects
-                and all(s["curso"] == "" for s in table_subjects)
-            )
-            if not is_module_summary:
-                # Prefer finer granularity: if a year already has MORE subjects than
-                # this table contributes for that year, skip this table's entries for
-                # that year (avoids mixing individual subjects + module aggregates).
-                existing_per_year: dict = {}
-                for s in subjects:
-                    if s["curso"]:
-                        existing_per_year[s["curso"]] = existing_per_year.get(s["curso"], 0) + 1
-                table_per_year: dict = {}
-                for s in table_subjects:
-                    if s["curso"]:
-                        table_per_year[s["curso"]] = table_per_year.get(s["curso"], 0) + 1
-                for s in table_subjects:
-                    if s["nombre"] not in seen_names:
-                        cur = s["curso"]
-                        if cur and existing_per_year.get(cur, 0) > table_per_year.get(cur, 0):
-                            continue  # existing data is more granular for this year
-                        subjects.append(s)
-                        seen_names.add(s["nombre"])
-
-    return subjects
-
-
-def _boe_txt_to_xml_url(txt_url: str) -> str:
-    """Convert a BOE txt.php URL to its xml.php equivalent."""
-    return txt_url.replace("txt.php", "xml.php")
 
-
-def _fetch_boe_plan(url: str) -> tuple[str, list]:
+def _detail_jobs(plan_key: str, selected: dict, codigo: str) -> dict:
     """
-    Fetch a BOE plan page and return (plan_text, subjects_list).
-    Tries xml.php first (structured API, more reliable on cloud), falls back to txt.php HTML.
+    The session's background loads of a degree: the full plan and, unless the
+    plan is a cache hit, the quick ficha (estudio.action + detalles.action) so
+    the ficha card can render before the subjects and the BOE plan arrive.
     """
-    if not url:
-        return "", []
-
-    # ── Try XML endpoint first ────────────────────────────────────────────────
-    try:
-        import xml.etree.ElementTree as _ET
-        xml_url = _boe_txt_to_xml_url(url)
-        rx = requests.get(xml_url, headers=_WEB_HEADERS, timeout=15)
-        if rx.status_code == 200 and rx.content:
-            root = _ET.fromstring(rx.content)
-            texto = root.find("texto")
-            if texto is not None:
-                subjects = _parse_boe_subjects_from_xml(texto)
-                # Build markdown text from XML tables and paragraphs
-                parts = []
-                past_first_table = False
-                for child in texto:
-                    if child.tag == "table":
-                        past_first_table = True
-                        rows = child.findall(".//tr")
-                        if rows:
-                            md_rows = []
-                            for i, tr in enumerate(rows):
-                                cells = [" ".join(td.itertext()).strip() for td in tr.findall(".//td")]
-                                if not cells:
-                                    continue
-                                md_rows.append("| " + " | ".join(cells) + " |")
-                                if i == 0:
-                                    md_rows.append("|" + "|".join([" --- "] * len(cells)) + "|")
-                            if md_rows:
-                                parts.append("\n".join(md_rows))
-                    elif child.tag in ("p", "h2", "h3", "h4") and past_first_table:
-                        t = " ".join(child.itertext()).strip()
-                        if t:
-                            parts.append(t)
-                return "\n\n".join(parts)[:14000], subjects
-    except Exception:
-        pass
-
-    # ── Fallback: HTML txt.php ────────────────────────────────────────────────
-    try:
-        r = requests.get(url, headers=_WEB_HEADERS, timeout=15)
-        if r.status_code >= 400:
-            return "", []
-        soup = BeautifulSoup(r.text, "lxml")
-        content = soup.find(id="textoxslt")
-        if not content:
-            return "", []
-
-        subjects = _parse_boe_subjects_from_content(content)
-
-        for el in content(["script", "style", "a"]):
-            el.decompose()
-
-        parts = []
-        past_first_table = False
-        for el in content.find_all(["table", "p", "h2", "h3", "h4"]):
-            if el.find_parent("table"):
-                continue
-            if el.name == "table":
-                past_first_table = True
-                md = _html_table_to_md(el)
-                if md:
-                    parts.append(md)
-            elif past_first_table:
-                text = el.get_text(strip=True)
-                if text:
-                    parts.append(text)
-
-        if not parts:
-            paragraphs = [
-                el.get_text(strip=True)
-                for el in content.find_all(["p", "h2", "h3", "h4"])
-                if not el.find_parent("table") and el.get_text(strip=True)
-            ]
-            if len(paragraphs) > 2:
-                parts = paragraphs[2:]
-
-        return "\n\n".join(parts)[:14000], subjects
-    except Exception:
-        return "", []
+    jobs = st.session_state.setdefault("detail_jobs", {})
+    if plan_key not in jobs:
+        for key in [k for k, j in jobs.items() if j["plan"].done()]:
+            del jobs[key]      # finished loads of degrees left before they arrived (now cached)
+        pool = _detail_pool()
+        args = (selected["title"], selected["university"],
+                selected.get("url_ruct", ""), selected.get("url_plan", ""))
+        job = {"plan": pool.submit(get_study_plan, codigo, *args)}
+        wait([job["plan"]], timeout=_PLAN_INLINE_WAIT)
+        if not job["plan"].done():
+            deg = {"codigo": codigo, "url_ruct": args[2], "url_plan": args[3]}
+            job["ficha"] = pool.submit(lambda: comparator.fetch_fichas([deg], workers=1)[0])
+        jobs[plan_key] = job
+    return jobs[plan_key]
+
+
+@st.fragment(run_every=_DETAIL_POLL)
+def _await_detail(plan_key: str, ficha_shown: bool) -> None:
+    """Poll the background loads; rerun the page when the ficha or the plan arrives."""
+    job = st.session_state.get("detail_jobs", {}).get(plan_key)
+    if job is None:
+        return
+    ficha_fut = job.get("ficha")
+    if job["plan"].done() or (not ficha_shown and ficha_fut is not None and ficha_fut.done()):
+        st.rerun()
+    st.markdown(
+        '<div class="info-box">⏳ Cargando asignaturas y plan de estudios del BOE…</div>',
+        unsafe_allow_html=True,
+    )
 
 
-def _fetch_ruct_modules(url_plan: str) -> tuple[str, list[dict]]:
-    """
-    Fallback: fetch the 'Módulos o Materias' static page from RUCT.
+@st.cache_resource(show_spinner=False, max_entries=1)
+def _load_subject_index(version: str) -> SubjectIndex:
+    """Process-wide subject index; version reloads it after a rebuild."""
+    return SubjectIndex.load()
 
-    Session flow:
-      1. GET consultaestudios.action  — init session
-      2. GET url_plan (lupa link)     — register degree in server session
-      3. GET datosModulo              — returns static HTML with module list
 
-    Returns (markdown_text, subjects_list). subjects_list entries:
-      {nombre, caracter, categoria, ects, curso, semestre}
-    """
-    if not url_plan:
-        return "", []
+def _subject_index() -> SubjectIndex:
+    """The subject index, caught up with the plans journaled by every process."""
+    idx = _load_subject_index(subject_index.index_version())
     try:
-        session = requests.Session()
-        session.headers.update(_WEB_HEADERS)
-        session.get(_RUCT_INIT_URL, timeout=15)
-        session.get(url_plan, timeout=15)
-        r = session.get(_RUCT_MODULES_URL, timeout=15)
-        r.raise_for_status()
-        soup = BeautifulSoup(r.text, "lxml")
-        table = soup.find("table")
-        if not table:
-            return "", []
-        rows = table.find_all("tr")
-        if not rows:
-            return "", []
-
-        # Detect columns from header
-        header_cells = [th.get_text(separator=" ", strip=True).lower()
-                        for th in rows[0].find_all(["th", "td"])]
-        nom_col = car_col = ects_col = cur_col = sem_col = None
-        for idx, h in enumerate(header_cells):
-            if any(k in h for k in ["denominaci", "nombre", "materia", "módulo", "modulo",
-                                     "subject", "module", "asignatura"]):
-                if nom_col is None:
-                    nom_col = idx
-            elif any(k in h for k in ["carácter", "caracter", "tipo", "naturaleza",
-                                       "character", "type"]):
-                car_col = idx
-            elif any(k in h for k in ["ects", "crédito", "credito", "credit"]):
-                if ects_col is None:
-                    ects_col = idx
-            elif "curso" in h or "year" in h:
-                cur_col = idx
-            elif any(k in h for k in ["semestre", "período", "periodo", "cuatr",
-                                       "semester", "term"]):
-                sem_col = idx
-        # Fallback column positions (typical RUCT table: idx | nombre | carácter | ECTS)
-        if nom_col is None:
-            nom_col = 1 if len(header_cells) >= 2 else 0
-        if ects_col is None and len(header_cells) >= 2:
-            ects_col = len(header_cells) - 1
-        if car_col is None and nom_col is not None and nom_col > 0:
-            car_col = nom_col + 1 if nom_col + 1 != ects_col else None
-
-        items = []
-        subjects = []
-        for tr in rows[1:]:
-            cells = tr.find_all("td")
-            if len(cells) < 2:
-                continue
-            nom = _clean_text(cells[nom_col].get_text(strip=True)) if nom_col is not None and nom_col < len(cells) else ""
-            if not nom:
-                continue
-            if any(k in nom.lower() for k in ["total", "suma"]):
-                continue
-            items.append(f"- {nom}")
-            ects_val = 0.0
-            if ects_col is not None and ects_col < len(cells):
-                try:
-                    import re as _re4
-                    m4 = _re4.search(r"[\d,\.]+", cells[ects_col].get_text(strip=True))
-                    ects_val = float(m4.group().replace(",", ".")) if m4 else 0.0
-                except (ValueError, AttributeError):
-                    ects_val = 0.0
-            car = _clean_text(cells[car_col].get_text(strip=True)) if car_col is not None and car_col < len(cells) else ""
-            cur = _clean_text(cells[cur_col].get_text(strip=True)) if cur_col is not None and cur_col < len(cells) else ""
-            sem = _clean_text(cells[sem_col].get_text(strip=True)) if sem_col is not None and sem_col < len(cells) else ""
-            cat = _categorize_ects(car) or "otros"
-            subjects.append({
-                "nombre": nom,
-                "caracter": car,
-                "categoria": cat,
-                "ects": ects_val,
-                "curso": cur,
-                "semestre": sem,
-            })
-        if not items:
-            return "", []
-        text = "**Módulos y materias**\n\n" + "\n".join(items)
-        return text, subjects
+        idx.sync()
     except Exception:
-        return "", []
+        logging.getLogger(__name__).warning("Could not sync the subject index", exc_info=True)
+    return idx
 
 
-def _parse_ruct_subjects(url_plan: str) -> list[dict]:
-    """
-    Fetch the RUCT 'datosModulo' page and return a structured list of subjects.
-    Same session flow as _parse_ects_from_ruct but returns full subject data.
-    Returns list of dicts: {nombre, caracter, categoria, ects, curso, semestre}
-    """
-    subjects = []
-    if not url_plan:
-        return subjects
-    try:
-        session = requests.Session()
-        session.headers.update(_WEB_HEADERS)
-        session.get(_RUCT_INIT_URL, timeout=15)
-        # Derive url_plan from url_ruct if needed
-        if "detalles.action" not in url_plan and "estudio.action" in url_plan:
-            import re as _re2
-            m2 = _re2.search(r"codigoEstudio=(\d+)", url_plan)
-            if m2:
-                url_plan = (
-                    f"https://www.educacion.gob.es/ruct/detalles.action"
-                    f"?codigoEstudio={m2.group(1)}&actual=detallesbasicos"
-                )
-        session.get(url_plan, timeout=15)
-        r = session.get(_RUCT_MODULES_URL, timeout=15)
-        r.raise_for_status()
-        soup = BeautifulSoup(r.text, "lxml")
-        table = soup.find("table")
-        if not table:
-            return subjects
-
-        rows = table.find_all("tr")
-        if not rows:
-            return subjects
-
-        header_cells = [th.get_text(separator=" ", strip=True).lower()
-                        for th in rows[0].find_all(["th", "td"])]
-        nom_col = car_col = ects_col = cur_col = sem_col = None
-        for idx, h in enumerate(header_cells):
-            if any(k in h for k in ["denominaci", "nombre", "materia", "módulo", "modulo",
-                                     "subject", "module", "denomination", "asignatura"]):
-                if nom_col is None:
-                    nom_col = idx
-            elif any(k in h for k in ["carácter", "caracter", "tipo", "naturaleza",
-                                       "character", "nature", "type"]):
-                car_col = idx
-            elif any(k in h for k in ["ects", "crédito", "credito", "credit"]):
-                if ects_col is None:
-                    ects_col = idx
-            elif "curso" in h or "year" in h:
-                cur_col = idx
-            elif any(k in h for k in ["semestre", "período", "periodo", "cuatr",
-                                       "semester", "term", "period"]):
-                sem_col = idx
-
-        # Fallback column guesses
-        if nom_col is None and len(header_cells) >= 2:
-            nom_col = 1
-        if ects_col is None and len(header_cells) >= 2:
-            ects_col = len(header_cells) - 1
-        if car_col is None and nom_col is not None and nom_col > 0:
-            car_col = 0
-
-        if nom_col is None or ects_col is None:
-            return subjects
-
-        for tr in rows[1:]:
-            cells = tr.find_all(["td", "th"])
-            if not cells:
-                continue
-            max_needed = max(c for c in [nom_col, car_col, ects_col, cur_col, sem_col] if c is not None)
-            if len(cells) <= max_needed:
-                continue
-            nom = _clean_text(cells[nom_col].get_text(strip=True))
-            if not nom:
-                continue
-            if any(k in nom.lower() for k in ["total", "suma"]):
-                continue
-            try:
-                raw = cells[ects_col].get_text(strip=True)
-                # Strip non-numeric suffix (e.g. "30 ECTS" → "30")
-                import re as _re3
-                m3 = _re3.search(r"[\d,\.]+", raw)
-                ects_raw = m3.group().replace(",", ".") if m3 else ""
-                ects_val = float(ects_raw)
-                if ects_val <= 0 or ects_val > 400:
-                    continue
-            except (ValueError, IndexError):
-                continue
-            car = _clean_text(cells[car_col].get_text(strip=True)) if car_col is not None and car_col < len(cells) else ""
-            cur = _clean_text(cells[cur_col].get_text(strip=True)) if cur_col is not None and cur_col < len(cells) else ""
-            sem = _clean_text(cells[sem_col].get_text(strip=True)) if sem_col is not None and sem_col < len(cells) else ""
-            cat = _categorize_ects(car) or "otros"
-            subjects.append({
-                "nombre": nom,
-                "caracter": car,
-                "categoria": cat,
-                "ects": ects_val,
-                "curso": cur,
-                "semestre": sem,
-            })
-    except Exception:
-        pass
-    return subjects
+@st.cache_resource(show_spinner=False, max_entries=1)
+def _similarity_index(version: str) -> SimilarityIndex:
+    """Precomputed curriculum-similarity neighbours (similarity.py); version reloads it after a rebuild."""
+    return SimilarityIndex.load()
 
 
-def _find_study_plan(title: str, university: str, url_ruct: str = "", url_plan: str = "") -> dict:
-    """
-    Fetch the RUCT degree ficha (metadata) and locate the study plan.
+@st.cache_resource(show_spinner=False, max_entries=1)
+def _ranked_index(version: str) -> RankedIndex:
+    """Ranked local search over the catalogue snapshot; version reloads it after a rebuild."""
+    return RankedIndex.from_snapshot()
 
-    Returns {"ficha": dict, "page_text": str, "source_url": str}
-    """
-    # Construct url_plan from url_ruct if missing (same logic as _fetch_ruct_ficha)
-    if not url_plan and url_ruct:
-        m = re.search(r"codigoEstudio=(\d+)", url_ruct)
-        if m:
-            url_plan = (
-                f"https://www.educacion.gob.es/ruct/detalles.action"
-                f"?codigoEstudio={m.group(1)}&actual=detallesbasicos"
-            )
-    ficha = _fetch_ruct_ficha(url_ruct, url_plan)
-    # modules fetched inside _fetch_ruct_ficha session (step 4)
-    modules_subjects = ficha.pop("modules", [])
-    boe_url = ficha.get("boe_plan_url", "")
-    _v = "v34"
-    if boe_url:
-        plan_text, boe_subjects = _fetch_boe_plan(boe_url)
-        return {
-            "ficha": ficha,
-            "page_text": plan_text,
-            "subjects_boe": boe_subjects,
-            "subjects_ruct": modules_subjects,
-            "source_url": boe_url,
-            "_v": _v,
-        }
-
-    return {
-        "ficha": ficha,
-        "page_text": "",
-        "subjects_boe": [],
-        "subjects_ruct": modules_subjects,
-        "source_url": "",
-        "_v": _v,
-    }
 
-
-# ─── ECTS breakdown parser ────────────────────────────────────────────────────
-_ECTS_CATS = [
-    ("basica",      ["básic", "formación bás", "formacion bas", "basica", "básica", "fbc", "fbr",
-                    "basic", "formation", "general education"]),
-    ("obligatoria", ["obligatori", "compulsory", "mandatory", "required", "core"]),
-    ("optativa",    ["optativ", "optional", "elective", "free choice"]),
-    ("practicas",   ["práctic", "practic", "practicum", "internship", "placement", "clinical"]),
-    ("tfg_tfm",     ["trabajo fin", "trabajo de fin", "tfg", "tfm",
-                    "final degree", "final project", "dissertation", "thesis"]),
-]
-
-# BOE abbreviations used in 'Carácter' columns of detailed subject tables
-_ECTS_ABBREVS = {
-    "fb": "basica", "fbc": "basica", "fbr": "basica",
-    "ob": "obligatoria",
-    "op": "optativa",
-    "pe": "practicas",
-    "tfg": "tfg_tfm", "tfm": "tfg_tfm",
-    # English abbreviations used in some RUCT pages
-    "ba": "basica", "co": "obligatoria", "el": "optativa",
-    "in": "practicas", "fd": "tfg_tfm",
-}
-
-
-def _categorize_ects(text: str):
-    t = text.lower().strip()
-    # Exact abbreviation match (e.g. carácter column contains just 'OB', 'FB', etc.)
-    if t in _ECTS_ABBREVS:
-        return _ECTS_ABBREVS[t]
-    # Strip trailing punctuation and try again
-    t_clean = t.rstrip(".,; ")
-    if t_clean in _ECTS_ABBREVS:
-        return _ECTS_ABBREVS[t_clean]
-    # Keyword substring match
-    for cat, keywords in _ECTS_CATS:
-        if any(kw in t for kw in keywords):
-            return cat
-    return None
-
-
-def _parse_ects_breakdown(boe_url: str) -> dict:
-    """
-    Fetch a BOE study plan page and parse ECTS credits by category.
-    Looks for the summary table (few rows, total 30-400 ECTS) and uses only that,
-    ignoring detailed per-subject tables which would cause double counting.
-    Returns dict: {"basica": N, "obligatoria": N, "optativa": N,
-                   "practicas": N, "tfg_tfm": N, "otros": N, "total": N}
-    """
-    result = {"basica": 0, "obligatoria": 0, "optativa": 0,
-              "practicas": 0, "tfg_tfm": 0, "otros": 0, "total": 0}
-    if not boe_url:
-        return result
-    try:
-        r = requests.get(boe_url, headers=_WEB_HEADERS, timeout=15)
-        if r.status_code >= 400:
-            return result
-        soup = BeautifulSoup(r.text, "lxml")
-        content = soup.find(id="textoxslt")
-        if not content:
-            return result
-
-        def _parse_single_table(table):
-            """Parse one table and return (totals_dict, n_data_rows) or (None, 0)."""
-            rows = table.find_all("tr")
-            if not rows:
-                return None, 0
-            header_cells = [th.get_text(separator=" ", strip=True).lower()
-                            for th in rows[0].find_all(["th", "td"])]
-            ects_col = None
-            char_col = None
-            for idx, h in enumerate(header_cells):
-                if any(k in h for k in ["ects", "crédito", "credito"]):
-                    ects_col = idx
-                if any(k in h for k in ["carácter", "caracter", "tipo", "naturaleza"]):
-                    char_col = idx
-            # Last column named "total" → per-row aggregate (e.g. ECTS split by year)
-            if ects_col is None and header_cells and header_cells[-1].strip() == "total":
-                ects_col = len(header_cells) - 1
-                if char_col is None:
-                    char_col = 0
-            # 2-3 column table without explicit ECTS header: col0=tipo, last=ECTS
-            if ects_col is None and 2 <= len(header_cells) <= 3:
-                ects_col = len(header_cells) - 1
-                char_col = 0
-            if ects_col is None:
-                return None, 0
-            totals = {"basica": 0.0, "obligatoria": 0.0, "optativa": 0.0,
-                      "practicas": 0.0, "tfg_tfm": 0.0, "otros": 0.0}
-            n_rows = 0
-            for tr in rows[1:]:
-                cells = tr.find_all(["td", "th"])
-                if not cells:
-                    continue
-                if len(cells) <= ects_col:
-                    continue
-                # Skip total/summary rows
-                first_text = cells[0].get_text(strip=True).lower()
-                if "total" in first_text or "suma" in first_text:
-                    continue
-                m = re.search(r"(\d+(?:[.,]\d+)?)", cells[ects_col].get_text(separator=" ", strip=True))
-                val = float(m.group(1).replace(",", ".")) if m else 0.0
-                if val <= 0:
-                    continue
-                n_rows += 1
-                if char_col is not None and char_col < len(cells):
-                    cat_text = cells[char_col].get_text(separator=" ", strip=True)
-                else:
-                    cat_text = " ".join(
-                        cells[j].get_text(separator=" ", strip=True)
-                        for j in range(min(ects_col, len(cells)))
-                    )
-                cat = _categorize_ects(cat_text)
-                totals[cat if cat else "otros"] += val
-            return totals, n_rows
-
-        # Strategy: find the summary table — few rows (≤15), total in [60, 400].
-        # Among valid candidates, prefer the table with the highest total (most
-        # complete), breaking ties by fewest rows. This avoids picking a single-
-        # module partial table (e.g. "Obligatoria: 42") over the real 240-ECTS summary.
-        best = None
-        best_total = -1
-        best_rows = 9999
-        for table in content.find_all("table"):
-            if table.find_parent("table"):
-                continue
-            totals, n_rows = _parse_single_table(table)
-            if totals is None:
-                continue
-            table_total = sum(totals.values())
-            if 60 <= table_total <= 400 and n_rows <= 15:
-                if table_total > best_total or (table_total == best_total and n_rows < best_rows):
-                    best = totals
-                    best_total = table_total
-                    best_rows = n_rows
-
-        if best:
-            for k in best:
-                result[k] = int(round(best[k]))
-            result["total"] = sum(result[k] for k in best)
-    except Exception:
-        pass
-    return result
+@st.cache_resource(show_spinner=False, max_entries=1)
+def _autocomplete(version: str) -> Autocomplete:
+    """Degree-name suggestions for the search box, from the catalogue snapshot."""
+    return Autocomplete.from_snapshot()
 
 
-def _parse_ects_from_ruct(url_plan: str) -> dict:
-    """
-    Fallback ECTS parser: fetch the RUCT 'Módulos o Materias' page and aggregate
-    credits by category (Básica, Obligatoria, Optativa, Prácticas, TFG/TFM).
+@st.cache_resource(show_spinner=False, max_entries=1)
+def _facet_index(version: str) -> FacetIndex:
+    """Facet bitmaps of the catalogue snapshot (comunidad, rama, nivel…)."""
+    return FacetIndex(catalogue.load_snapshot())
 
-    Session flow:
-      1. GET consultaestudios.action  — init session
-      2. GET url_plan                 — register degree in server session
-      3. GET datosModulo              — table with carácter + ECTS per subject
 
-    Returns same dict format as _parse_ects_breakdown.
-    """
-    result = {"basica": 0, "obligatoria": 0, "optativa": 0,
-              "practicas": 0, "tfg_tfm": 0, "otros": 0, "total": 0}
-    if not url_plan:
-        return result
-    try:
-        session = requests.Session()
-        session.headers.update(_WEB_HEADERS)
-        session.get(_RUCT_INIT_URL, timeout=15)
-        session.get(url_plan, timeout=15)
-        r = session.get(_RUCT_MODULES_URL, timeout=15)
-        r.raise_for_status()
-        soup = BeautifulSoup(r.text, "lxml")
-        table = soup.find("table")
-        if not table:
-            return result
-
-        rows = table.find_all("tr")
-        if not rows:
-            return result
-
-        # Detect column indices from the header row
-        header_cells = [th.get_text(separator=" ", strip=True).lower()
-                        for th in rows[0].find_all(["th", "td"])]
-        char_col = None
-        ects_col = None
-        for idx, h in enumerate(header_cells):
-            if any(k in h for k in ["carácter", "caracter", "tipo", "naturaleza"]):
-                char_col = idx
-            if any(k in h for k in ["ects", "crédito", "credito"]):
-                ects_col = idx
-
-        # Fallback: assume last column = ECTS, first = carácter
-        if ects_col is None and len(header_cells) >= 2:
-            ects_col = len(header_cells) - 1
-        if char_col is None:
-            char_col = 0
-
-        totals = {"basica": 0.0, "obligatoria": 0.0, "optativa": 0.0,
-                  "practicas": 0.0, "tfg_tfm": 0.0, "otros": 0.0}
-
-        for tr in rows[1:]:
-            cells = tr.find_all(["td", "th"])
-            if not cells or len(cells) <= ects_col:
-                continue
-            first_text = cells[0].get_text(strip=True).lower()
-            if "total" in first_text or "suma" in first_text:
-                continue
-            m = re.search(r"(\d+(?:[.,]\d+)?)",
-                          cells[ects_col].get_text(separator=" ", strip=True))
-            val = float(m.group(1).replace(",", ".")) if m else 0.0
-            if val <= 0:
-                continue
-            cat_text = cells[char_col].get_text(separator=" ", strip=True) if char_col < len(cells) else ""
-            cat = _categorize_ects(cat_text)
-            totals[cat if cat else "otros"] += val
-
-        grand_total = sum(totals.values())
-        if 30 <= grand_total <= 500:
-            for k in totals:
-                result[k] = int(round(totals[k]))
-            result["total"] = sum(result[k] for k in totals)
-    except Exception:
-        pass
-    return result
+@st.cache_data(show_spinner=False)
+def _analytics_views(version: float) -> dict:
+    """Precomputed aggregate tables (analytics.py); version invalidates after a refresh."""
+    return {name: analytics.load_view(name) for name in analytics.AGGREGATES}
 
 
 # ─── Header ───────────────────────────────────────────────────────────────────
@@ -1820,18 +628,94 @@ selected = st.session_state.get("selected_degree")
 warning  = st.session_state.get("warning_scraper")
 
 
+# =====================================================================
+# STATE - CATALOGUE ANALYTICS
+# =====================================================================
+if st.session_state.get("analytics"):
+    col_back, col_title = st.columns([2, 5])
+    with col_back:
+        if st.button("← Volver a la búsqueda", key="_back_analytics", use_container_width=True, type="primary"):
+            st.session_state["analytics"] = False
+            st.rerun()
+    with col_title:
+        st.markdown(
+            '<p style="margin:0.55rem 0 0;font-size:0.85rem;font-weight:600;color:#111827;">'
+            'Estadísticas del catálogo</p>',
+            unsafe_allow_html=True,
+        )
+    st.divider()
+
+    _manifest = analytics.load_manifest()
+    views = _analytics_views(_manifest.get("refreshed_at", 0))
+    if not _manifest:
+        st.markdown(
+            '<div class="warn-box">⚠️ Las estadísticas aún no se han generado '
+            '(<code>python catalogue.py build</code> y <code>python analytics.py refresh</code>).</div>',
+            unsafe_allow_html=True,
+        )
+    else:
+        st.caption(f"{_manifest.get('rows', 0):,} titulaciones en la instantánea del catálogo.")
+        tab_rama, tab_ccaa, tab_univ = st.tabs(["ECTS por rama", "Títulos por CCAA", "Universidades"])
+
+        with tab_rama:
+            v = views["ects_por_rama"]
+            if not v.empty:
+                nivel = st.radio("Nivel", sorted(v["nivel_academico"].unique()), horizontal=True,
+                                 key="an_nivel")
+                v = v[v["nivel_academico"] == nivel].set_index("rama")
+                media_cols = {f"media_{c}": comparator.ECTS_LABELS[c.removeprefix("ects_")]
+                              for c in analytics.ECTS_METRICS if c != "ects_total"}
+                st.bar_chart(v[list(media_cols)].rename(columns=media_cols), horizontal=True)
+                st.dataframe(
+                    v.rename(columns={**media_cols, "n": "Títulos", "n_ects": "Con ECTS",
+                                      "media_ects_total": "Total"}).drop(columns="nivel_academico"),
+                    use_container_width=True,
+                )
+
+        for tab, name, label in [(tab_ccaa, "titulos_por_ccaa", "ccaa"),
+                                 (tab_univ, "titulos_por_universidad", "universidad")]:
+            with tab:
+                v = views[name]
+                if v.empty:
+                    continue
+                counts = v.pivot_table(index=label, columns="tipo", values="n",
+                                       aggfunc="sum", fill_value=0)
+                counts = counts.rename(columns={"G": "Grado", "M": "Máster"})
+                counts = counts.loc[counts.sum(axis=1).sort_values(ascending=False).index]
+                st.bar_chart(counts.head(25), horizontal=True)
+                st.dataframe(counts, use_container_width=True)
+
+
 # =====================================================================
 # STATE 1 - SEARCH
 # =====================================================================
-if df_res is None:
+elif df_res is None:
+    _snapshot_version = catalogue.snapshot_version()
+    _local_mode = False
+    if _snapshot_version:
+        _local_mode = st.radio(
+            "Modo de búsqueda",
+            ["RUCT en tiempo real", "Catálogo local (tolera erratas)"],
+            horizontal=True, key="search_mode", label_visibility="collapsed",
+        ) != "RUCT en tiempo real"
     with st.form("busqueda_ruct"):
         col_s, col_t, col_u, col_btn = st.columns([4, 1.6, 2, 1.2])
         with col_s:
-            search_term = st.text_input(
-                "Denominación",
-                placeholder="Ej: Ingeniería Informática, Medicina...",
-                help="Busca por palabras en el nombre oficial del título",
-            )
+            _names = _autocomplete(_snapshot_version).top() if _snapshot_version else []
+            if _names:
+                # Suggestions by popularity; any other text is still accepted as a query
+                search_term = st.selectbox(
+                    "Denominación", options=_names, index=None, accept_new_options=True,
+                    filter_mode="contains",
+                    placeholder="Ej: Ingeniería Informática, Medicina...",
+                    help="Elige una denominación sugerida o escribe palabras del nombre oficial del título",
+                ) or ""
+            else:
+                search_term = st.text_input(
+                    "Denominación",
+                    placeholder="Ej: Ingeniería Informática, Medicina...",
+                    help="Busca por palabras en el nombre oficial del título",
+                )
         with col_t:
             tipo_sel = st.selectbox(
                 "Nivel",
@@ -1848,28 +732,83 @@ if df_res is None:
             unsafe_allow_html=True,
         )
 
-    if submitted:
+    if submitted and _local_mode:
         tipo_val = tipo_values.get(tipo_sel, "")
         univ_val = univ_values.get(univ_sel, "")
+        df = _ranked_index(_snapshot_version).search(
+            search_term, tipo=tipo_val, universidad=univ_sel if univ_val else "", limit=500,
+        )
+        st.session_state["df_resultados"] = df.drop(columns="relevancia")
+        st.session_state["warning_scraper"] = (
+            None if len(df) or not search_term.strip()
+            else f"Ninguna titulación del catálogo local se parece a «{search_term.strip()}»."
+        )
+        st.session_state["search_cursor"] = None
+        st.session_state["last_search_term"] = search_term.strip()
+        st.session_state["selected_degree"] = None
+        st.rerun()
+
+    elif submitted:
+        tipo_val = tipo_values.get(tipo_sel, "")
+        univ_val = univ_values.get(univ_sel, "")
+        search_params = dict(
+            descripcion=search_term,
+            codigo="",
+            universidad=univ_val,
+            tipo=tipo_val,
+            rama="",
+            estado="P",
+            situacion="A",
+            historico="N",
+            timeout=30,
+            max_paginas=200,
+        )
+        warmup.log_search(search_params)
+        cursor = ruct_scraper.SearchCursor()
         with st.spinner("Consultando el RUCT… esto puede tardar unos segundos."):
-            df, warn = ruct_scraper.search_ruct(
-                descripcion=search_term,
-                codigo="",
-                universidad=univ_val,
-                tipo=tipo_val,
-                rama="",
-                estado="P",
-                situacion="A",
-                historico="N",
-                timeout=30,
-                max_paginas=200,
-            )
+            df, warn, stale = ruct_scraper.search_ruct_cached(cursor=cursor, **search_params, options=options)
+        if stale and not warn:
+            warn = ("Resultados guardados de una consulta anterior; "
+                    "se están actualizando con el RUCT en segundo plano.")
         st.session_state["df_resultados"] = df
         st.session_state["warning_scraper"] = warn
+        st.session_state["search_cursor"] = cursor
+        st.session_state["search_params"] = search_params
         st.session_state["last_search_term"] = search_term.strip()
         st.session_state["selected_degree"] = None
         st.rerun()
 
+    # Subject search over every plan already cached (no RUCT round trips)
+    _sidx = _subject_index()
+    if len(_sidx):
+        with st.expander(f"🔎 Buscar titulaciones por asignatura ({len(_sidx):,} planes indexados)"):
+            col_q, col_c = st.columns([4, 1.4])
+            with col_q:
+                subj_q = st.text_input(
+                    "Asignatura", placeholder="Ej: Machine Learning, Anatomía…",
+                    key="subject_query",
+                )
+            with col_c:
+                subj_curso = st.selectbox(
+                    "Curso", ["Todos", "1º", "2º", "3º", "4º", "5º", "6º"], key="subject_curso",
+                )
+            if subj_q.strip():
+                hits = _sidx.search(subj_q, curso=None if subj_curso == "Todos" else subj_curso)
+                if hits:
+                    st.caption(
+                        f"{len({h['codigo'] for h in hits}):,} titulaciones · {len(hits):,} asignaturas"
+                    )
+                    st.dataframe(
+                        pd.DataFrame(hits)[["titulo", "universidad", "asignatura", "curso", "ects"]],
+                        hide_index=True, use_container_width=True,
+                    )
+                else:
+                    st.caption("Ningún plan indexado contiene esa asignatura.")
+
+    if st.button("📊 Estadísticas del catálogo", key="open_analytics"):
+        st.session_state["analytics"] = True
+        st.rerun()
+
 
 # =====================================================================
 # STATE 2 - DETAIL
@@ -1887,26 +826,47 @@ elif selected:
         '</script>',
         unsafe_allow_html=True,
     )
-    if "study_plans" not in st.session_state:
-        st.session_state["study_plans"] = {}
+    study_plans = session_lru(st.session_state, "study_plans")
     plan_key = f"{selected['title']}|||{selected['university']}"
 
     # Invalidate cached plan if it was built by an older code version
-    _PLAN_VERSION = "v31"
-    cached = st.session_state["study_plans"].get(plan_key)
-    if cached is not None and cached.get("_v") != _PLAN_VERSION:
-        del st.session_state["study_plans"][plan_key]
-
-    if plan_key not in st.session_state["study_plans"]:
-        with st.spinner("Cargando ficha y plan de estudios…"):
-            st.session_state["study_plans"][plan_key] = _find_study_plan(
-                selected["title"],
-                selected["university"],
-                selected.get("url_ruct", ""),
-                selected.get("url_plan", ""),
-            )
-
-    plan  = st.session_state["study_plans"][plan_key]
+    plan = deref(study_plans.get(plan_key))
+    if plan is not None and plan.get("_v") != _PLAN_VERSION:
+        del study_plans[plan_key]
+        plan = None
+
+    codigo_sel = selected.get("codigo") or _codigo_from_url(selected.get("url_ruct", ""))
+    plan_pending = False
+    if plan is None:
+        # The plan loads in the background; the ficha card renders as soon as it is parsed
+        job = _detail_jobs(plan_key, selected, codigo_sel)
+        if job["plan"].done():
+            st.session_state["detail_jobs"].pop(plan_key, None)
+            try:
+                got = job["plan"].result()
+            except Exception as e:
+                # Shown like a failed scrape (not kept: the next visit tries again)
+                logging.getLogger(__name__).warning(f"Plan {codigo_sel} failed: {e}")
+                got = None
+            if got is None:
+                plan = {"ficha": {}, "_stale": False, "_stored_at": None}
+            else:
+                meta = {"_stale": got.stale, "_stored_at": got.stored_at}
+                if got.stored_at is not None:
+                    if codigo_sel not in _subject_index().degrees:
+                        _journal_plan(codigo_sel, got.value, selected["title"], selected["university"])
+                    # Sessions viewing the same degree share one decoded plan
+                    study_plans[plan_key] = share("plan", codigo_sel, got.value, meta)
+                else:
+                    study_plans[plan_key] = {**got.value, **meta}
+                plan = deref(study_plans[plan_key])
+        else:
+            plan_pending = True
+            ficha_fut = job.get("ficha")
+            quick = None
+            if ficha_fut is not None and ficha_fut.done() and ficha_fut.exception() is None:
+                quick = ficha_fut.result()
+            plan = {"ficha": quick or {}}
     ficha = plan.get("ficha", {})
 
     denom = ficha.get("denominacion") or selected["title"]
@@ -1946,6 +906,7 @@ elif selected:
         elif len(comp_list_det) < 4:
             if st.button("+ Comparar", key="det_comp", use_container_width=True):
                 st.session_state["comparison_list"] = comp_list_det + [{
+                    "codigo": codigo_sel,
                     "title": selected["title"],
                     "university": selected["university"],
                     "url_ruct": selected.get("url_ruct", ""),
@@ -1955,9 +916,26 @@ elif selected:
 
     st.divider()
 
+    if plan.get("_stale") and plan.get("_stored_at"):
+        fecha = time.strftime("%d/%m/%Y", time.localtime(plan["_stored_at"]))
+        st.markdown(
+            f'<div class="warn-box">⚠️ Datos guardados el {fecha}; se están actualizando '
+            'con el RUCT y el BOE en segundo plano.</div>',
+            unsafe_allow_html=True,
+        )
+    elif not plan_pending and plan.get("_stored_at") is None and resilience.is_open(ruct_scraper.BASE_URL):
+        st.markdown(
+            '<div class="warn-box">⚠️ El RUCT no responde en este momento y esta titulación '
+            'no está guardada. Inténtalo de nuevo en unos minutos.</div>',
+            unsafe_allow_html=True,
+        )
+
     tab_ficha, tab_plan = st.tabs(["📋 Ficha", "📄 Plan de estudios"])
 
     with tab_ficha:
+        if plan_pending and not ficha:
+            st.markdown('<div class="info-box">⏳ Cargando ficha del RUCT…</div>', unsafe_allow_html=True)
+
         def _fc(label, value, highlight=False):
             if not value:
                 return ""
@@ -1985,7 +963,8 @@ elif selected:
         )
         if es_hab and ficha.get("profesion_regulada"):
             grid_html += _fc("Profesión regulada", ficha.get("profesion_regulada"))
-        st.markdown(f'<div class="ficha-grid">{grid_html}</div>', unsafe_allow_html=True)
+        if ficha:
+            st.markdown(f'<div class="ficha-grid">{grid_html}</div>', unsafe_allow_html=True)
 
         menciones      = ficha.get("menciones", [])
         especialidades = ficha.get("especialidades", [])
@@ -2000,129 +979,226 @@ elif selected:
                 cred = f" ({e['creditos']} ECTS)" if e.get("creditos") else ""
                 st.markdown(f"- {e['nombre']}{cred}")
 
+        # Degrees with the most similar curriculum (precomputed MinHash/LSH index)
+        _sim = _similarity_index(similarity.index_version())
+        similares = _sim.similar_to_plan(plan, k=5, codigo=codigo_sel) if len(_sim) and not plan_pending else []
+        similares = [h for h in similares if h.get("url_ruct") and h["codigo"] != codigo_sel]
+        if similares:
+            st.markdown("**Titulaciones con plan de estudios similar:**")
+            for j, h in enumerate(similares):
+                col_sim, col_sim_btn = st.columns([6, 1])
+                with col_sim:
+                    st.markdown(
+                        f'<span class="result-title">{h.get("titulo", "")}</span>'
+                        f'<span class="nivel-pill">{h["score"]:.0%}</span>'
+                        f'<br><span class="result-univ">{h.get("universidad", "")}</span>',
+                        unsafe_allow_html=True,
+                    )
+                with col_sim_btn:
+                    if st.button("Ver", key=f"sim_{j}", use_container_width=True):
+                        st.session_state["selected_degree"] = {
+                            "codigo": h["codigo"],
+                            "title": h.get("titulo", ""),
+                            "university": h.get("universidad", ""),
+                            "url_ruct": h.get("url_ruct", ""),
+                            "url_plan": h.get("url_plan", ""),
+                        }
+                        warmup.log_degrees("view", [st.session_state["selected_degree"]])
+                        st.rerun()
+
     with tab_plan:
-        src = plan.get("source_url", "")
-        if src:
-            btn_label = "Ver en el BOE →" if "boe.es" in src else "Ver plan de estudios →"
-            st.link_button(btn_label, src, use_container_width=False)
-
-
-        # Try structured subject table: BOE subjects (pre-parsed), then RUCT modules, then ECTS summary
-        subjects = plan.get("subjects_boe", [])
-        if not subjects:
-            subjects = plan.get("subjects_ruct", [])
-        _creditos_summary = False
-        if not subjects:
-            creditos = ficha.get("creditos", {})
-            if creditos:
-                subjects = [
-                    {"nombre": v["nombre"], "caracter": v["nombre"], "categoria": cat,
-                     "ects": v["ects"], "curso": "", "semestre": ""}
-                    for cat, v in creditos.items()
-                ]
-                _creditos_summary = True
-
-        if subjects:
-            if _creditos_summary:
-                if src:
-                    st.info(
-                        "No se pudo obtener el listado detallado de asignaturas. "
-                        "Se muestra la distribución de créditos registrada en el RUCT. "
-                        "Puedes consultar el plan completo en el BOE usando el botón de arriba."
+        if plan_pending:
+            _await_detail(plan_key, ficha_shown=bool(ficha))
+        else:
+            src = plan.get("source_url", "")
+            if src:
+                btn_label = "Ver en el BOE →" if "boe.es" in src else "Ver plan de estudios →"
+                st.link_button(btn_label, src, use_container_width=False)
+
+
+            # Try structured subject table: BOE subjects (pre-parsed), then RUCT modules, then ECTS summary
+            subjects = plan.get("subjects_boe", [])
+            if not subjects:
+                subjects = plan.get("subjects_ruct", [])
+            _creditos_summary = False
+            if not subjects:
+                creditos = ficha.get("creditos", {})
+                if creditos:
+                    subjects = [
+                        {"nombre": v["nombre"], "caracter": v["nombre"], "categoria": cat,
+                         "ects": v["ects"], "curso": "", "semestre": ""}
+                        for cat, v in creditos.items()
+                    ]
+                    _creditos_summary = True
+
+            if subjects:
+                if _creditos_summary:
+                    if src:
+                        st.info(
+                            "No se pudo obtener el listado detallado de asignaturas. "
+                            "Se muestra la distribución de créditos registrada en el RUCT. "
+                            "Puedes consultar el plan completo en el BOE usando el botón de arriba."
+                        )
+                    else:
+                        st.info(
+                            "El plan de estudios detallado de esta titulación aún no está publicado "
+                            "en el BOE. Se muestra la distribución de créditos registrada en el RUCT."
+                        )
+                # Colour map reusing comparison palette
+                _SCAT_COLORS = {
+                    "basica": "#1B3A6B", "obligatoria": "#0E7490",
+                    "optativa": "#D97706", "practicas": "#7C3AED",
+                    "tfg_tfm": "#059669", "otros": "#9CA3AF",
+                }
+                _SCAT_LABELS = {
+                    "basica": "Básica", "obligatoria": "Obligatoria",
+                    "optativa": "Optativa", "practicas": "Prácticas",
+                    "tfg_tfm": "TFG/TFM", "otros": "Otros",
+                }
+
+                # Group by curso
+                cursos: dict = {}
+                for s in subjects:
+                    key = s["curso"].strip() or "Sin curso"
+                    cursos.setdefault(key, []).append(s)
+
+                # Sort curso keys: numeric first, then text
+                def _curso_key(k):
+                    import re as _re
+                    m = _re.search(r"\d+", k)
+                    return (0, int(m.group())) if m else (1, k)
+
+                th_style = "padding:0.35rem 0.6rem;text-align:left;font-size:0.75rem;font-weight:600;background:#F3F4F6;border-bottom:2px solid #E5E7EB;white-space:nowrap;"
+                td_style = "padding:0.3rem 0.6rem;font-size:0.78rem;border-bottom:1px solid #F3F4F6;vertical-align:top;"
+
+                def _sem_key(s):
+                    import re as _re
+                    sem = s.get("semestre", "")
+                    m = _re.search(r"\d+", sem)
+                    return (int(m.group()) if m else 9, s.get("nombre", ""))
+
+                for curso_key in sorted(cursos.keys(), key=_curso_key):
+                    asigs = sorted(cursos[curso_key], key=_sem_key)
+                    label = f"📚 {curso_key}" if curso_key != "Sin curso" else "📚 Módulos y materias"
+                    total_ects = sum(a["ects"] for a in asigs)
+                    st.markdown(
+                        f'<div style="margin:1rem 0 0.4rem;font-size:0.88rem;font-weight:700;'
+                        f'color:#1B3A6B;">{label} &nbsp;'
+                        f'<span style="font-weight:400;color:#6B7280;font-size:0.78rem;">({total_ects:.0f} ECTS)</span></div>',
+                        unsafe_allow_html=True,
                     )
-                else:
-                    st.info(
-                        "El plan de estudios detallado de esta titulación aún no está publicado "
-                        "en el BOE. Se muestra la distribución de créditos registrada en el RUCT."
+                    rows_html = ""
+                    for a in asigs:
+                        color = _SCAT_COLORS.get(a["categoria"], "#9CA3AF")
+                        cat_label = _SCAT_LABELS.get(a["categoria"], "Otros")
+                        badge = f'<span style="background:{color};color:#fff;padding:0.1rem 0.45rem;border-radius:10px;font-size:0.68rem;font-weight:600;white-space:nowrap;">{cat_label}</span>'
+                        sem_cell = f'<td style="{td_style}color:#6B7280;">{a["semestre"]}</td>' if a["semestre"] else ""
+                        rows_html += (
+                            f'<tr>'
+                            f'<td style="{td_style}">{a["nombre"]}</td>'
+                            f'<td style="{td_style}">{badge}</td>'
+                            f'<td style="{td_style};text-align:right;font-weight:600;">{a["ects"]:.0f}</td>'
+                            f'{sem_cell}'
+                            f'</tr>'
+                        )
+                    has_sem = any(a["semestre"] for a in asigs)
+                    sem_th = f'<th style="{th_style}width:80px;">Semestre</th>' if has_sem else ""
+                    sem_col_def = '<col style="width:80px;">' if has_sem else ""
+                    st.markdown(
+                        f'<div style="overflow-x:auto;margin-bottom:1rem;">'
+                        f'<table style="border-collapse:collapse;width:100%;table-layout:fixed;font-family:Inter,sans-serif;">'
+                        f'<colgroup><col><col style="width:130px;"><col style="width:60px;">{sem_col_def}</colgroup>'
+                        f'<thead><tr>'
+                        f'<th style="{th_style}">Asignatura</th>'
+                        f'<th style="{th_style}">Tipo</th>'
+                        f'<th style="{th_style};text-align:right;">ECTS</th>'
+                        f'{sem_th}'
+                        f'</tr></thead>'
+                        f'<tbody>{rows_html}</tbody>'
+                        f'</table></div>',
+                        unsafe_allow_html=True,
                     )
-            # Colour map reusing comparison palette
-            _SCAT_COLORS = {
-                "basica": "#1B3A6B", "obligatoria": "#0E7490",
-                "optativa": "#D97706", "practicas": "#7C3AED",
-                "tfg_tfm": "#059669", "otros": "#9CA3AF",
-            }
-            _SCAT_LABELS = {
-                "basica": "Básica", "obligatoria": "Obligatoria",
-                "optativa": "Optativa", "practicas": "Prácticas",
-                "tfg_tfm": "TFG/TFM", "otros": "Otros",
-            }
-
-            # Group by curso
-            cursos: dict = {}
-            for s in subjects:
-                key = s["curso"].strip() or "Sin curso"
-                cursos.setdefault(key, []).append(s)
-
-            # Sort curso keys: numeric first, then text
-            def _curso_key(k):
-                import re as _re
-                m = _re.search(r"\d+", k)
-                return (0, int(m.group())) if m else (1, k)
-
-            th_style = "padding:0.35rem 0.6rem;text-align:left;font-size:0.75rem;font-weight:600;background:#F3F4F6;border-bottom:2px solid #E5E7EB;white-space:nowrap;"
-            td_style = "padding:0.3rem 0.6rem;font-size:0.78rem;border-bottom:1px solid #F3F4F6;vertical-align:top;"
-
-            def _sem_key(s):
-                import re as _re
-                sem = s.get("semestre", "")
-                m = _re.search(r"\d+", sem)
-                return (int(m.group()) if m else 9, s.get("nombre", ""))
-
-            for curso_key in sorted(cursos.keys(), key=_curso_key):
-                asigs = sorted(cursos[curso_key], key=_sem_key)
-                label = f"📚 {curso_key}" if curso_key != "Sin curso" else "📚 Módulos y materias"
-                total_ects = sum(a["ects"] for a in asigs)
+            elif plan.get("page_text"):
+                st.markdown(plan["page_text"])
+            elif src:
                 st.markdown(
-                    f'<div style="margin:1rem 0 0.4rem;font-size:0.88rem;font-weight:700;'
-                    f'color:#1B3A6B;">{label} &nbsp;'
-                    f'<span style="font-weight:400;color:#6B7280;font-size:0.78rem;">({total_ects:.0f} ECTS)</span></div>',
+                    '<div class="info-box">El plan de estudios está disponible en el BOE. '
+                    'Pulsa el botón de arriba para consultarlo directamente.</div>',
                     unsafe_allow_html=True,
                 )
-                rows_html = ""
-                for a in asigs:
-                    color = _SCAT_COLORS.get(a["categoria"], "#9CA3AF")
-                    cat_label = _SCAT_LABELS.get(a["categoria"], "Otros")
-                    badge = f'<span style="background:{color};color:#fff;padding:0.1rem 0.45rem;border-radius:10px;font-size:0.68rem;font-weight:600;white-space:nowrap;">{cat_label}</span>'
-                    sem_cell = f'<td style="{td_style}color:#6B7280;">{a["semestre"]}</td>' if a["semestre"] else ""
-                    rows_html += (
-                        f'<tr>'
-                        f'<td style="{td_style}">{a["nombre"]}</td>'
-                        f'<td style="{td_style}">{badge}</td>'
-                        f'<td style="{td_style};text-align:right;font-weight:600;">{a["ects"]:.0f}</td>'
-                        f'{sem_cell}'
-                        f'</tr>'
-                    )
-                has_sem = any(a["semestre"] for a in asigs)
-                sem_th = f'<th style="{th_style}width:80px;">Semestre</th>' if has_sem else ""
-                sem_col_def = '<col style="width:80px;">' if has_sem else ""
+            else:
                 st.markdown(
-                    f'<div style="overflow-x:auto;margin-bottom:1rem;">'
-                    f'<table style="border-collapse:collapse;width:100%;table-layout:fixed;font-family:Inter,sans-serif;">'
-                    f'<colgroup><col><col style="width:130px;"><col style="width:60px;">{sem_col_def}</colgroup>'
-                    f'<thead><tr>'
-                    f'<th style="{th_style}">Asignatura</th>'
-                    f'<th style="{th_style}">Tipo</th>'
-                    f'<th style="{th_style};text-align:right;">ECTS</th>'
-                    f'{sem_th}'
-                    f'</tr></thead>'
-                    f'<tbody>{rows_html}</tbody>'
-                    f'</table></div>',
+                    '<div class="warn-box">⚠️ No se pudo obtener el plan de estudios. '
+                    'Consulta la ficha oficial usando el botón «Ver ficha en el RUCT →».</div>',
                     unsafe_allow_html=True,
                 )
-        elif plan.get("page_text"):
-            st.markdown(plan["page_text"])
-        elif src:
-            st.markdown(
-                '<div class="info-box">El plan de estudios está disponible en el BOE. '
-                'Pulsa el botón de arriba para consultarlo directamente.</div>',
-                unsafe_allow_html=True,
-            )
-        else:
-            st.markdown(
-                '<div class="warn-box">⚠️ No se pudo obtener el plan de estudios. '
-                'Consulta la ficha oficial usando el botón «Ver ficha en el RUCT →».</div>',
-                unsafe_allow_html=True,
-            )
+
+
+# =====================================================================
+# STATE - LARGE-N COMPARISON (vectorized, up to comparator.MAX_COMPARE)
+# =====================================================================
+elif st.session_state.get("comparing_all"):
+    group = st.session_state["comparing_all"]
+
+    col_back, col_title = st.columns([2, 5])
+    with col_back:
+        if st.button("← Volver a resultados", key="_back_all", use_container_width=True, type="primary"):
+            st.session_state["comparing_all"] = None
+            st.session_state.pop("comparing_all_fichas", None)
+            st.rerun()
+    with col_title:
+        st.markdown(
+            '<p style="margin:0.55rem 0 0;font-size:0.85rem;font-weight:600;color:#111827;">'
+            f'Comparando {len(group)} titulaciones</p>',
+            unsafe_allow_html=True,
+        )
+    st.divider()
+
+    if "comparing_all_fichas" not in st.session_state:
+        bar = st.progress(0.0, text="Cargando fichas del RUCT…")
+        fichas_all = comparator.fetch_fichas(
+            group, _fetch_ruct_ficha_quick, workers=8,
+            progress_callback=lambda done, total: bar.progress(
+                done / max(total, 1), text=f"Cargando fichas del RUCT… {done}/{total}"
+            ),
+        )
+        bar.empty()
+        # The session keeps references; the fichas live in the shared LRU / SQLite cache
+        st.session_state["comparing_all_fichas"] = _share_fichas(group, fichas_all)
+    else:
+        fichas_all = _resolve_fichas(group, st.session_state["comparing_all_fichas"])
+
+    m_all = comparator.ects_matrix(fichas_all)
+    res_all = comparator.compare_matrix(m_all)
+    df_cmp = comparator.comparison_frame(group, fichas_all, res_all, m_all)
+
+    n_missing = int((~res_all["valid"]).sum())
+    if n_missing:
+        st.markdown(
+            f'<div class="warn-box">⚠️ {n_missing} titulaciones sin distribución de créditos '
+            f'publicada no se incluyen en la comparación.</div>',
+            unsafe_allow_html=True,
+        )
+
+    if not df_cmp.empty:
+        mean_cols = st.columns(len(comparator.ECTS_CATS))
+        for col, cat, mean in zip(mean_cols, comparator.ECTS_CATS, res_all["mean"]):
+            col.metric(f"{comparator.ECTS_LABELS[cat]} (media)", f"{mean * 100:.1f} %")
+
+        sort_opts = ["Total ECTS"] + [f"{comparator.ECTS_LABELS[c]} %" for c in comparator.ECTS_CATS]
+        sort_by = st.selectbox("Ordenar por", sort_opts, index=3)
+        df_cmp = df_cmp.sort_values(sort_by, ascending=False, ignore_index=True)
+        st.caption("Δ = diferencia en puntos porcentuales respecto a la media del grupo.")
+        st.dataframe(
+            df_cmp.style.apply(comparator.delta_styles, axis=None).format(precision=1),
+            hide_index=True, use_container_width=True, height=min(38 + 35 * len(df_cmp), 720),
+        )
+    else:
+        st.markdown(
+            '<div class="warn-box">⚠️ Ninguna de estas titulaciones tiene la distribución '
+            'de créditos registrada en el RUCT.</div>',
+            unsafe_allow_html=True,
+        )
 
 
 # =====================================================================
@@ -2165,37 +1241,52 @@ elif st.session_state.get("comparing"):
     }
 
     # Fetch data for each degree in comparison list
-    if "comparison_data" not in st.session_state:
-        st.session_state["comparison_data"] = {}
+    comparison_data = session_lru(st.session_state, "comparison_data", max_items=8)
+    study_plans = session_lru(st.session_state, "study_plans")
+
+    # Fetch every missing ficha concurrently (session plans first, then shared cache)
+    missing = []
+    for deg in comp_list:
+        key = deg["url_ruct"] or f"{deg['title']}|||{deg['university']}"
+        if key not in comparison_data:
+            plan_key = f"{deg['title']}|||{deg['university']}"
+            cached_plan = deref(study_plans.get(plan_key))
+            if not (cached_plan and cached_plan.get("ficha", {}).get("creditos")):
+                missing.append(deg)
+    fetched = {}
+    if missing:
+        with st.spinner(f"Cargando {len(missing)} titulaciones…"):
+            fetched = dict(zip(
+                (d["url_ruct"] or f"{d['title']}|||{d['university']}" for d in missing),
+                comparator.fetch_fichas(missing, _fetch_ruct_ficha_quick),
+            ))
 
     degrees_data = []
     for deg in comp_list:
         key = deg["url_ruct"] or f"{deg['title']}|||{deg['university']}"
-        if key not in st.session_state["comparison_data"]:
-            with st.spinner(f"Cargando {deg['title'][:50]}…"):
-                # Use full cached plan if already loaded, else quick fetch (no subjects)
-                plan_key = f"{deg['title']}|||{deg['university']}"
-                cached_plan = st.session_state.get("study_plans", {}).get(plan_key)
-                if cached_plan and cached_plan.get("ficha", {}).get("creditos"):
-                    ficha = cached_plan["ficha"]
-                else:
-                    ficha = _fetch_ruct_ficha_quick(
-                        deg.get("url_ruct", ""), deg.get("url_plan", "")
-                    )
-                creditos = ficha.get("creditos", {})
-                ects = {
-                    "basica":      round(creditos.get("basica",      {}).get("ects", 0)),
-                    "obligatoria": round(creditos.get("obligatoria", {}).get("ects", 0)),
-                    "optativa":    round(creditos.get("optativa",    {}).get("ects", 0)),
-                    "practicas":   round(creditos.get("practicas",   {}).get("ects", 0)),
-                    "tfg_tfm":     round(creditos.get("tfg_tfm",     {}).get("ects", 0)),
-                    "otros":       0,
-                }
-                ects["total"] = sum(ects[k] for k in ects if k != "total")
-                st.session_state["comparison_data"][key] = {
-                    "deg": deg, "ficha": ficha, "ects": ects,
-                }
-        degrees_data.append(st.session_state["comparison_data"][key])
+        if key not in comparison_data:
+            # Use full cached plan if already loaded, else quick fetch (no subjects)
+            plan_key = f"{deg['title']}|||{deg['university']}"
+            cached_plan = deref(study_plans.get(plan_key))
+            if cached_plan and cached_plan.get("ficha", {}).get("creditos"):
+                ficha = cached_plan["ficha"]
+            else:
+                ficha = fetched.get(key, {})
+            creditos = ficha.get("creditos", {})
+            ects = {
+                "basica":      round(creditos.get("basica",      {}).get("ects", 0)),
+                "obligatoria": round(creditos.get("obligatoria", {}).get("ects", 0)),
+                "optativa":    round(creditos.get("optativa",    {}).get("ects", 0)),
+                "practicas":   round(creditos.get("practicas",   {}).get("ects", 0)),
+                "tfg_tfm":     round(creditos.get("tfg_tfm",     {}).get("ects", 0)),
+                "otros":       0,
+            }
+            ects["total"] = sum(ects[k] for k in ects if k != "total")
+            comparison_data[key] = {
+                "deg": deg, "ficha": _share_fichas([deg], [ficha])[0], "ects": ects,
+            }
+        entry = comparison_data[key]
+        degrees_data.append({**entry, "ficha": _resolve_fichas([deg], [entry["ficha"]])[0]})
 
     # Split into degrees with and without ECTS data
     degrees_ok   = [d for d in degrees_data if d["ects"]["total"] > 0]
@@ -2335,6 +1426,18 @@ elif df_res is not None:
     if warning:
         st.markdown(f'<div class="warn-box">⚠️ {warning}</div>', unsafe_allow_html=True)
 
+    # A search cut short (timeout, page limit) continues from its last page
+    _cursor = st.session_state.get("search_cursor")
+    if _cursor is not None and _cursor.resumable and not df_res.empty:
+        if st.button(f"Cargar más resultados (desde la página {_cursor.page + 1})", key="_load_more"):
+            with st.spinner("Cargando más resultados del RUCT…"):
+                df_more, warn_more = ruct_scraper.resume_search_cached(
+                    _cursor, df_res, **st.session_state.get("search_params", {}),
+                )
+            st.session_state["df_resultados"] = df_more
+            st.session_state["warning_scraper"] = warn_more
+            st.rerun()
+
     if df_res.empty:
         if not warning:
             last_term = st.session_state.get("last_search_term", "")
@@ -2376,7 +1479,8 @@ elif df_res is not None:
             if n_comp >= 2:
                 if st.button(f"Comparar ({n_comp})", use_container_width=True, type="primary"):
                     st.session_state["comparing"] = True
-                    st.session_state["comparison_data"] = {}
+                    warmup.log_degrees("compare", comp_list)
+                    session_lru(st.session_state, "comparison_data", max_items=8).clear()
                     st.rerun()
                 if n_comp < 4:
                     st.caption(f"Puedes añadir {4 - n_comp} más")
@@ -2398,18 +1502,68 @@ elif df_res is not None:
             univs_opts = ["Todas las universidades"] + sorted(df_res["universidad"].dropna().unique().tolist())
             filter_univ = st.selectbox("universidad", univs_opts, label_visibility="collapsed")
 
+        # Facets from the catalogue snapshot; counts follow the other facets' selections
+        _facet_sel = {}
+        _snapshot_version = catalogue.snapshot_version()
+        if _snapshot_version and "codigo" in df_res:
+            _fidx = _facet_index(_snapshot_version)
+            _base = _fidx.rows_of(df_res["codigo"])
+            if _base.any():
+                _cols = [c for c in FACETS if c in _fidx.values and c != "universidad"]
+                _current = {c: st.session_state.get(f"facet_{c}", []) for c in _cols}
+                _counts = _fidx.counts(_current, _base)
+                with st.expander("Filtrar por comunidad, rama, nivel…",
+                                 expanded=any(_current.values())):
+                    _fcols = st.columns(3)
+                    for i, col in enumerate(_cols):
+                        opts = sorted(set(_counts[col]) | set(_current[col]))
+                        if len(opts) < 2 and not _current[col]:
+                            continue
+                        with _fcols[i % 3]:
+                            _facet_sel[col] = st.multiselect(
+                                FACETS[col], opts, key=f"facet_{col}",
+                                format_func=lambda v, c=col: f"{v} ({_counts[c].get(v, 0):,})",
+                            )
+                if any(_facet_sel.values()):
+                    _keep = _fidx.df["codigo"][_fidx.mask(_facet_sel, _base)]
+                    df_res_faceted = df_res[df_res["codigo"].isin(_keep)]
+                else:
+                    df_res_faceted = df_res
+            else:
+                df_res_faceted = df_res
+        else:
+            df_res_faceted = df_res
+
         # Apply filters
-        filtered = df_res.copy()
+        filtered = df_res_faceted.copy()
         if filter_title:
             filtered = filtered[filtered["titulo"].str.contains(filter_title, case=False, na=False)]
         if filter_univ != "Todas las universidades":
             filtered = filtered[filtered["universidad"] == filter_univ]
 
         n_filt = len(filtered)
-        if n_filt != n:
-            st.caption(f"Mostrando {n_filt:,} de {n:,} resultados")
-        else:
-            st.caption(f"{n_filt:,} resultados")
+        col_cap, col_all = st.columns([5, 2])
+        with col_cap:
+            if n_filt != n:
+                st.caption(f"Mostrando {n_filt:,} de {n:,} resultados")
+            else:
+                st.caption(f"{n_filt:,} resultados")
+        with col_all:
+            if 2 <= n_filt <= comparator.MAX_COMPARE:
+                if st.button(f"Comparar ECTS de todos ({n_filt})", use_container_width=True):
+                    st.session_state["comparing_all"] = [
+                        {
+                            "codigo": r.get("codigo", ""),
+                            "title": r["titulo"],
+                            "university": r["universidad"],
+                            "url_ruct": r.get("url_ruct", ""),
+                            "url_plan": r.get("url_plan", ""),
+                        }
+                        for _, r in filtered.iterrows()
+                    ]
+                    warmup.log_degrees("compare", st.session_state["comparing_all"])
+                    st.session_state.pop("comparing_all_fichas", None)
+                    st.rerun()
 
         # Results rows
         for i, (_, row) in enumerate(filtered.iterrows()):
@@ -2431,11 +1585,13 @@ elif df_res is not None:
             with col_btn:
                 if st.button("Ver", key=f"view_{i}", use_container_width=True):
                     st.session_state["selected_degree"] = {
+                        "codigo": row.get("codigo", ""),
                         "title": row["titulo"],
                         "university": row["universidad"],
                         "url_ruct": row.get("url_ruct", ""),
                         "url_plan": row.get("url_plan", ""),
                     }
+                    warmup.log_degrees("view", [st.session_state["selected_degree"]])
                     st.rerun()
             with col_comp_btn:
                 if is_in_comp:
@@ -2449,6 +1605,7 @@ elif df_res is not None:
                     disabled = len(comp_list) >= 4
                     if st.button("+", key=f"comp_{i}", use_container_width=True, disabled=disabled):
                         comp_list.append({
+                            "codigo": row.get("codigo", ""),
                             "title": row["titulo"],
                             "university": row["universidad"],
                             "url_ruct": row.get("url_ruct", ""),
@@ -2456,3 +1613,12 @@ elif df_res is not None:
                         })
                         st.session_state["comparison_list"] = comp_list
                         st.rerun()
+
+
+# ─── Memory report (?memoria=1) ───────────────────────────────────────────────
+if st.query_params.get("memoria") == "1":
+    with st.expander("🧠 Memoria del proceso", expanded=True):
+        st.json(memory_report())
+
+
+profiling.finish_rerun(st.session_state)
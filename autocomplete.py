@@ -0,0 +1,140 @@
+"""
+autocomplete.py
+Degree-name autocomplete for the search box, from the catalogue snapshot.
+
+Official titles ("Graduado o Graduada en Ingeniería Informática por la
+Universidad de X") are reduced to the degree name ("Ingeniería Informática"),
+and each name's popularity is the number of degrees that share it. Names are
+indexed as a sorted array of accent-folded keys (the name and each of its
+word suffixes), so "ingenieria inf" and "informat" both find "Ingeniería
+Informática" with two binary searches. An exact name sent to the RUCT is a
+narrow search (or a cache hit) instead of a vague multi-page crawl.
+
+    python autocomplete.py "informat"
+"""
+
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+
+import catalogue
+from ruct_scraper import _strip_accents
+
+# "Graduado o Graduada en …", "Máster Universitario en …", "Programa de Doctorado en …"
+_DEGREE_PREFIX_RE = re.compile(
+    r"^(?:graduad[oa](?:\s+o\s+graduad[oa])?|m[aá]ster\s+universitario|"
+    r"programa\s+de\s+doctorado|doctor(?:a)?(?:\s+o\s+doctor(?:a)?)?)\s+(?:en\s+|por\s+)?",
+    re.IGNORECASE,
+)
+# "… por la Universidad de X", "… por el Centro …"
+_DEGREE_SUFFIX_RE = re.compile(r"\s+por\s+(?:la|el|las|los)\s+.*$|\s+por\s+(?=universi).*$", re.IGNORECASE)
+
+
+def degree_name(titulo: str) -> str:
+    """The degree name inside an official RUCT title (the title itself if nothing is stripped)."""
+    titulo = " ".join(str(titulo or "").split())
+    name = _DEGREE_SUFFIX_RE.sub("", _DEGREE_PREFIX_RE.sub("", titulo)).strip(" ,.-")
+    return name or titulo
+
+
+def _fold(text: str) -> str:
+    return " ".join(_strip_accents(text).lower().split())
+
+
+class Autocomplete:
+    """Sorted-array prefix index over degree names, ranked by popularity."""
+
+    def __init__(self, titles, extra_popularity: dict | None = None):
+        counts: dict[str, int] = {}
+        spellings: dict[str, dict[str, int]] = {}
+        for titulo in titles:
+            name = degree_name(titulo)
+            if not name:
+                continue
+            key = _fold(name)
+            counts[key] = counts.get(key, 0) + 1
+            spellings.setdefault(key, {})
+            spellings[key][name] = spellings[key].get(name, 0) + 1
+        for key, n in (extra_popularity or {}).items():
+            if key in counts:
+                counts[key] += n
+
+        folded = sorted(counts)
+        # Display the most frequent spelling of each folded name
+        self.names = [max(spellings[k].items(), key=lambda kv: kv[1])[0] for k in folded]
+        self.popularity = np.array([counts[k] for k in folded], dtype=np.int64)
+        self._starts = np.array(folded) if folded else np.array([], dtype=str)
+
+        keys, ids = [], []
+        for i, k in enumerate(folded):
+            for m in re.finditer(r"(?:^|\s)(\S)", k):
+                keys.append(k[m.start(1):])
+                ids.append(i)
+        order = np.argsort(np.array(keys, dtype=str), kind="stable") if keys else np.array([], dtype=np.int64)
+        self._keys = np.array(keys, dtype=str)[order] if keys else np.array([], dtype=str)
+        self._key_ids = np.array(ids, dtype=np.int64)[order] if keys else np.array([], dtype=np.int64)
+        self._by_popularity = np.lexsort((np.arange(len(folded)), -self.popularity))
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def top(self, k: int | None = None) -> list[str]:
+        """Names by decreasing popularity."""
+        return [self.names[i] for i in self._by_popularity[:k]]
+
+    def suggest(self, prefix: str, k: int = 10) -> list[dict]:
+        """
+        Up to k names whose text, or one of whose words, starts with `prefix`
+        (accents and case ignored): names starting with it first, then by
+        popularity. Returns [{"nombre", "ofertas"}].
+        """
+        p = _fold(prefix)
+        if not p:
+            ids = self._by_popularity[:k]
+        else:
+            lo, hi = np.searchsorted(self._keys, [p, p + "\uffff"])
+            ids = np.unique(self._key_ids[lo:hi])
+            if not len(ids):
+                return []
+            starts = np.char.startswith(self._starts[ids], p)
+            ids = ids[np.lexsort((ids, -self.popularity[ids], ~starts))][:k]
+        return [{"nombre": self.names[i], "ofertas": int(self.popularity[i])} for i in ids]
+
+    @classmethod
+    def from_snapshot(cls, path: str = catalogue.SNAPSHOT_PATH, extra_popularity: dict | None = None) -> "Autocomplete":
+        df = catalogue.load_snapshot(path)
+        return cls(df["titulo"] if "titulo" in df else pd.Series(dtype=str), extra_popularity)
+
+
+_current: tuple[str, Autocomplete] | None = None
+_current_lock = threading.Lock()
+
+
+def current() -> Autocomplete:
+    """Process-wide index of the current snapshot, rebuilt when the snapshot changes."""
+    global _current
+    version = catalogue.snapshot_version()
+    with _current_lock:
+        if _current is None or _current[0] != version:
+            _current = (version, Autocomplete.from_snapshot())
+        return _current[1]
+
+
+if __name__ == "__main__":
+    import time
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Sugerencias de denominaciones del catálogo.")
+    parser.add_argument("prefijo")
+    parser.add_argument("-n", type=int, default=10)
+    args = parser.parse_args()
+
+    index = Autocomplete.from_snapshot()
+    t0 = time.perf_counter()
+    hits = index.suggest(args.prefijo, args.n)
+    ms = (time.perf_counter() - t0) * 1000
+    for h in hits:
+        print(f"{h['ofertas']:>5}  {h['nombre']}")
+    print(f"{len(hits)} sugerencias de {len(index):,} denominaciones en {ms:.2f} ms")
@@ -0,0 +1,115 @@
+"""
+cache_store.py
+Persistent local cache shared by every Streamlit worker and the offline tools.
+Values (study plans, fichas, searches…) are stored as JSON in a SQLite file,
+keyed by (kind, key), together with the time they were stored. Plans and
+fichas go through the compact codecs of records.py.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+
+from records import decode_ficha, decode_plan, encode_ficha, encode_plan
+
+DATA_DIR = os.environ.get("ECU_DATA_DIR") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "data"
+)
+CACHE_PATH = os.path.join(DATA_DIR, "cache.sqlite3")
+
+# kind -> (encode before JSON, decode after JSON): compact records for plans and fichas
+_CODECS = {
+    "plan": (encode_plan, decode_plan),
+    "ficha": (encode_ficha, decode_ficha),
+}
+
+
+class CacheStore:
+    """
+    Thread-safe key/value store on SQLite (WAL mode, so several processes can
+    read while one writes). Values must be JSON-serializable.
+    """
+
+    def __init__(self, path: str = CACHE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " kind TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+            " stored_at REAL NOT NULL, PRIMARY KEY (kind, key))"
+        )
+        self._conn.commit()
+
+    def get_entry(self, kind: str, key: str) -> tuple[object, float] | None:
+        """Return (value, stored_at) or None when the key is not cached."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, stored_at FROM entries WHERE kind = ? AND key = ?",
+                (kind, key),
+            ).fetchone()
+        if row is None:
+            return None
+        value = json.loads(row[0])
+        if kind in _CODECS:
+            value = _CODECS[kind][1](value)
+        return value, row[1]
+
+    def get(self, kind: str, key: str, max_age: float | None = None):
+        """Return the cached value, or None if missing or older than max_age seconds."""
+        entry = self.get_entry(kind, key)
+        if entry is None:
+            return None
+        value, stored_at = entry
+        if max_age is not None and time.time() - stored_at > max_age:
+            return None
+        return value
+
+    def put(self, kind: str, key: str, value) -> None:
+        if kind in _CODECS:
+            value = _CODECS[kind][0](value)
+        data = json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (kind, key, value, stored_at) VALUES (?, ?, ?, ?)",
+                (kind, key, data, time.time()),
+            )
+            self._conn.commit()
+
+    def delete(self, kind: str, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM entries WHERE kind = ? AND key = ?", (kind, key))
+            self._conn.commit()
+
+    def keys(self, kind: str) -> list[str]:
+        with self._lock:
+            rows = self._conn.execute("SELECT key FROM entries WHERE kind = ?", (kind,)).fetchall()
+        return [r[0] for r in rows]
+
+    def iter(self, kind: str):
+        """Yield (key, value) for every entry of a kind, without loading them all at once."""
+        for key in self.keys(kind):
+            value = self.get(kind, key)
+            if value is not None:
+                yield key, value
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_store: CacheStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> CacheStore:
+    """Return the process-wide CacheStore (created on first use)."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = CacheStore()
+        return _store
@@ -0,0 +1,318 @@
+"""
+catalogue.py
+Catalogue snapshot: every degree registered in the RUCT for the chosen types,
+enriched with the ficha fields (CCAA, rama, campo, nivel, MECES, ECTS
+breakdown) and saved as a single file, so analytics and local search never
+need a live scrape.
+
+Next to the CSV the snapshot is written as an uncompressed Arrow IPC file.
+Every worker process memory-maps it read-only, and the frame load_snapshot
+returns has Arrow-backed columns (pd.ArrowDtype) pointing straight into the
+mapping: the catalogue lives once in the OS page cache, however many workers
+read it. A new snapshot replaces the file atomically, so mappings already
+open keep the old inode and snapshot_version() tells readers to map the new
+one, with no restart.
+
+    python catalogue.py build --tipos G M
+    python catalogue.py arrow              # Arrow copy of an existing CSV snapshot
+"""
+
+import os
+import time
+import logging
+
+import pandas as pd
+
+import comparator
+from cache_store import DATA_DIR
+from ruct_scraper import RESULT_COLUMNS, iter_search_ruct_many, load_form_options
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_PATH = os.path.join(DATA_DIR, "catalogue.csv.gz")
+
+ENRICHED_COLUMNS = [
+    "tipo", "ccaa", "rama", "campo", "nivel_academico", "meces", "centro", "habilita",
+    "ects_basica", "ects_obligatoria", "ects_optativa", "ects_practicas", "ects_tfg_tfm",
+    "ects_total",
+]
+SNAPSHOT_COLUMNS = RESULT_COLUMNS + ENRICHED_COLUMNS
+
+
+def scrape_catalogue(
+    tipos=("G", "M"),
+    workers: int = 4,
+    rate: float = 2.5,
+    options: dict | None = None,
+    progress_callback=None,
+) -> pd.DataFrame:
+    """
+    List every degree of the given types, one RUCT search per university and type
+    (the RUCT rejects searches without a denomination or a university).
+
+    progress_callback  Optional callable(done: int, total: int, query)
+    """
+    options = options or load_form_options()
+    univs = [v for _, v in options.get("universidades", []) if v]
+    if not univs:
+        raise RuntimeError("No se pudo cargar la lista de universidades del RUCT")
+    queries = [
+        {"universidad": u, "tipo": t, "descripcion": "", "estado": "P", "situacion": "A"}
+        for t in tipos for u in univs
+    ]
+    frames = []
+    for i, (q, df, warn) in enumerate(
+        iter_search_ruct_many(queries, workers=workers, rate=rate, dedupe=True), start=1
+    ):
+        if warn:
+            logger.warning(f"{q['tipo']}/{q['universidad']}: {warn}")
+        if not df.empty:
+            frames.append(df.assign(tipo=q["tipo"]))
+        if progress_callback:
+            progress_callback(i, len(queries), q)
+    if not frames:
+        return pd.DataFrame(columns=RESULT_COLUMNS + ["tipo"])
+    return pd.concat(frames, ignore_index=True)
+
+
+def enrich(df: pd.DataFrame, workers: int = 8, progress_callback=None) -> pd.DataFrame:
+    """Add the ficha fields (ENRICHED_COLUMNS) to catalogue rows, fetching fichas concurrently."""
+    degrees = [
+        {
+            "codigo": r.codigo, "title": r.titulo, "university": r.universidad,
+            "url_ruct": r.url_ruct, "url_plan": r.url_plan,
+        }
+        for r in df.itertuples(index=False)
+    ]
+    fichas = comparator.fetch_fichas(degrees, workers=workers, progress_callback=progress_callback)
+    m = comparator.ects_matrix(fichas)
+    out = df.copy()
+    for col, key in [("ccaa", "ccaa"), ("rama", "rama"), ("campo", "campo"),
+                     ("nivel_academico", "nivel"), ("meces", "meces"),
+                     ("centro", "centro"), ("habilita", "habilita")]:
+        out[col] = [(f or {}).get(key, "") for f in fichas]
+    for j, cat in enumerate(comparator.ECTS_CATS):
+        out[f"ects_{cat}"] = m[:, j]
+    out["ects_total"] = m.sum(axis=1)
+    return out.reindex(columns=SNAPSHOT_COLUMNS)
+
+
+def _pyarrow():
+    """pyarrow (installed with Streamlit), or None: the CSV snapshot is used alone."""
+    try:
+        import pyarrow as pa
+    except ImportError:
+        return None
+    return pa
+
+
+def arrow_path(path: str = SNAPSHOT_PATH) -> str:
+    """The Arrow IPC file next to a CSV snapshot (catalogue.csv.gz -> catalogue.arrow)."""
+    base = path[:-len(".csv.gz")] if path.endswith(".csv.gz") else os.path.splitext(path)[0]
+    return f"{base}.arrow"
+
+
+def _file_version(path: str) -> str:
+    st = os.stat(path)
+    return f"{st.st_mtime_ns}-{st.st_size}"
+
+
+_arrow_checked: dict = {}     # (arrow path, arrow version) -> CSV version it was written from
+
+
+def _arrow_csv_version(arrow: str) -> str:
+    """The CSV version recorded in an Arrow copy's schema metadata (read once per file version)."""
+    key = (arrow, _file_version(arrow))
+    if key not in _arrow_checked:
+        pa = _pyarrow()
+        metadata = pa.ipc.open_file(pa.memory_map(arrow, "r")).schema.metadata or {}
+        _arrow_checked[key] = metadata.get(b"csv_version", b"").decode()
+    return _arrow_checked[key]
+
+
+def _source(path: str) -> str:
+    """
+    The file load_snapshot reads: the Arrow copy when pyarrow is available and
+    it was written from the current CSV, else the CSV.
+    """
+    arrow = arrow_path(path)
+    if _pyarrow() is None or not os.path.exists(arrow):
+        return path
+    try:
+        return arrow if _arrow_csv_version(arrow) == _file_version(path) else path
+    except Exception:       # unreadable copy, or no CSV next to it
+        return path
+
+
+def save_arrow(df: pd.DataFrame, path: str = SNAPSHOT_PATH) -> bool:
+    """
+    Write the Arrow IPC copy of the CSV snapshot at `path` atomically
+    (uncompressed, so it can be mapped without decoding). Text columns are
+    stored as strings with '' for missing values, as the CSV reads back; the
+    CSV's version is recorded so a copy left behind by an older CSV is never
+    read. False without pyarrow.
+    """
+    pa = _pyarrow()
+    if pa is None:
+        return False
+    df = df.copy()
+    for col in df:
+        if not pd.api.types.is_numeric_dtype(df[col]) or col in ("codigo", "meces"):
+            df[col] = df[col].fillna("").astype(str)
+    table = pa.Table.from_pandas(df, preserve_index=False).replace_schema_metadata(
+        {"csv_version": _file_version(path)})
+    target = arrow_path(path)
+    os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+    tmp = f"{target}.tmp"
+    with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp, target)
+    return True
+
+
+def save_snapshot(df: pd.DataFrame, path: str = SNAPSHOT_PATH) -> None:
+    """Write the snapshot atomically (readers see the old or the new file, never half of one)."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp"
+    df.to_csv(tmp, index=False, compression="gzip")
+    # The old Arrow copy goes first, so it is never read next to the new CSV
+    # (_source also checks the CSV version recorded in it)
+    if os.path.exists(arrow_path(path)):
+        os.remove(arrow_path(path))
+    os.replace(tmp, path)
+    try:
+        save_arrow(df, path)
+    except Exception as e:
+        logger.warning(f"Arrow copy of the snapshot not written: {e}")
+        if os.path.exists(f"{arrow_path(path)}.tmp"):
+            os.remove(f"{arrow_path(path)}.tmp")
+
+
+def load_snapshot(path: str = SNAPSHOT_PATH) -> pd.DataFrame:
+    """
+    Load the catalogue snapshot; an empty frame if it has not been built yet.
+    From the Arrow copy, columns are zero-copy views of a read-only memory map.
+    """
+    source = _source(path)
+    if not os.path.exists(source):
+        return pd.DataFrame(columns=SNAPSHOT_COLUMNS)
+    if source != path:
+        pa = _pyarrow()
+        table = pa.ipc.open_file(pa.memory_map(source, "r")).read_all()
+        return table.to_pandas(types_mapper=pd.ArrowDtype)
+    df = pd.read_csv(path, dtype={"codigo": str, "meces": str}, keep_default_na=False,
+                     compression="gzip")
+    return df
+
+
+def snapshot_version(path: str = SNAPSHOT_PATH) -> str:
+    """Cheap change marker for a snapshot file ('' when it does not exist)."""
+    try:
+        st = os.stat(_source(path))
+    except FileNotFoundError:
+        return ""
+    return f"{st.st_mtime_ns}-{st.st_size}"
+
+
+MIN_SNAPSHOT_RATIO = 0.9     # a refreshed snapshot may not lose more than 10% of the degrees
+
+
+def validate_snapshot(df: pd.DataFrame, previous: pd.DataFrame | None = None) -> str | None:
+    """Why a freshly built snapshot must not replace the current one (None: it is fine)."""
+    missing = [c for c in SNAPSHOT_COLUMNS if c not in df]
+    if missing:
+        return f"faltan columnas: {', '.join(missing)}"
+    if df.empty:
+        return "instantánea vacía"
+    codigos = df["codigo"].astype(str)
+    if (codigos == "").any() or codigos.duplicated().any():
+        return "códigos vacíos o repetidos"
+    if previous is not None and len(df) < MIN_SNAPSHOT_RATIO * len(previous):
+        return f"{len(df)} titulaciones frente a {len(previous)} de la instantánea actual"
+    return None
+
+
+def refresh_snapshot(tipos=("G", "M"), workers: int = 4, rate: float = 1.0,
+                     path: str = SNAPSHOT_PATH, options: dict | None = None) -> dict:
+    """
+    Re-list the catalogue and fetch fichas only for the degrees that are new or
+    whose listing changed; the others keep their enriched fields. The result is
+    validated against the current snapshot before it is swapped in.
+
+    Returns {added, removed, changed, kept, seconds}; raises ValueError when
+    the new snapshot is rejected (the current one is left in place).
+    """
+    t0 = time.time()
+    current = load_snapshot(path)
+    listed = scrape_catalogue(tipos, workers=workers, rate=rate, options=options)
+    listed = listed.drop_duplicates("codigo", ignore_index=True)
+
+    listing_cols = RESULT_COLUMNS + ["tipo"]
+    # Plain numpy columns (the current snapshot may be Arrow-backed), indexed by codigo
+    old = current.drop_duplicates("codigo")
+    old = pd.DataFrame({c: old[c].to_numpy() for c in old}, index=old["codigo"].astype(str).to_numpy())
+    new_codigos = listed["codigo"].astype(str)
+    known = new_codigos.isin(old.index).to_numpy()
+    same = known.copy()
+    if known.any():
+        before = old.loc[new_codigos[known], listing_cols].astype(str).to_numpy()
+        after = listed.loc[known, listing_cols].astype(str).to_numpy()
+        same[known] = (before == after).all(axis=1)
+
+    kept = old.loc[new_codigos[same]].reset_index(drop=True)
+    fresh = enrich(listed[~same].reset_index(drop=True), workers=workers * 2) if (~same).any() else None
+    df = pd.concat([f for f in (kept, fresh) if f is not None], ignore_index=True)
+    order = {c: i for i, c in enumerate(new_codigos)}
+    df = (df.reindex(columns=SNAPSHOT_COLUMNS)
+            .sort_values("codigo", key=lambda c: c.astype(str).map(order), ignore_index=True))
+
+    error = validate_snapshot(df, current if len(current) else None)
+    if error:
+        raise ValueError(f"Instantánea rechazada: {error}")
+    save_snapshot(df, path)
+    return {
+        "added": int((~known).sum()),
+        "removed": int((~old.index.isin(new_codigos)).sum()),
+        "changed": int((known & ~same).sum()),
+        "kept": int(same.sum()),
+        "seconds": round(time.time() - t0, 1),
+    }
+
+
+def build_snapshot(tipos=("G", "M"), workers: int = 4, rate: float = 2.5,
+                   path: str = SNAPSHOT_PATH) -> pd.DataFrame:
+    """Scrape, enrich and save the catalogue; returns the new snapshot."""
+    t0 = time.time()
+    df = scrape_catalogue(
+        tipos, workers=workers, rate=rate,
+        progress_callback=lambda i, n, q: logger.info(f"[{i}/{n}] {q['tipo']} {q['universidad']}"),
+    )
+    logger.info(f"{len(df)} titulaciones listadas en {time.time() - t0:.0f} s; cargando fichas…")
+    df = enrich(df, workers=workers * 2,
+                progress_callback=lambda d, n: d % 100 == 0 and logger.info(f"  fichas {d}/{n}"))
+    save_snapshot(df, path)
+    return df
+
+
+if __name__ == "__main__":
+    import sys
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Instantánea del catálogo RUCT enriquecida con las fichas.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_build = sub.add_parser("build", help="Descargar y guardar la instantánea completa")
+    p_build.add_argument("--tipos", nargs="+", default=["G", "M"])
+    p_build.add_argument("--workers", type=int, default=4)
+    p_build.add_argument("--rate", type=float, default=2.5)
+    sub.add_parser("arrow", help="Generar la copia Arrow (mapeable en memoria) de la instantánea CSV")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr, format="%(message)s")
+    if args.cmd == "arrow":
+        csv = pd.read_csv(SNAPSHOT_PATH, dtype={"codigo": str, "meces": str}, keep_default_na=False)
+        if not save_arrow(csv):
+            sys.exit("La copia Arrow requiere pyarrow (pip install pyarrow)")
+        print(f"{len(csv)} titulaciones guardadas en {arrow_path()}")
+    else:
+        snap = build_snapshot(tuple(args.tipos), workers=args.workers, rate=args.rate)
+        print(f"{len(snap)} titulaciones guardadas en {SNAPSHOT_PATH}")
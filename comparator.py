@@ -0,0 +1,172 @@
+"""
+comparator.py
+Vectorized ECTS comparison for large groups of degrees (e.g. every Grado en
+Derecho in Spain). Fichas are fetched concurrently, credit breakdowns are
+loaded into one NumPy matrix, and shares, deltas to the group mean and
+rankings are computed in a single pass.
+"""
+
+import time
+import functools
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from cache_store import get_store
+from resilience import schedule_refresh
+from study_plan import _fetch_ruct_ficha_quick
+
+ECTS_CATS = ["basica", "obligatoria", "optativa", "practicas", "tfg_tfm"]
+ECTS_LABELS = {
+    "basica": "Básica",
+    "obligatoria": "Obligatoria",
+    "optativa": "Optativa",
+    "practicas": "Prácticas",
+    "tfg_tfm": "TFG/TFM",
+}
+MAX_COMPARE = 300           # degrees compared at once by the large-N view
+FICHA_CACHE_TTL = 7 * 24 * 3600
+
+
+def fetch_fichas(
+    degrees: list[dict],
+    fetch_fn=_fetch_ruct_ficha_quick,
+    workers: int = 8,
+    progress_callback=None,
+) -> list[dict]:
+    """
+    Return one ficha per degree, in input order, fetching the missing ones
+    concurrently with fetch_fn(url_ruct, url_plan).
+
+    Fichas are read from (and written to) the shared cache by codigo: a cached
+    full plan is reused when it already has the ECTS breakdown. Entries older
+    than FICHA_CACHE_TTL are still used and refreshed in the background.
+    progress_callback  Optional callable(done: int, total: int)
+    """
+    store = get_store()
+    fichas: list[dict | None] = [None] * len(degrees)
+    pending = []
+    for i, deg in enumerate(degrees):
+        codigo = deg.get("codigo", "")
+        if codigo:
+            entry = store.get_entry("plan", codigo)
+            if entry and entry[0].get("ficha", {}).get("creditos"):
+                fichas[i], stored_at = entry[0]["ficha"], entry[1]
+            else:
+                entry = store.get_entry("ficha", codigo)
+                if entry is not None:
+                    fichas[i], stored_at = entry
+            if fichas[i] is not None:
+                if time.time() - stored_at > FICHA_CACHE_TTL:
+                    schedule_refresh(
+                        "ficha", codigo,
+                        functools.partial(fetch_fn, deg.get("url_ruct", ""), deg.get("url_plan", "")),
+                        valid=lambda f: bool(f.get("creditos")), store=store,
+                    )
+                continue
+        pending.append(i)
+
+    done = len(degrees) - len(pending)
+    if progress_callback:
+        progress_callback(done, len(degrees))
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+        futures = {
+            ex.submit(fetch_fn, degrees[i].get("url_ruct", ""), degrees[i].get("url_plan", "")): i
+            for i in pending
+        }
+        for fut in as_completed(futures):
+            i = futures[fut]
+            try:
+                ficha = fut.result()
+            except Exception:
+                ficha = {}
+            fichas[i] = ficha
+            codigo = degrees[i].get("codigo", "")
+            if codigo and ficha.get("creditos"):
+                store.put("ficha", codigo, ficha)
+            done += 1
+            if progress_callback:
+                progress_callback(done, len(degrees))
+    return fichas
+
+
+def ects_matrix(fichas: list[dict]) -> np.ndarray:
+    """N × len(ECTS_CATS) float matrix of credits per category (0 when missing)."""
+    m = np.zeros((len(fichas), len(ECTS_CATS)), dtype=float)
+    for i, ficha in enumerate(fichas):
+        creditos = ficha.get("creditos", {}) if ficha else {}
+        for j, cat in enumerate(ECTS_CATS):
+            m[i, j] = creditos.get(cat, {}).get("ects", 0) or 0
+    return m
+
+
+def compare_matrix(m: np.ndarray) -> dict:
+    """
+    Compute the comparison in one vectorized pass over an N × C credit matrix.
+
+    Returns a dict of arrays:
+      total   (N,)   total ECTS per degree
+      share   (N,C)  fraction of the total per category
+      mean    (C,)   group mean share per category (degrees with data only)
+      delta   (N,C)  share minus group mean share, in percentage points
+      rank    (N,C)  1 = highest share in the group for that category
+      valid   (N,)   True for degrees with any ECTS data
+    """
+    total = m.sum(axis=1)
+    valid = total > 0
+    share = np.divide(m, total[:, None], out=np.zeros_like(m), where=valid[:, None])
+    mean = share[valid].mean(axis=0) if valid.any() else np.zeros(m.shape[1])
+    delta = (share - mean) * 100
+    # Rank by descending share; degrees without data go last
+    keyed = np.where(valid[:, None], share, -1.0)
+    order = np.argsort(-keyed, axis=0, kind="stable")
+    rank = np.empty_like(order)
+    rank[order, np.arange(m.shape[1])] = np.arange(1, m.shape[0] + 1)[:, None]
+    return {"total": total, "share": share, "mean": mean, "delta": delta,
+            "rank": rank, "valid": valid}
+
+
+def comparison_frame(degrees: list[dict], fichas: list[dict], result: dict, m: np.ndarray) -> pd.DataFrame:
+    """Display table: one row per degree with ECTS, share % and delta vs. the group mean."""
+    labels = [ECTS_LABELS[c] for c in ECTS_CATS]
+    df = pd.DataFrame({
+        "Titulación": [(f or {}).get("denominacion") or d["title"] for d, f in zip(degrees, fichas)],
+        "Universidad": [(f or {}).get("universidad") or d["university"] for d, f in zip(degrees, fichas)],
+        "Total ECTS": result["total"].round().astype(int),
+    })
+    for j, label in enumerate(labels):
+        df[f"{label} ECTS"] = m[:, j].round().astype(int)
+    for j, label in enumerate(labels):
+        df[f"{label} %"] = (result["share"][:, j] * 100).round(1)
+    for j, label in enumerate(labels):
+        df[f"{label} Δ"] = result["delta"][:, j].round(1)
+    return df[result["valid"]].reset_index(drop=True)
+
+
+def delta_styles(df: pd.DataFrame, max_pp: float = 15.0) -> pd.DataFrame:
+    """
+    CSS background per cell for the Δ columns (heatmap without matplotlib):
+    blue above the group mean, amber below, intensity proportional to |Δ|.
+    """
+    styles = pd.DataFrame("", index=df.index, columns=df.columns)
+    delta_cols = [c for c in df.columns if c.endswith(" Δ")]
+    if not delta_cols:
+        return styles
+    d = df[delta_cols].to_numpy(dtype=float)
+    alpha = np.clip(np.abs(d) / max_pp, 0, 1) * 0.55
+    rgb = np.where(d[..., None] >= 0, np.array([27, 58, 107]), np.array([217, 119, 6]))
+    css = np.vectorize(lambda r, g, b, a: f"background-color: rgba({r},{g},{b},{a:.2f})")(
+        rgb[..., 0], rgb[..., 1], rgb[..., 2], alpha,
+    )
+    styles[delta_cols] = css
+    return styles
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    demo = rng.integers(0, 120, size=(300, len(ECTS_CATS))).astype(float)
+    t0 = time.perf_counter()
+    res = compare_matrix(demo)
+    print(f"300 titulaciones comparadas en {(time.perf_counter() - t0) * 1000:.2f} ms")
+    print("Media de proporciones:", {c: round(float(v), 3) for c, v in zip(ECTS_CATS, res["mean"])})
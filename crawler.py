@@ -0,0 +1,462 @@
+"""
+crawler.py
+Checkpointed crawler that harvests the full ficha (with its datosMateria
+subjects) and the BOE study plan of every degree into the shared cache.
+
+Work items live in a durable SQLite queue, one row per degree, with the stage
+it has reached (ficha → boe → done), its retry state and a worker lease.
+Several worker processes claim items from it and share one global request
+budget, so throughput scales with the workers up to the politeness limit
+(--rate). A crawl that is interrupted (Ctrl+C, crash, reboot) resumes where
+it stopped: finished stages are kept and orphaned items are reclaimed.
+
+    python crawler.py seed --snapshot              # every degree of the catalogue
+    python crawler.py seed 2500001 2501234         # or explicit codigos / -f resultados.csv
+    python crawler.py run --workers 4 --rate 2
+    python crawler.py status
+    python crawler.py retry-failed
+"""
+
+import os
+import json
+import time
+import socket
+import logging
+import sqlite3
+import multiprocessing as mp
+
+import resilience
+from cache_store import DATA_DIR, get_store
+from records import to_jsonable
+from ruct_scraper import BASE_URL
+from study_plan import (
+    _PLAN_CACHE_TTL, _PLAN_VERSION, _fetch_boe_plan, _fetch_ruct_ficha,
+    _plan_from_parts, _store_plan,
+)
+
+logger = logging.getLogger(__name__)
+
+CRAWL_PATH = os.path.join(DATA_DIR, "crawl.sqlite3")
+
+DEFAULT_RATE = 2.0          # requests per second, all workers together
+MAX_ATTEMPTS = 5            # per stage, before an item is marked failed
+RETRY_BASE = 30.0           # seconds before the first retry; doubles on each attempt
+RETRY_MAX = 1800.0
+LEASE_SECONDS = 900.0       # a claimed item is reclaimed if its worker goes silent this long
+IDLE_POLL = 5.0             # seconds between queue polls while only retries are pending
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    codigo       TEXT PRIMARY KEY,
+    title        TEXT NOT NULL DEFAULT '',
+    university   TEXT NOT NULL DEFAULT '',
+    url_ruct     TEXT NOT NULL DEFAULT '',
+    url_plan     TEXT NOT NULL DEFAULT '',
+    stage        TEXT NOT NULL DEFAULT 'ficha',    -- ficha | boe | done
+    status       TEXT NOT NULL DEFAULT 'pending',  -- pending | running | done | failed
+    attempts     INTEGER NOT NULL DEFAULT 0,       -- failed attempts of the current stage
+    next_attempt REAL NOT NULL DEFAULT 0,
+    lease_until  REAL,
+    worker       TEXT,
+    last_error   TEXT,
+    checkpoint   TEXT,                             -- scraped ficha (JSON) between stages
+    updated_at   REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS items_ready ON items (status, next_attempt);
+CREATE TABLE IF NOT EXISTS rate_budget (
+    id        INTEGER PRIMARY KEY CHECK (id = 1),
+    next_slot REAL NOT NULL
+);
+"""
+
+
+class CrawlError(Exception):
+    """A stage produced nothing usable (the item is retried with backoff)."""
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=60, isolation_level=None)   # explicit transactions
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+# ─── Work queue ───────────────────────────────────────────────────────────────
+
+class CrawlQueue:
+    """The durable queue of one crawl (one SQLite file, usable from several processes)."""
+
+    def __init__(self, path: str = CRAWL_PATH):
+        self.path = path
+        self._conn = _connect(path)
+        self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def _write(self, sql: str, params=()) -> int:
+        with self._conn:
+            return self._conn.execute(sql, params).rowcount
+
+    def seed(self, degrees, refresh: bool = False) -> int:
+        """
+        Queue degrees ({codigo, title, university, url_ruct, url_plan}); known
+        codigos keep their progress unless refresh=True. Returns the rows added
+        or re-queued.
+        """
+        now = time.time()
+        rows = []
+        for d in degrees:
+            codigo = str(d.get("codigo") or "").strip()
+            if not codigo:
+                continue
+            rows.append((
+                codigo, d.get("title") or "", d.get("university") or "",
+                d.get("url_ruct") or f"{BASE_URL}/estudio.action?codigoEstudio={codigo}&actual=estudios",
+                d.get("url_plan") or f"{BASE_URL}/detalles.action?codigoEstudio={codigo}&actual=detallesbasicos",
+                now,
+            ))
+        verb = "REPLACE" if refresh else "IGNORE"
+        with self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                f"INSERT OR {verb} INTO items (codigo, title, university, url_ruct, url_plan, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            return self._conn.total_changes - before
+
+    def skip_cached(self, max_age: float = _PLAN_CACHE_TTL) -> int:
+        """Mark pending items whose plan is already fresh in the shared cache as done."""
+        store = get_store()
+        done = []
+        for row in self._conn.execute("SELECT codigo FROM items WHERE status = 'pending' AND stage = 'ficha'"):
+            plan = store.get("plan", row["codigo"], max_age=max_age)
+            if plan is not None and plan.get("_v") == _PLAN_VERSION:
+                done.append((time.time(), row["codigo"]))
+        with self._conn:
+            self._conn.executemany(
+                "UPDATE items SET stage = 'done', status = 'done', updated_at = ? WHERE codigo = ?", done
+            )
+        return len(done)
+
+    def claim(self, worker: str) -> sqlite3.Row | None:
+        """Lease the next ready item (pending, or running with an expired lease) to a worker."""
+        now = time.time()
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._conn.execute(
+                "SELECT * FROM items WHERE (status = 'pending' AND next_attempt <= ?)"
+                " OR (status = 'running' AND lease_until < ?)"
+                " ORDER BY next_attempt LIMIT 1",
+                (now, now),
+            ).fetchone()
+            if row is not None:
+                self._conn.execute(
+                    "UPDATE items SET status = 'running', worker = ?, lease_until = ?, updated_at = ?"
+                    " WHERE codigo = ?",
+                    (worker, now + LEASE_SECONDS, now, row["codigo"]),
+                )
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        return row
+
+    def advance(self, codigo: str, stage: str, checkpoint: str | None = None) -> None:
+        """Record a finished stage: the item moves on to `stage` with fresh retry state."""
+        self._write(
+            "UPDATE items SET stage = ?, status = ?, attempts = 0, next_attempt = 0,"
+            " lease_until = NULL, worker = NULL, last_error = NULL, checkpoint = ?, updated_at = ?"
+            " WHERE codigo = ?",
+            (stage, "done" if stage == "done" else "pending",
+             None if stage == "done" else checkpoint, time.time(), codigo),
+        )
+
+    def fail(self, codigo: str, error: str, attempts: int, max_attempts: int = MAX_ATTEMPTS) -> str:
+        """Record a failed attempt; the item is retried with backoff or marked failed."""
+        status = "failed" if attempts >= max_attempts else "pending"
+        delay = min(RETRY_BASE * 2 ** (attempts - 1), RETRY_MAX)
+        self._write(
+            "UPDATE items SET status = ?, attempts = ?, next_attempt = ?, lease_until = NULL,"
+            " worker = NULL, last_error = ?, updated_at = ? WHERE codigo = ?",
+            (status, attempts, time.time() + delay, error[:500], time.time(), codigo),
+        )
+        return status
+
+    def release(self, codigo: str, delay: float = 0.0) -> None:
+        """Give an item back without counting an attempt (shutdown, host circuit open)."""
+        self._write(
+            "UPDATE items SET status = 'pending', next_attempt = ?, lease_until = NULL, worker = NULL,"
+            " updated_at = ? WHERE codigo = ? AND status = 'running'",
+            (time.time() + delay, time.time(), codigo),
+        )
+
+    def recover_orphans(self) -> int:
+        """Re-queue items leased to worker processes of this host that no longer exist."""
+        prefix = f"{socket.gethostname()}:"
+        orphans = []
+        for row in self._conn.execute("SELECT codigo, worker FROM items WHERE status = 'running'"):
+            worker = row["worker"] or ""
+            if worker.startswith(prefix) and not _pid_alive(int(worker.rsplit(":", 1)[1])):
+                orphans.append(row["codigo"])
+        for codigo in orphans:
+            self.release(codigo)
+        return len(orphans)
+
+    def retry_failed(self) -> int:
+        return self._write(
+            "UPDATE items SET status = 'pending', attempts = 0, next_attempt = 0, updated_at = ?"
+            " WHERE status = 'failed'",
+            (time.time(),),
+        )
+
+    def next_ready_in(self) -> float | None:
+        """Seconds until some item can be claimed; None when nothing is left to do."""
+        row = self._conn.execute(
+            "SELECT MIN(CASE WHEN status = 'pending' THEN next_attempt ELSE lease_until END)"
+            " FROM items WHERE status IN ('pending', 'running')"
+        ).fetchone()
+        return None if row[0] is None else max(0.0, row[0] - time.time())
+
+    def counts(self) -> dict:
+        """{(stage, status): n} for the whole queue."""
+        return {
+            (r["stage"], r["status"]): r["n"]
+            for r in self._conn.execute("SELECT stage, status, COUNT(*) AS n FROM items GROUP BY 1, 2")
+        }
+
+    def errors(self, limit: int = 10) -> list[tuple[str, int]]:
+        """The most frequent last errors of items still retrying or failed."""
+        return [
+            (r["last_error"], r["n"])
+            for r in self._conn.execute(
+                "SELECT last_error, COUNT(*) AS n FROM items WHERE last_error IS NOT NULL"
+                " AND status != 'done' GROUP BY 1 ORDER BY 2 DESC LIMIT ?", (limit,)
+            )
+        ]
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# ─── Global rate budget ───────────────────────────────────────────────────────
+
+class SharedRateBudget:
+    """
+    ruct_scraper.RateLimiter across processes: request slots spaced 1/rate
+    seconds apart are handed out through a row of the crawl database, so all
+    workers together never exceed `rate` requests per second.
+    """
+
+    def __init__(self, path: str = CRAWL_PATH, rate: float = DEFAULT_RATE):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._conn = _connect(path)
+        self._conn.executescript(_SCHEMA)
+
+    def wait(self) -> None:
+        if not self.interval:
+            return
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._conn.execute("SELECT next_slot FROM rate_budget WHERE id = 1").fetchone()
+            slot = max(time.time(), row[0] if row else 0.0)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO rate_budget (id, next_slot) VALUES (1, ?)", (slot + self.interval,)
+            )
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        delay = slot - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+
+# ─── Stages ───────────────────────────────────────────────────────────────────
+
+def _store_item_plan(item, plan: dict) -> None:
+    _store_plan(item["codigo"], plan, item["title"], item["university"], item["url_ruct"], item["url_plan"])
+
+
+def _run_stage(item) -> tuple[str, str | None]:
+    """Run the item's current stage; returns (next stage, checkpoint). Raises CrawlError."""
+    if item["stage"] == "ficha":
+        ficha = _fetch_ruct_ficha(item["url_ruct"], item["url_plan"])
+        if not (ficha.get("denominacion") or ficha.get("nivel")):
+            raise CrawlError("ficha vacía")
+        if ficha.get("boe_plan_url"):
+            return "boe", json.dumps(ficha, ensure_ascii=False, default=to_jsonable)
+        _store_item_plan(item, _plan_from_parts(ficha))
+        return "done", None
+
+    ficha = json.loads(item["checkpoint"])
+    plan_text, boe_subjects = _fetch_boe_plan(ficha["boe_plan_url"])
+    if not plan_text and not boe_subjects:
+        raise CrawlError("plan del BOE vacío")
+    _store_item_plan(item, _plan_from_parts(ficha, plan_text, boe_subjects))
+    return "done", None
+
+
+def _stage_host(item) -> str:
+    if item["stage"] == "boe" and item["checkpoint"]:
+        return json.loads(item["checkpoint"]).get("boe_plan_url", "")
+    return item["url_plan"]
+
+
+def _worker(path: str, rate: float, max_attempts: int) -> int:
+    """Worker process: claim and process items until the queue is drained. Returns items finished."""
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    queue = CrawlQueue(path)
+    resilience.set_request_gate(SharedRateBudget(path, rate).wait)
+    finished = 0
+    item = None
+    try:
+        while True:
+            item = queue.claim(worker)
+            if item is None:
+                wait = queue.next_ready_in()
+                if wait is None:
+                    return finished
+                time.sleep(min(max(wait, 0.1), IDLE_POLL))
+                continue
+            codigo = item["codigo"]
+            if resilience.is_open(_stage_host(item)):
+                queue.release(codigo, delay=resilience.RESET_TIMEOUT)
+                item = None
+                continue
+            try:
+                stage, checkpoint = _run_stage(item)
+            except Exception as e:
+                status = queue.fail(codigo, f"{item['stage']}: {e}", item["attempts"] + 1, max_attempts)
+                if status == "failed" and item["stage"] == "boe":
+                    # Keep what the ficha stage gathered, as the app does when the BOE fails
+                    _store_item_plan(item, _plan_from_parts(json.loads(item["checkpoint"])))
+                logger.warning(f"{codigo} ({item['stage']}, intento {item['attempts'] + 1}): {e}")
+            else:
+                queue.advance(codigo, stage, checkpoint)
+                if stage == "done":
+                    finished += 1
+                    logger.info(f"{codigo} ✓ {item['title']}")
+            item = None
+    except KeyboardInterrupt:
+        return finished
+    finally:
+        if item is not None:
+            queue.release(item["codigo"])
+        queue.close()
+
+
+def run(path: str = CRAWL_PATH, workers: int = 4, rate: float = DEFAULT_RATE,
+        max_attempts: int = MAX_ATTEMPTS) -> dict:
+    """
+    Process the queue with `workers` processes sharing a `rate` requests/s
+    budget; returns the queue counts when it is drained (or on Ctrl+C).
+    """
+    queue = CrawlQueue(path)
+    recovered = queue.recover_orphans()
+    if recovered:
+        logger.info(f"{recovered} elementos recuperados de trabajadores interrumpidos")
+    ctx = mp.get_context("spawn")
+    procs = [ctx.Process(target=_worker, args=(path, rate, max_attempts), name=f"crawler-{i}")
+             for i in range(max(1, workers))]
+    for p in procs:
+        p.start()
+    try:
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        logger.info("Interrumpido: los trabajadores devuelven sus elementos a la cola…")
+        for p in procs:
+            p.join()
+    counts = queue.counts()
+    queue.close()
+    return counts
+
+
+# ─── Seeding ──────────────────────────────────────────────────────────────────
+
+def _degrees_from_frame(df) -> list[dict]:
+    df = df.fillna("")
+    return [
+        {
+            "codigo": str(r.get("codigo", "")), "title": r.get("titulo", ""),
+            "university": r.get("universidad", ""),
+            "url_ruct": r.get("url_ruct", ""), "url_plan": r.get("url_plan", ""),
+        }
+        for r in df.to_dict("records")
+    ]
+
+
+def _print_status(queue: CrawlQueue) -> None:
+    counts = queue.counts()
+    total = sum(counts.values())
+    done = sum(n for (_, status), n in counts.items() if status == "done")
+    print(f"{done}/{total} titulaciones completadas")
+    for (stage, status), n in sorted(counts.items()):
+        print(f"  {stage:<6} {status:<8} {n}")
+    errors = queue.errors()
+    if errors:
+        print("Errores más frecuentes:")
+        for err, n in errors:
+            print(f"  {n:>5}  {err}")
+
+
+if __name__ == "__main__":
+    import sys
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Rastreo reanudable de fichas y planes de estudio del RUCT.")
+    parser.add_argument("--db", default=CRAWL_PATH, help="Fichero SQLite de la cola")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_seed = sub.add_parser("seed", help="Añadir titulaciones a la cola")
+    p_seed.add_argument("codigos", nargs="*", help="Códigos RUCT")
+    p_seed.add_argument("--snapshot", nargs="?", const="", default=None,
+                        help="Todas las titulaciones del catálogo (catalogue.py build)")
+    p_seed.add_argument("-f", "--file", help="CSV de resultados de búsqueda (ruct_batch.py)")
+    p_seed.add_argument("--refresh", action="store_true",
+                        help="Volver a rastrear también las ya completadas o en caché")
+    p_run = sub.add_parser("run", help="Procesar la cola (reanuda donde se quedó)")
+    p_run.add_argument("--workers", type=int, default=4, help="Procesos trabajadores")
+    p_run.add_argument("--rate", type=float, default=DEFAULT_RATE,
+                       help="Peticiones por segundo como máximo (entre todos los procesos)")
+    p_run.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS)
+    sub.add_parser("status", help="Progreso y errores del rastreo")
+    sub.add_parser("retry-failed", help="Reintentar los elementos fallidos")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr,
+                        format="%(asctime)s %(processName)s %(message)s")
+    q = CrawlQueue(args.db)
+    if args.cmd == "seed":
+        degrees = [{"codigo": c} for c in args.codigos]
+        if args.snapshot is not None:
+            import catalogue
+            degrees += _degrees_from_frame(catalogue.load_snapshot(args.snapshot or catalogue.SNAPSHOT_PATH))
+        if args.file:
+            import pandas as pd
+            degrees += _degrees_from_frame(pd.read_csv(args.file, dtype={"codigo": str}))
+        if not degrees:
+            parser.error("indica códigos, --snapshot o -f")
+        added = q.seed(degrees, refresh=args.refresh)
+        skipped = 0 if args.refresh else q.skip_cached()
+        print(f"{added} titulaciones añadidas a la cola; {skipped} ya estaban en caché")
+    elif args.cmd == "run":
+        q.close()
+        run(args.db, args.workers, args.rate, args.max_attempts)
+        q = CrawlQueue(args.db)
+        _print_status(q)
+    elif args.cmd == "status":
+        _print_status(q)
+    else:
+        print(f"{q.retry_failed()} elementos devueltos a la cola")
+    q.close()
@@ -0,0 +1,213 @@
+"""
+profiling.py
+Opt-in profiling for production: every Streamlit rerun of app.py and,
+optionally, every search_ruct / _find_study_plan call can be profiled with
+cProfile or with a low-overhead stack sampler. Each profile is written with a
+timestamp to a local directory, next to a plain-text top-N summary.
+
+Environment:
+    ECU_PROFILE           '' (off), 'rerun', 'calls' or 'all'
+    ECU_PROFILE_MODE      'cprofile' (default) or 'sampling'
+    ECU_PROFILE_RATE      fraction of reruns/calls profiled (default 1.0)
+    ECU_PROFILE_INTERVAL  seconds between stack samples (default 0.005)
+    ECU_PROFILE_TOP       functions in each summary (default 30)
+    ECU_PROFILE_DIR       output directory (default data/profiles)
+"""
+
+import io
+import os
+import sys
+import time
+import pstats
+import random
+import cProfile
+import functools
+import threading
+from collections import Counter
+
+from cache_store import DATA_DIR
+
+_SCOPE = os.environ.get("ECU_PROFILE", "").strip().lower()
+MODE = os.environ.get("ECU_PROFILE_MODE", "cprofile").strip().lower()
+RATE = float(os.environ.get("ECU_PROFILE_RATE", "1.0"))
+INTERVAL = float(os.environ.get("ECU_PROFILE_INTERVAL", "0.005"))
+TOP_N = int(os.environ.get("ECU_PROFILE_TOP", "30"))
+PROFILE_DIR = os.environ.get("ECU_PROFILE_DIR") or os.path.join(DATA_DIR, "profiles")
+
+RERUNS_ENABLED = _SCOPE in ("rerun", "all", "1", "true")
+CALLS_ENABLED = _SCOPE in ("calls", "all")
+
+_active = threading.local()     # one profile per thread: nested ones would clobber the hook
+
+
+# ─── Profilers ────────────────────────────────────────────────────────────────
+
+class StackSampler:
+    """Samples one thread's Python stack every `interval` seconds from a helper thread."""
+
+    def __init__(self, interval: float = INTERVAL):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._target = threading.get_ident()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{code.co_firstlineno}")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def enable(self) -> None:
+        self._thread.start()
+
+    def disable(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, base: str, header: str) -> None:
+        """<base>.collapsed (flame-graph input) and <base>.txt (top-N by samples)."""
+        with open(f"{base}.collapsed", "w", encoding="utf-8") as fh:
+            for stack, n in self.stacks.most_common():
+                fh.write(f"{stack} {n}\n")
+        own, total = Counter(), Counter()
+        for stack, n in self.stacks.items():
+            frames = stack.split(";")
+            own[frames[-1]] += n
+            for f in set(frames):
+                total[f] += n
+        lines = [header, f"{self.samples} muestras cada {self.interval * 1000:.1f} ms", "",
+                 "Propio (función en la cima de la pila):"]
+        lines += [f"{n:>7}  {n / max(self.samples, 1):6.1%}  {f}" for f, n in own.most_common(TOP_N)]
+        lines += ["", "Acumulado (función en cualquier punto de la pila):"]
+        lines += [f"{n:>7}  {n / max(self.samples, 1):6.1%}  {f}" for f, n in total.most_common(TOP_N)]
+        with open(f"{base}.txt", "w", encoding="utf-8") as fh:
+            fh.write("\n".join(lines) + "\n")
+
+
+class _CProfiler:
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def enable(self) -> None:
+        self.profile.enable()
+
+    def disable(self) -> None:
+        self.profile.disable()
+
+    def write(self, base: str, header: str) -> None:
+        """<base>.prof (pstats) and <base>.txt (top-N by cumulative time)."""
+        self.profile.dump_stats(f"{base}.prof")
+        out = io.StringIO()
+        pstats.Stats(self.profile, stream=out).sort_stats("cumulative").print_stats(TOP_N)
+        with open(f"{base}.txt", "w", encoding="utf-8") as fh:
+            fh.write(header + "\n" + out.getvalue())
+
+
+class ProfileRun:
+    """One profiled unit of work (a rerun or a call), written out by finish()."""
+
+    def __init__(self, label: str):
+        self.label = label
+        self.started = time.time()
+        self._t0 = time.perf_counter()
+        self.profiler = StackSampler() if MODE == "sampling" else _CProfiler()
+        self.finished = False
+
+    def start(self) -> "ProfileRun | None":
+        try:
+            self.profiler.enable()
+        except ValueError:      # another profiler already owns this interpreter/thread
+            return None
+        _active.run = self
+        return self
+
+    def finish(self, note: str = "") -> str | None:
+        """Stop profiling and write the files; returns their base path."""
+        if self.finished:
+            return None
+        self.finished = True
+        self.profiler.disable()
+        if getattr(_active, "run", None) is self:
+            _active.run = None
+        elapsed = time.perf_counter() - self._t0
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self.started))
+        base = os.path.join(
+            PROFILE_DIR, f"{stamp}-{int(self.started * 1000) % 1000:03d}_{self.label}_{os.getpid()}"
+        )
+        header = f"{self.label}: {elapsed * 1000:.1f} ms{f' ({note})' if note else ''}"
+        try:
+            self.profiler.write(base, header)
+        except OSError:
+            return None
+        return base
+
+
+def _should_sample() -> bool:
+    return RATE >= 1 or random.random() < RATE
+
+
+# ─── Streamlit reruns ─────────────────────────────────────────────────────────
+
+_RERUN_KEY = "_profile_run"
+
+
+def start_rerun(state) -> None:
+    """
+    Call at the top of app.py. Finishes the previous rerun's profile if st.rerun()
+    or st.stop() cut it short, then (if sampled) starts profiling this rerun.
+    """
+    if not RERUNS_ENABLED:
+        return
+    previous = state.get(_RERUN_KEY)
+    if previous is not None:
+        previous.finish(note="interrumpido por st.rerun/st.stop")
+        state[_RERUN_KEY] = None
+    if getattr(_active, "run", None) is None and _should_sample():
+        state[_RERUN_KEY] = ProfileRun("rerun").start()
+
+
+def finish_rerun(state) -> None:
+    """Call at the bottom of app.py."""
+    if not RERUNS_ENABLED:
+        return
+    run = state.get(_RERUN_KEY)
+    if run is not None:
+        run.finish()
+        state[_RERUN_KEY] = None
+
+
+# ─── Scraping calls ───────────────────────────────────────────────────────────
+
+def profiled(label: str):
+    """
+    Decorator: profile calls of the function when ECU_PROFILE is 'calls' or 'all'
+    (sampled by ECU_PROFILE_RATE; skipped inside an already profiled rerun or call).
+    A no-op wrapper-free decorator when profiling is off.
+    """
+    def decorator(fn):
+        if not CALLS_ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if getattr(_active, "run", None) is not None or not _should_sample():
+                return fn(*args, **kwargs)
+            run = ProfileRun(label).start()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                if run is not None:
+                    run.finish()
+
+        return wrapper
+    return decorator
@@ -0,0 +1,237 @@
+"""
+ranked_search.py
+Typo-tolerant ranked search over the catalogue snapshot (catalogue.py).
+
+Degree titles are accent-folded and tokenized like the subject index and
+scored with BM25. Query words missing from the vocabulary (typos such as
+"infromatica") are expanded to the closest vocabulary words by trigram
+overlap and edit distance, and the last word also matches as a prefix, so
+partial words work while typing. Results come back ranked, in milliseconds,
+without any RUCT round trip.
+
+    python ranked_search.py "ingenieria infromatica" --tipo G
+"""
+
+import re
+import math
+import bisect
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from catalogue import load_snapshot
+from ruct_scraper import RESULT_COLUMNS, _strip_accents
+from subject_index import tokenize
+
+K1 = 1.2                  # BM25 term-frequency saturation
+B = 0.75                  # BM25 length normalization
+MIN_TRIGRAM_SIM = 0.3     # Jaccard similarity of trigrams for a fuzzy candidate
+MAX_EXPANSIONS = 6        # vocabulary words one misspelt query word may stand for
+PREFIX_WEIGHT = 0.8       # weight of a prefix match of the last query word
+PHRASE_BOOST = 1.3        # every query word, stopwords included, in order and adjacent in the title
+
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def _fold(text: str) -> str:
+    return " ".join(_strip_accents(str(text or "")).lower().split())
+
+
+def _phrase(text: str) -> str:
+    """Folded word sequence, space-padded so `in` matches whole adjacent words only."""
+    return " " + " ".join(_WORD_RE.findall(_fold(text))) + " "
+
+
+def _trigrams(token: str) -> set[str]:
+    padded = f"${token}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a: str, b: str, max_dist: int = 2) -> int:
+    """
+    Optimal-string-alignment distance (an adjacent transposition costs 1),
+    capped at max_dist + 1 so hopeless candidates are abandoned early.
+    """
+    if abs(len(a) - len(b)) > max_dist:
+        return max_dist + 1
+    prev2: list[int] = []
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            v = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (a[i - 1] != b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                v = min(v, prev2[j - 2] + 1)
+            cur[j] = v
+        if min(cur) > max_dist:
+            return max_dist + 1
+        prev2, prev = prev, cur
+    return min(prev[-1], max_dist + 1)
+
+
+def _max_typos(token: str) -> int:
+    return 1 if len(token) <= 5 else 2
+
+
+class RankedIndex:
+    """
+    BM25 index over the titles of a catalogue frame: per vocabulary word, the
+    ids of the titles containing it and their precomputed BM25 weights, plus a
+    trigram index over the vocabulary for fuzzy lookups.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df.reset_index(drop=True)
+        docs = [tokenize(t) for t in self.df["titulo"].astype(str)]
+        n = len(docs)
+        doc_len = np.array([len(d) for d in docs], dtype=np.float32)
+        avgdl = float(doc_len.mean()) if n and doc_len.mean() else 1.0
+
+        postings: dict[str, Counter] = {}
+        for i, toks in enumerate(docs):
+            for t in toks:
+                postings.setdefault(t, Counter())[i] += 1
+
+        self.vocab = sorted(postings)
+        self._vocab_ids = {t: v for v, t in enumerate(self.vocab)}
+        self._ids: list[np.ndarray] = []
+        self._weights: list[np.ndarray] = []
+        norm = K1 * (1 - B + B * doc_len / avgdl)
+        for t in self.vocab:
+            ids = np.fromiter(postings[t].keys(), dtype=np.int32)
+            tf = np.fromiter(postings[t].values(), dtype=np.float32)
+            idf = math.log(1 + (n - len(ids) + 0.5) / (len(ids) + 0.5))
+            self._ids.append(ids)
+            self._weights.append((idf * tf * (K1 + 1) / (tf + norm[ids])).astype(np.float32))
+
+        self._grams: dict[str, list[int]] = {}
+        self._n_grams = []
+        for v, t in enumerate(self.vocab):
+            grams = _trigrams(t)
+            self._n_grams.append(len(grams))
+            for g in grams:
+                self._grams.setdefault(g, []).append(v)
+
+        self._titles = [_fold(t) for t in self.df["titulo"]]
+        self._phrases = [_phrase(t) for t in self.df["titulo"]]
+        self._tipo = self.df["tipo"].astype(str).to_numpy() if "tipo" in self.df else None
+        self._univ = np.array([_fold(u) for u in self.df.get("universidad", pd.Series(dtype=str))])
+
+    def __len__(self) -> int:
+        return len(self.df)
+
+    def _fuzzy(self, token: str) -> list[tuple[int, float]]:
+        """Closest vocabulary words to an unknown token: [(vocab id, weight)]."""
+        grams = _trigrams(token)
+        shared: Counter = Counter()
+        for g in grams:
+            shared.update(self._grams.get(g, ()))
+        max_dist = _max_typos(token)
+        found = []
+        for v, c in shared.items():
+            if c / (len(grams) + self._n_grams[v] - c) < MIN_TRIGRAM_SIM:
+                continue
+            d = edit_distance(token, self.vocab[v], max_dist)
+            if d <= max_dist:
+                found.append((d, -c, v))
+        found.sort()
+        return [(v, 1.0 - d / (len(token) + 1)) for d, _, v in found[:MAX_EXPANSIONS]]
+
+    def expand(self, token: str, last: bool = False) -> dict[int, float]:
+        """Vocabulary words a query word matches, with their weights (exact 1.0)."""
+        out: dict[int, float] = {}
+        vid = self._vocab_ids.get(token)
+        if vid is not None:
+            out[vid] = 1.0
+        if last and len(token) >= 3:
+            i = bisect.bisect_left(self.vocab, token)
+            while i < len(self.vocab) and self.vocab[i].startswith(token):
+                out.setdefault(i, PREFIX_WEIGHT)
+                i += 1
+        if vid is None and len(token) >= 4:
+            for v, w in self._fuzzy(token):
+                out[v] = max(out.get(v, 0.0), w)
+        return out
+
+    def _mask(self, tipo: str, universidad: str) -> np.ndarray | None:
+        mask = None
+        if tipo and self._tipo is not None:
+            mask = self._tipo == tipo
+        if universidad and len(self._univ):
+            m = self._univ == _fold(universidad)
+            mask = m if mask is None else mask & m
+        return mask
+
+    def search(self, query: str, tipo: str = "", universidad: str = "", limit: int = 200) -> pd.DataFrame:
+        """
+        Catalogue rows ranked by relevance to `query` (RESULT_COLUMNS plus
+        'relevancia'). Titles must match at least one query word; titles
+        matching more of them rank first. With an empty query, every row of the
+        tipo/universidad filters is returned in title order.
+        """
+        n = len(self.df)
+        mask = self._mask(tipo, universidad)
+        tokens = tokenize(query)
+        if not tokens:
+            if mask is None:
+                return self._rows(np.array([], dtype=np.int64), np.array([]))
+            ids = np.flatnonzero(mask)
+            ids = ids[np.argsort(np.array(self._titles, dtype=object)[ids], kind="stable")][:limit]
+            return self._rows(ids, np.zeros(len(ids)))
+
+        scores = np.zeros(n, dtype=np.float32)
+        matched = np.zeros(n, dtype=np.float32)
+        for i, tok in enumerate(tokens):
+            token_scores = np.zeros(n, dtype=np.float32)
+            for v, w in self.expand(tok, last=(i == len(tokens) - 1)).items():
+                ids = self._ids[v]
+                token_scores[ids] = np.maximum(token_scores[ids], w * self._weights[v])
+            scores += token_scores
+            matched += token_scores > 0
+        scores *= matched / len(tokens)         # coverage: titles with every word first
+        if mask is not None:
+            scores[~mask] = 0
+
+        cand = np.flatnonzero(scores > 0)
+        phrase = _phrase(query)
+        if len(tokens) > 1 and phrase.count(" ") > 2:
+            for i in cand:
+                if phrase in self._phrases[i]:
+                    scores[i] *= PHRASE_BOOST
+        if len(cand) > limit:
+            cand = cand[np.argpartition(-scores[cand], limit - 1)[:limit]]
+        order = cand[np.lexsort((cand, -scores[cand]))]
+        return self._rows(order, scores[order])
+
+    def _rows(self, ids: np.ndarray, scores: np.ndarray) -> pd.DataFrame:
+        cols = [c for c in RESULT_COLUMNS if c in self.df.columns]
+        out = self.df.iloc[ids][cols].reset_index(drop=True)
+        out["relevancia"] = np.round(scores.astype(float), 3)
+        return out
+
+    @classmethod
+    def from_snapshot(cls, path: str | None = None) -> "RankedIndex":
+        """Index of the catalogue snapshot (empty if it has not been built yet)."""
+        return cls(load_snapshot(path) if path else load_snapshot())
+
+
+if __name__ == "__main__":
+    import time
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Búsqueda local por relevancia en el catálogo (tolera erratas).")
+    parser.add_argument("query")
+    parser.add_argument("--tipo", default="", help="G=Grado, M=Máster, D=Doctor, ''=todos")
+    parser.add_argument("--universidad", default="", help="Nombre de la universidad")
+    parser.add_argument("-n", "--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    index = RankedIndex.from_snapshot()
+    t0 = time.perf_counter()
+    hits = index.search(args.query, args.tipo, args.universidad, args.limit)
+    ms = (time.perf_counter() - t0) * 1000
+    for r in hits.itertuples(index=False):
+        print(f"{r.relevancia:6.2f}  {r.titulo} — {r.universidad}")
+    print(f"{len(hits)} resultados de {len(index):,} titulaciones en {ms:.1f} ms")
@@ -0,0 +1,178 @@
+"""
+records.py
+Compact record types for study-plan subjects and degree fichas.
+
+Subject and Ficha are slotted dataclasses (no per-instance __dict__) whose
+repetitive categorical values (categoria, carácter, curso, rama, CCAA…) are
+interned, so thousands of cached plans share a handful of string objects.
+Both keep the read-only dict interface the app already uses (s["ects"],
+ficha.get("rama"), {**ficha}), and plans are stored in the cache with their
+subjects as columns (struct of arrays) instead of one JSON object per subject.
+"""
+
+import sys
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+class _RecordMapping(Mapping):
+    """Dict-style read access over the dataclass fields (in __match_args__)."""
+
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if key in self.__match_args__:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self.__match_args__)
+
+    def __len__(self) -> int:
+        return len(self.__match_args__)
+
+    def to_dict(self) -> dict:
+        return {k: getattr(self, k) for k in self.__match_args__}
+
+
+# ─── Subjects ─────────────────────────────────────────────────────────────────
+
+@dataclass(slots=True, eq=False)
+class Subject(_RecordMapping):
+    nombre: str = ""
+    caracter: str = ""
+    categoria: str = ""
+    ects: float = 0.0
+    curso: str = ""
+    semestre: str = ""
+
+    def __post_init__(self):
+        self.caracter = _intern(self.caracter)
+        self.categoria = _intern(self.categoria)
+        self.curso = _intern(self.curso)
+        self.semestre = _intern(self.semestre)
+
+    @classmethod
+    def from_dict(cls, d: Mapping) -> "Subject":
+        return cls(**{k: d[k] for k in cls.__match_args__ if k in d})
+
+
+SUBJECT_FIELDS = Subject.__match_args__
+
+
+def subjects_to_columns(subjects) -> dict:
+    """Struct-of-arrays form of a subject list: {field: [values…]} (dicts or Subjects)."""
+    rows = [s if isinstance(s, Subject) else Subject.from_dict(s) for s in subjects]
+    return {k: [getattr(s, k) for s in rows] for k in SUBJECT_FIELDS}
+
+
+def subjects_from_columns(columns) -> list[Subject]:
+    """Inverse of subjects_to_columns; also accepts the older list-of-dicts form."""
+    if isinstance(columns, list):
+        return [s if isinstance(s, Subject) else Subject.from_dict(s) for s in columns]
+    return [Subject(*row) for row in zip(*(columns[k] for k in SUBJECT_FIELDS))]
+
+
+# ─── Fichas ───────────────────────────────────────────────────────────────────
+
+_FICHA_INTERNED = ("universidad", "centro", "ccaa", "nivel", "meces", "rama", "campo", "habilita")
+
+
+@dataclass(slots=True, eq=False)
+class Ficha(_RecordMapping):
+    denominacion: str = ""
+    universidad: str = ""
+    centro: str = ""
+    ccaa: str = ""
+    nivel: str = ""
+    meces: str = ""
+    rama: str = ""
+    campo: str = ""
+    habilita: str = ""
+    profesion_regulada: str = ""
+    acuerdo: str = ""
+    norma: str = ""
+    boe_plan_url: str = ""
+    menciones: list = field(default_factory=list)
+    especialidades: list = field(default_factory=list)
+    creditos: dict = field(default_factory=dict)
+    extra: dict = field(default_factory=dict, kw_only=True)   # keys without a field
+
+    def __post_init__(self):
+        for k in _FICHA_INTERNED:
+            setattr(self, k, _intern(getattr(self, k)))
+
+    def __getitem__(self, key):
+        if key in self.__match_args__:
+            return getattr(self, key)
+        return self.extra[key]
+
+    def __setitem__(self, key, value):
+        if key in self.__match_args__:
+            setattr(self, key, _intern(value) if key in _FICHA_INTERNED else value)
+        else:
+            self.extra[key] = value
+
+    def __iter__(self):
+        yield from self.__match_args__
+        yield from self.extra
+
+    def __len__(self) -> int:
+        return len(self.__match_args__) + len(self.extra)
+
+    def to_dict(self) -> dict:
+        return {**{k: getattr(self, k) for k in self.__match_args__}, **self.extra}
+
+    @classmethod
+    def from_dict(cls, d: Mapping) -> "Ficha":
+        if isinstance(d, Ficha):
+            return d
+        known = {k: d[k] for k in cls.__match_args__ if k in d and d[k] is not None}
+        extra = {k: v for k, v in d.items() if k not in cls.__match_args__}
+        return cls(**known, extra=extra)
+
+
+# ─── Cache codecs ─────────────────────────────────────────────────────────────
+
+_PLAN_SUBJECT_KEYS = ("subjects_boe", "subjects_ruct")
+
+
+def encode_plan(plan: Mapping) -> dict:
+    """JSON-ready plan: ficha as a dict, subject lists as columns."""
+    out = dict(plan)
+    ficha = out.get("ficha")
+    if isinstance(ficha, Ficha):
+        out["ficha"] = ficha.to_dict()
+    for k in _PLAN_SUBJECT_KEYS:
+        if out.get(k):
+            out[k] = subjects_to_columns(out[k])
+    return out
+
+
+def decode_plan(data: dict) -> dict:
+    """Plan as used by the app: Ficha and Subject records (accepts the older row form)."""
+    if isinstance(data.get("ficha"), Mapping):
+        data["ficha"] = Ficha.from_dict(data["ficha"])
+    for k in _PLAN_SUBJECT_KEYS:
+        if data.get(k):
+            data[k] = subjects_from_columns(data[k])
+    return data
+
+
+def encode_ficha(ficha: Mapping) -> dict:
+    return ficha.to_dict() if isinstance(ficha, Ficha) else dict(ficha)
+
+
+def decode_ficha(data: dict) -> Ficha:
+    return Ficha.from_dict(data)
+
+
+def to_jsonable(obj):
+    """json.dumps default= hook for records nested in API responses."""
+    if isinstance(obj, Mapping):
+        return dict(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
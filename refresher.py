@@ -0,0 +1,270 @@
+"""
+refresher.py
+Background refresh of the data the app serves, off the request path.
+
+Jobs, each on its own period:
+    options     RUCT search-form options (universities, types, branches…)
+    snapshot    catalogue snapshot delta: re-list, fetch fichas of new/changed degrees
+    aggregates  analytics tables, incrementally, whenever the snapshot changed
+    index       subject index: fold its journal into the snapshot once it grows too long
+
+Every job builds the new version aside, validates it and swaps it in with an
+atomic rename, so readers always see a complete old or new version and no
+user request waits for a refresh. Last runs are kept in a small state file
+and one process per host holds the scheduler lock, so it can run inside every
+app process (the first one takes the lock; the others stand by and take over
+if it dies) or as a standalone daemon:
+
+    python refresher.py run                # daemon (set ECU_REFRESH=off for the app)
+    python refresher.py once snapshot      # one job now
+    python refresher.py status
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+
+import analytics
+import catalogue
+import ruct_scraper
+import subject_index
+from cache_store import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+OPTIONS_PATH = os.path.join(DATA_DIR, "form_options.json")
+STATE_PATH = os.path.join(DATA_DIR, "refresh_state.json")
+LOCK_PATH = os.path.join(DATA_DIR, "refresher.lock")
+
+MODE = os.environ.get("ECU_REFRESH", "thread").strip().lower()     # 'thread' or 'off'
+POLL_SECONDS = 60.0
+SNAPSHOT_RATE = float(os.environ.get("ECU_REFRESH_RATE", "1.0"))   # RUCT requests/s of the snapshot job
+
+
+def _hours(name: str, default: float) -> float:
+    return float(os.environ.get(name, default)) * 3600
+
+
+# ─── Form options ─────────────────────────────────────────────────────────────
+
+def _write_json(data, path: str) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(data, fh, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def _valid_options(options: dict) -> bool:
+    """False for the hardcoded fallback load_form_options returns when the RUCT is down."""
+    univs = [v for _, v in options.get("universidades", []) if v]
+    return len(univs) > 1 and bool(options.get("tipos"))
+
+
+def refresh_options() -> bool:
+    """Fetch the form options and swap them in if they look complete."""
+    options = ruct_scraper.load_form_options(timeout=20)
+    if not _valid_options(options):
+        raise ValueError("opciones del formulario incompletas (¿RUCT caído?)")
+    _write_json(options, OPTIONS_PATH)
+    return True
+
+
+def options_version() -> str:
+    """Change marker of the stored form options ('' when there are none)."""
+    try:
+        st = os.stat(OPTIONS_PATH)
+    except FileNotFoundError:
+        return ""
+    return f"{st.st_mtime_ns}-{st.st_size}"
+
+
+def load_options() -> dict:
+    """
+    Form options for the app: the last refreshed copy, or (before the first
+    refresh) a live load, stored when complete.
+    """
+    try:
+        with open(OPTIONS_PATH, encoding="utf-8") as fh:
+            options = json.load(fh)
+        if _valid_options(options):
+            return options
+    except (FileNotFoundError, json.JSONDecodeError):
+        pass
+    options = ruct_scraper.load_form_options(timeout=20)
+    if _valid_options(options):
+        try:
+            _write_json(options, OPTIONS_PATH)
+        except OSError:
+            pass
+    return options
+
+
+# ─── Jobs ─────────────────────────────────────────────────────────────────────
+
+def _snapshot_job():
+    """
+    Snapshot delta under the crawler's shared rate budget: the listing and the
+    ficha fetches of enrich() together stay within SNAPSHOT_RATE requests/s.
+    The gate is process-wide, so the app runs this job in a child process.
+    """
+    import resilience
+    from crawler import CRAWL_PATH, SharedRateBudget
+
+    if not catalogue.snapshot_version():
+        return "sin instantánea (python catalogue.py build)"
+    resilience.set_request_gate(SharedRateBudget(CRAWL_PATH, SNAPSHOT_RATE).wait)
+    try:
+        return catalogue.refresh_snapshot(rate=SNAPSHOT_RATE, options=load_options())
+    finally:
+        resilience.set_request_gate(None)
+
+
+JOBS = {
+    "options": (_hours("ECU_REFRESH_OPTIONS_HOURS", 1), refresh_options),
+    "snapshot": (_hours("ECU_REFRESH_SNAPSHOT_HOURS", 24), _snapshot_job),
+    "aggregates": (_hours("ECU_REFRESH_AGGREGATES_HOURS", 0.25), analytics.refresh_aggregates),
+    "index": (_hours("ECU_REFRESH_INDEX_HOURS", 1), subject_index.compact),
+}
+CHILD_JOBS = ("snapshot",)     # run in a child process by the in-app scheduler (request gate)
+
+
+# ─── Scheduler ────────────────────────────────────────────────────────────────
+
+class RefreshScheduler:
+    """Runs the due JOBS while holding the host-wide lock; last runs in STATE_PATH."""
+
+    def __init__(self, jobs: dict = JOBS, state_path: str = STATE_PATH, lock_path: str = LOCK_PATH,
+                 child_jobs=()):
+        self.jobs = jobs
+        self.child_jobs = set(child_jobs)
+        self.state_path = state_path
+        self.lock_path = lock_path
+        self._lock_file = None
+        self._stop = threading.Event()
+
+    def state(self) -> dict:
+        try:
+            with open(self.state_path, encoding="utf-8") as fh:
+                return json.load(fh)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def due(self) -> list[str]:
+        state, now = self.state(), time.time()
+        return [name for name, (every, _) in self.jobs.items()
+                if every > 0 and now - state.get(name, {}).get("at", 0) >= every]
+
+    def run_job(self, name: str) -> dict:
+        """Run one job now and record its outcome (failures wait for the next period too)."""
+        if name in self.child_jobs:
+            return self._run_child(name)
+        t0 = time.time()
+        try:
+            result = self.jobs[name][1]()
+            entry = {"at": t0, "ok": True, "result": result, "seconds": round(time.time() - t0, 1)}
+        except Exception as e:
+            logger.warning(f"Refresh job {name} failed: {e}")
+            entry = {"at": t0, "ok": False, "error": str(e), "seconds": round(time.time() - t0, 1)}
+        self._record(name, entry)
+        return entry
+
+    def _run_child(self, name: str) -> dict:
+        """Run a job as `refresher.py once <name>` (which records its own outcome) and wait for it."""
+        import sys
+        import subprocess
+
+        t0 = time.time()
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), "once", name],
+                              stdin=subprocess.DEVNULL, capture_output=True, text=True)
+        entry = self.state().get(name, {})
+        if proc.returncode != 0 or entry.get("at", 0) < t0:
+            error = (proc.stderr.strip().splitlines() or [f"código de salida {proc.returncode}"])[-1]
+            logger.warning(f"Refresh job {name} failed: {error}")
+            entry = {"at": t0, "ok": False, "error": error, "seconds": round(time.time() - t0, 1)}
+            self._record(name, entry)
+        return entry
+
+    def _record(self, name: str, entry: dict) -> None:
+        state = self.state()
+        state[name] = entry
+        _write_json(json.loads(json.dumps(state, default=str)), self.state_path)
+
+    def acquire(self) -> bool:
+        """Take (or keep) the host-wide scheduler lock."""
+        if self._lock_file is not None:
+            return True
+        import fcntl
+
+        os.makedirs(os.path.dirname(self.lock_path) or ".", exist_ok=True)
+        fh = open(self.lock_path, "w")
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            fh.close()
+            return False
+        self._lock_file = fh
+        return True
+
+    def run_forever(self, poll: float = POLL_SECONDS) -> None:
+        while not self._stop.is_set():
+            if self.acquire():
+                for name in self.due():
+                    if self._stop.is_set():
+                        break
+                    self.run_job(name)
+            self._stop.wait(poll)
+
+    def start(self) -> threading.Thread:
+        """Run the scheduler on a daemon thread of this process."""
+        thread = threading.Thread(target=self.run_forever, name="refresher", daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+def start_in_process() -> RefreshScheduler | None:
+    """Scheduler thread for the app (None with ECU_REFRESH=off, e.g. when the daemon runs)."""
+    if MODE == "off":
+        return None
+    scheduler = RefreshScheduler(child_jobs=CHILD_JOBS)
+    scheduler.start()
+    return scheduler
+
+
+if __name__ == "__main__":
+    import sys
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Actualización periódica de opciones, catálogo y estadísticas.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("run", help="Ejecutar el planificador (demonio)")
+    p_once = sub.add_parser("once", help="Ejecutar ahora los trabajos indicados (o los pendientes)")
+    p_once.add_argument("jobs", nargs="*", metavar="trabajo", help=", ".join(JOBS))
+    sub.add_parser("status", help="Última ejecución de cada trabajo")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr, format="%(asctime)s %(message)s")
+    scheduler = RefreshScheduler()
+    if args.cmd == "run":
+        if not scheduler.acquire():
+            sys.exit("Ya hay un planificador en marcha en este equipo")
+        scheduler.run_forever()
+    elif args.cmd == "once":
+        unknown = [name for name in args.jobs if name not in JOBS]
+        if unknown:
+            parser.error(f"trabajo desconocido: {', '.join(unknown)} (opciones: {', '.join(JOBS)})")
+        for name in args.jobs or scheduler.due():
+            print(name, scheduler.run_job(name))
+    else:
+        state = scheduler.state()
+        for name, (every, _) in JOBS.items():
+            entry = state.get(name)
+            when = time.strftime("%d/%m/%Y %H:%M", time.localtime(entry["at"])) if entry else "nunca"
+            outcome = "" if not entry else ("ok" if entry["ok"] else f"error: {entry['error']}")
+            period = f"cada {every / 3600:g} h" if every > 0 else "desactivado"
+            print(f"{name:<11} {period} · {when} {outcome}")
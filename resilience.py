@@ -0,0 +1,239 @@
+"""
+resilience.py
+Resilience layer for the upstream sites (educacion.gob.es, www.boe.es).
+
+- Per-host circuit breakers: after repeated connection errors, timeouts or 5xx
+  answers, requests to that host fail fast with CircuitOpenError for a while
+  instead of each one waiting for its timeout.
+- Stale-while-revalidate reads over the shared cache: an entry older than its
+  soft TTL is still returned at once (marked stale) and refreshed in the
+  background, so users never wait for a refresh and an outage only means
+  slightly older data.
+- An optional process-wide request gate (e.g. the crawler's shared rate budget)
+  that every upstream request waits on.
+"""
+
+import time
+import logging
+import threading
+from typing import NamedTuple
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from cache_store import get_store
+
+logger = logging.getLogger(__name__)
+
+FAILURE_THRESHOLD = 5     # consecutive failures that open a breaker
+RESET_TIMEOUT = 30.0      # seconds a breaker stays open before a trial request
+
+
+# ─── Circuit breakers ─────────────────────────────────────────────────────────
+
+class CircuitOpenError(requests.ConnectionError):
+    """Raised without touching the network while a host's breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Closed → open after FAILURE_THRESHOLD consecutive failures; after
+    RESET_TIMEOUT seconds one trial request is let through (half-open) and its
+    outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, host: str, failure_threshold: int = FAILURE_THRESHOLD,
+                 reset_timeout: float = RESET_TIMEOUT):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                return "half_open"
+            return "open"
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError unless a request to this host may go out now."""
+        with self._lock:
+            if self.opened_at is None:
+                return
+            remaining = self.reset_timeout - (time.monotonic() - self.opened_at)
+            if remaining > 0 or self._trial:
+                raise CircuitOpenError(
+                    f"{self.host} no responde (circuito abierto tras {self.failures} fallos); "
+                    f"nuevo intento en {max(remaining, 0):.0f} s"
+                )
+            self._trial = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info("Circuit for %s closed", self.host)
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def release_trial(self) -> None:
+        """End a trial request that neither succeeded nor failed on the network (e.g. a bad URL)."""
+        with self._lock:
+            self._trial = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._trial = False
+            if self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.warning("Circuit for %s opened after %d failures", self.host, self.failures)
+                self.opened_at = time.monotonic()
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+_request_gate = None    # callable run before each upstream request (set_request_gate)
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(url: str) -> CircuitBreaker:
+    """The process-wide breaker of a URL's host."""
+    host = urlsplit(url).hostname or url
+    with _breakers_lock:
+        if host not in _breakers:
+            _breakers[host] = CircuitBreaker(host)
+        return _breakers[host]
+
+
+def is_open(url: str) -> bool:
+    """True while requests to the URL's host are being short-circuited."""
+    return breaker_for(url).state == "open"
+
+
+def set_request_gate(gate) -> None:
+    """
+    Make every ResilientSession request in this process call gate() first
+    (e.g. a rate budget shared by several processes).
+    None removes the gate.
+    """
+    global _request_gate
+    _request_gate = gate
+
+
+class ResilientSession(requests.Session):
+    """requests.Session whose requests go through the per-host circuit breakers."""
+
+    def request(self, method, url, *args, **kwargs):
+        breaker = breaker_for(url)
+        if _request_gate is not None:
+            _request_gate()     # before the breaker: a slow gate must not hold a half-open trial
+        breaker.before_call()
+        try:
+            resp = super().request(method, url, *args, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            breaker.record_failure()
+            raise
+        except BaseException:
+            breaker.release_trial()     # otherwise the breaker would stay open for good
+            raise
+        if resp.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        return resp
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    """requests.get through a ResilientSession."""
+    with ResilientSession() as session:
+        return session.get(url, **kwargs)
+
+
+# ─── Stale-while-revalidate ───────────────────────────────────────────────────
+
+class Cached(NamedTuple):
+    value: object
+    stale: bool                 # older than the soft TTL (a refresh has been scheduled)
+    stored_at: float | None     # None when the value was just loaded and not cached
+
+
+_refresh_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="swr-refresh")
+_refreshing: set = set()
+_refreshing_lock = threading.Lock()
+
+
+def _refresh(kind: str, key: str, loader, valid, store) -> None:
+    try:
+        value = loader()
+        if valid(value):
+            store.put(kind, key, value)
+    except Exception as e:
+        logger.info("Background refresh of %s/%s failed: %s", kind, key, e)
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard((kind, key))
+
+
+def schedule_refresh(kind: str, key: str, loader, valid=lambda v: v is not None, store=None) -> bool:
+    """Refresh one cache entry in the background (once at a time per entry)."""
+    with _refreshing_lock:
+        if (kind, key) in _refreshing:
+            return False
+        _refreshing.add((kind, key))
+    _refresh_pool.submit(_refresh, kind, key, loader, valid, store or get_store())
+    return True
+
+
+def wait_for_refreshes(timeout: float | None = None) -> bool:
+    """Block until the scheduled background refreshes are done; False on timeout."""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        with _refreshing_lock:
+            if not _refreshing:
+                return True
+        if deadline is not None and time.monotonic() > deadline:
+            return False
+        time.sleep(0.2)
+
+
+def swr_get(
+    kind: str,
+    key: str,
+    loader,
+    soft_ttl: float,
+    valid=lambda v: v is not None,
+    usable=lambda v: True,
+    store=None,
+) -> Cached:
+    """
+    Read (kind, key) from the shared cache, stale-while-revalidate.
+
+    loader  Callable returning a fresh value (may raise)
+    valid   Whether a loaded value is good enough to cache (failed scrapes are not)
+    usable  Whether a cached value can still be served (e.g. same format version)
+
+    A usable entry is always returned immediately; past soft_ttl it is marked
+    stale and a background refresh is scheduled. Without one, the loader runs
+    synchronously and its value is returned (and cached if valid).
+    """
+    store = store or get_store()
+    entry = store.get_entry(kind, key)
+    if entry is not None and usable(entry[0]):
+        value, stored_at = entry
+        stale = time.time() - stored_at > soft_ttl
+        if stale:
+            schedule_refresh(kind, key, loader, valid, store)
+        return Cached(value, stale, stored_at)
+
+    value = loader()
+    if valid(value):
+        store.put(kind, key, value)
+        return Cached(value, False, time.time())
+    return Cached(value, False, None)
@@ -0,0 +1,92 @@
+"""
+ruct_batch.py
+Command-line batch search over the RUCT: runs many degree-name queries
+concurrently (ruct_scraper.search_ruct_many) and streams the merged,
+codigo-deduplicated results to disk.
+
+Examples:
+    python ruct_batch.py "Medicina" "Enfermería" "Fisioterapia" -o salud.csv
+    python ruct_batch.py -f ingenierias.txt -o ingenierias.xlsx --workers 6 --rate 3
+"""
+
+import sys
+import logging
+import argparse
+
+import ruct_scraper
+
+_FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".xlsx": "xlsx", ".parquet": "parquet"}
+
+
+def _read_queries(args) -> list[str]:
+    """Collect queries from positional args and/or a file (one per line, '#' comments)."""
+    queries = list(args.queries)
+    if args.file:
+        fh = sys.stdin if args.file == "-" else open(args.file, encoding="utf-8")
+        with fh:
+            for line in fh:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    queries.append(line)
+    # Keep order, drop repeated queries
+    return list(dict.fromkeys(queries))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Búsqueda en lote en el RUCT con resultados combinados y sin duplicados.",
+    )
+    parser.add_argument("queries", nargs="*", help="Denominaciones a buscar")
+    parser.add_argument("-f", "--file", help="Fichero con una denominación por línea ('-' = stdin)")
+    parser.add_argument("-o", "--output", required=True,
+                        help="Fichero de salida (.csv, .jsonl, .xlsx o .parquet)")
+    parser.add_argument("--format", choices=sorted(set(_FORMATS.values())),
+                        help="Formato de salida (por defecto, según la extensión)")
+    parser.add_argument("--tipo", default="G", help="G=Grado, M=Máster, D=Doctor, ''=todos")
+    parser.add_argument("--universidad", default="", help="Código de universidad ('' = todas)")
+    parser.add_argument("--rama", default="", help="Código de rama ('' = todas)")
+    parser.add_argument("--estado", default="P")
+    parser.add_argument("--situacion", default="A")
+    parser.add_argument("--max-paginas", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=4, help="Búsquedas simultáneas")
+    parser.add_argument("--rate", type=float, default=2.5,
+                        help="Peticiones por segundo como máximo (global)")
+    parser.add_argument("--no-dedupe", action="store_true",
+                        help="No eliminar filas repetidas por código")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr, format="%(message)s")
+
+    queries = _read_queries(args)
+    if not queries:
+        parser.error("indica al menos una denominación o un fichero con -f")
+
+    fmt = args.format
+    if not fmt:
+        ext = args.output[args.output.rfind("."):].lower() if "." in args.output else ""
+        fmt = _FORMATS.get(ext, "csv")
+
+    n_rows, warnings = ruct_scraper.search_ruct_many(
+        queries,
+        workers=args.workers,
+        rate=args.rate,
+        dedupe=not args.no_dedupe,
+        output=args.output,
+        fmt=fmt,
+        progress_callback=lambda i, n, q: logging.info(f"[{i}/{n}] {q}"),
+        tipo=args.tipo,
+        universidad=args.universidad,
+        rama=args.rama,
+        estado=args.estado,
+        situacion=args.situacion,
+        max_paginas=args.max_paginas,
+    )
+
+    for q, warn in warnings.items():
+        logging.warning(f"{q}: {warn}")
+    logging.info(f"{n_rows} titulaciones únicas escritas en {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
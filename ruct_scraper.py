@@ -7,13 +7,26 @@ https://www.educacion.gob.es/ruct/
 
 import io
 import re
+import json
+import inspect
 import time
+import queue
 import logging
+import threading
 import unicodedata
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from dataclasses import dataclass, field
 import requests
 from bs4 import BeautifulSoup
 import pandas as pd
 
+import resilience
+from cache_store import get_store
+from resilience import ResilientSession
+from profiling import profiled
+from singleflight import coalesce, flights
+
 logger = logging.getLogger(__name__)
 
 BASE_URL = "https://www.educacion.gob.es/ruct"
@@ -110,7 +123,7 @@ def load_form_options(timeout: int = 20) -> dict:
     Falls back to hardcoded defaults if the connection fails.
     """
     try:
-        r = requests.get(FORM_URL, headers=HEADERS, timeout=timeout)
+        r = resilience.get(FORM_URL, headers=HEADERS, timeout=timeout)
         r.raise_for_status()
         soup = BeautifulSoup(r.text, "lxml")
 
@@ -142,6 +155,169 @@ def load_form_options(timeout: int = 20) -> dict:
         }
 
 
+class RateLimiter:
+    """
+    Thread-safe global request budget shared by concurrent searches.
+    Hands out request slots spaced 1/rate seconds apart, so N workers together
+    never exceed `rate` requests per second against the RUCT.
+    """
+
+    def __init__(self, rate: float = 2.5):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def wait(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        delay = slot - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def _pause(rate_limiter: RateLimiter | None, seconds: float) -> None:
+    """Wait for the shared rate limiter, or sleep a fixed delay without one."""
+    if rate_limiter is not None:
+        rate_limiter.wait()
+    else:
+        time.sleep(seconds)
+
+
+class SearchSession(ResilientSession):
+    """
+    Session (behind the RUCT circuit breaker) that remembers the parsed RUCT search form, so repeated
+    searches on a warm session skip the form GET (and reuse the keep-alive
+    connection). Forms carrying a one-time token are always re-fetched.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.headers.update(HEADERS)
+        self.form_state: dict | None = None
+
+
+def _open_search_form(session: requests.Session, timeout: int) -> dict:
+    """
+    GET the RUCT search form and return its state:
+    {post_url, hidden_fields, submit_name, submit_value}.
+    The form action URL contains the jsessionid of the server-side session.
+    """
+    init_r = session.get(FORM_URL, timeout=timeout)
+    init_soup = BeautifulSoup(init_r.text, "lxml")
+    form = init_soup.find("form")
+    if form and form.get("action"):
+        action = form["action"]
+        post_url = (
+            action if action.startswith("http")
+            else f"https://www.educacion.gob.es{action}"
+        )
+    else:
+        post_url = f"{FORM_URL}?actual=estudios"
+
+    # Extract all hidden input fields from the form (tokens, session fields, etc.)
+    hidden_fields = {}
+    if form:
+        for inp in form.find_all("input", {"type": "hidden"}):
+            name = inp.get("name")
+            value = inp.get("value", "")
+            if name:
+                hidden_fields[name] = value
+
+    # Find the submit button name/value dynamically
+    submit_name = "action:listaestudios"
+    submit_value = "Consultar"
+    if form:
+        for inp in form.find_all("input", {"type": "submit"}):
+            name = inp.get("name")
+            value = inp.get("value", "Consultar")
+            if name:
+                submit_name = name
+                submit_value = value
+                break
+
+    return {
+        "post_url": post_url,
+        "hidden_fields": hidden_fields,
+        "submit_name": submit_name,
+        "submit_value": submit_value,
+    }
+
+
+def _form_state_for(session: requests.Session, timeout: int) -> dict:
+    """Return the cached form state of a warm SearchSession, fetching it when needed."""
+    state = getattr(session, "form_state", None)
+    if state is None or any("token" in k.lower() for k in state["hidden_fields"]):
+        state = _open_search_form(session, timeout)
+        if isinstance(session, SearchSession):
+            session.form_state = state
+    return state
+
+
+_SEARCH_PARAM_FIELDS = ("descripcion", "codigo", "universidad", "tipo", "rama", "ambito",
+                        "estado", "situacion", "historico")
+
+
+def _search_payload(form_state: dict, params: dict) -> dict:
+    """Form POST for a search: the form's hidden fields overridden by the search filters."""
+    return {
+        **form_state["hidden_fields"],
+        "consulta": "1",
+        "codigoEstudio": params.get("codigo", "").strip(),
+        "descripcionEstudio": _strip_accents(params.get("descripcion", "").strip()),
+        "codigoUniversidad": params.get("universidad", ""),
+        "codigoTipo": params.get("tipo", ""),
+        "codigoSubTipo": "",
+        "codigoRama": params.get("rama", ""),
+        "ambito": params.get("ambito", ""),
+        "codigoEstado": params.get("estado", ""),
+        "situacion": params.get("situacion", ""),
+        "buscarHistorico": params.get("historico", "N"),
+        form_state["submit_name"]: form_state["submit_value"],
+    }
+
+
+class SearchSessionExpired(requests.RequestException):
+    """A results page came back without results or a record count (the server-side search was lost)."""
+
+
+@dataclass
+class SearchCursor:
+    """
+    Where a search_ruct run stopped: its filters, its session and the last
+    parsed page with that page's "Siguiente" URL, so resume_search can fetch
+    the remaining pages without refetching the ones already parsed.
+    """
+    params: dict = field(default_factory=dict)      # search filters (_SEARCH_PARAM_FIELDS)
+    session: requests.Session | None = None         # None: re-established on resume
+    page: int = 0                                   # last successfully parsed page
+    next_url: str | None = None                     # its "Siguiente" link; None when exhausted
+    rows: int = 0                                   # rows parsed so far
+
+    @property
+    def resumable(self) -> bool:
+        return bool(self.next_url)
+
+    def advance(self, page: int, next_url: str | None, rows: int) -> None:
+        self.page = page
+        self.next_url = next_url
+        self.rows += rows
+
+
+_SEARCH_KEY_FIELDS = _SEARCH_PARAM_FIELDS + ("max_paginas",)
+
+
+def _search_flight_key(args: dict):
+    """Normalized search parameters; None (no coalescing) for calls carrying private state."""
+    if any(args.get(k) is not None
+           for k in ("progress_callback", "session", "rate_limiter", "stats", "cursor")):
+        return None
+    return tuple(" ".join(str(args[k]).lower().split()) for k in _SEARCH_KEY_FIELDS)
+
+
+@coalesce("search", _search_flight_key)
+@profiled("search_ruct")
 def search_ruct(
     descripcion: str = "",
     codigo: str = "",
@@ -155,6 +331,10 @@ def search_ruct(
     timeout: int = 30,
     max_paginas: int = 200,
     progress_callback=None,
+    session: requests.Session | None = None,
+    rate_limiter: RateLimiter | None = None,
+    stats: dict | None = None,
+    cursor: SearchCursor | None = None,
 ) -> tuple[pd.DataFrame, str | None]:
     """
     Search for university degrees in the RUCT.
@@ -173,68 +353,35 @@ def search_ruct(
     timeout        Max seconds to wait per HTTP request
     max_paginas    Maximum number of result pages to scrape
     progress_callback  Optional callable(page: int, total_rows: int)
+    session        Optional warm SearchSession to reuse (one search at a time)
+    rate_limiter   Optional RateLimiter shared with other concurrent searches
+    stats          Optional dict filled with {total, page_size, pages, truncated}
+    cursor         Optional SearchCursor kept at the last parsed page, so a run cut
+                   short by a timeout or the page limit can go on with resume_search
 
     Returns
     -------
     (DataFrame, warning_or_None)
     DataFrame columns: codigo, titulo, universidad, nivel, estado, url_ruct
     """
-    session = requests.Session()
-    session.headers.update(HEADERS)
+    if session is None:
+        session = SearchSession()
 
     # Initialize session and capture the form action URL (contains jsessionid)
     try:
-        init_r = session.get(FORM_URL, timeout=timeout)
-        init_soup = BeautifulSoup(init_r.text, "lxml")
-        form = init_soup.find("form")
-        if form and form.get("action"):
-            action = form["action"]
-            post_url = (
-                action if action.startswith("http")
-                else f"https://www.educacion.gob.es{action}"
-            )
-        else:
-            post_url = f"{FORM_URL}?actual=estudios"
+        form_state = _form_state_for(session, timeout)
     except requests.RequestException as e:
         return pd.DataFrame(columns=RESULT_COLUMNS), f"No se pudo conectar al RUCT: {e}"
 
-    # Extract all hidden input fields from the form (tokens, session fields, etc.)
-    hidden_fields = {}
-    if form:
-        for inp in form.find_all("input", {"type": "hidden"}):
-            name = inp.get("name")
-            value = inp.get("value", "")
-            if name:
-                hidden_fields[name] = value
-
-    # Find the submit button name/value dynamically
-    submit_name = "action:listaestudios"
-    submit_value = "Consultar"
-    if form:
-        for inp in form.find_all("input", {"type": "submit"}):
-            name = inp.get("name")
-            value = inp.get("value", "Consultar")
-            if name:
-                submit_name = name
-                submit_value = value
-                break
-
-    # Build payload: start with hidden fields, then override with our search params
-    payload = {
-        **hidden_fields,
-        "consulta": "1",
-        "codigoEstudio": codigo.strip(),
-        "descripcionEstudio": _strip_accents(descripcion.strip()),
-        "codigoUniversidad": universidad,
-        "codigoTipo": tipo,
-        "codigoSubTipo": "",
-        "codigoRama": rama,
-        "ambito": ambito,
-        "codigoEstado": estado,
-        "situacion": situacion,
-        "buscarHistorico": historico,
-        submit_name: submit_value,
-    }
+    params = dict(
+        descripcion=descripcion, codigo=codigo, universidad=universidad, tipo=tipo,
+        rama=rama, ambito=ambito, estado=estado, situacion=situacion, historico=historico,
+    )
+    post_url = form_state["post_url"]
+    payload = _search_payload(form_state, params)
+    if cursor is not None:
+        cursor.params, cursor.session = params, session
+        cursor.page, cursor.next_url, cursor.rows = 0, None, 0
 
     results = []
     warning = None
@@ -243,7 +390,7 @@ def search_ruct(
         # Page 1 — POST to the form action URL (includes jsessionid for server-side session)
         session.headers["Referer"] = FORM_URL
         session.headers["Content-Type"] = "application/x-www-form-urlencoded"
-        time.sleep(0.3)
+        _pause(rate_limiter, 0.3)
         r = session.post(
             post_url,
             data=payload,
@@ -254,15 +401,13 @@ def search_ruct(
 
         rows = _parse_table(soup)
         results.extend(rows)
+        if stats is not None:
+            stats.update(total=_parse_record_count(soup), page_size=len(rows),
+                         pages=1, truncated=False)
 
         # Detect if RUCT did not process the search (unexpected response)
         if not rows:
             page_text = soup.get_text()
-            has_marker = (
-                "Ningún registro encontrado" in page_text
-                or "Ningun registro encontrado" in page_text
-                or "registros encontrados" in page_text
-            )
             # Detect server-side validation error: requires at least one filter
             if "Por favor, introduzca" in page_text and "Denominaci" in page_text:
                 return (
@@ -271,7 +416,7 @@ def search_ruct(
                     "escribe una denominación, introduce un código de título, "
                     "o selecciona una universidad concreta.",
                 )
-            if not has_marker:
+            if not _has_result_marker(page_text):
                 snippet = " ".join(page_text.split())[:200]
                 return (
                     pd.DataFrame(columns=RESULT_COLUMNS),
@@ -284,50 +429,540 @@ def search_ruct(
         if progress_callback:
             progress_callback(1, len(results))
 
+        next_url = _next_page_url(soup)
+        if cursor is not None:
+            cursor.advance(1, next_url, len(rows))
         # Pages 2..N — GET following the "Siguiente" (Next) link
-        for page_num in range(2, max_paginas + 1):
-            next_url = _next_page_url(soup)
-            if not next_url:
-                break  # No more pages
+        warning = _follow_pages(session, next_url, 2, max_paginas, results, timeout,
+                                rate_limiter, progress_callback, stats, cursor)
 
-            time.sleep(0.4)  # Be polite to the server
+    except requests.RequestException as e:
+        warning = _request_warning(e, len(results))
 
-            r = session.get(next_url, timeout=timeout)
-            r.raise_for_status()
-            soup = BeautifulSoup(r.text, "lxml")
+    df = (
+        pd.DataFrame(results)
+        if results
+        else pd.DataFrame(columns=RESULT_COLUMNS)
+    )
+    return df, warning
 
-            rows = _parse_table(soup)
-            if not rows:
-                break
 
-            results.extend(rows)
+def _request_warning(e: requests.RequestException, n_results: int) -> str | None:
+    """User-facing warning for a request error that cut a search short."""
+    if isinstance(e, requests.Timeout):
+        return (
+            "Tiempo de espera agotado. "
+            f"Se muestran los {n_results} resultados obtenidos hasta ahora."
+        )
+    if isinstance(e, SearchSessionExpired):
+        return (
+            "La sesión del RUCT caducó durante la consulta. "
+            f"Se muestran los {n_results} resultados obtenidos hasta ahora."
+        )
+    if isinstance(e, requests.ConnectionError):
+        return f"Error de conexión con el RUCT: {e}"
+    if isinstance(e, requests.HTTPError):
+        return f"El servidor del RUCT devolvió un error: {e}"
+    return f"Error en la consulta al RUCT: {e}"
+
 
-            if progress_callback:
-                progress_callback(page_num, len(results))
+def _has_result_marker(page_text: str) -> bool:
+    """True for a results page (with rows or the 'no records' notice)."""
+    return (
+        "Ningún registro encontrado" in page_text
+        or "Ningun registro encontrado" in page_text
+        or "registros encontrados" in page_text
+    )
 
-        else:
+
+def _follow_pages(
+    session: requests.Session,
+    next_url: str | None,
+    page_num: int,
+    max_paginas: int,
+    results: list,
+    timeout: int = 30,
+    rate_limiter: RateLimiter | None = None,
+    progress_callback=None,
+    stats: dict | None = None,
+    cursor: SearchCursor | None = None,
+) -> str | None:
+    """
+    GET the "Siguiente" pages from next_url (page number page_num) up to page
+    max_paginas, appending their rows to results; the cursor is advanced past
+    every parsed page. Returns the page-limit warning when pages are left.
+    Request errors propagate (SearchSessionExpired for a page without results).
+    """
+    while next_url:
+        if page_num > max_paginas:
             # Page limit reached without exhausting all results
-            warning = (
+            if stats is not None:
+                stats["truncated"] = True
+            return (
                 f"Se alcanzó el límite de {max_paginas} páginas. "
                 "Puede haber más resultados — reduce los filtros o aumenta el límite."
             )
 
-    except requests.Timeout:
-        warning = (
-            "Tiempo de espera agotado. "
-            f"Se muestran los {len(results)} resultados obtenidos hasta ahora."
-        )
-    except requests.ConnectionError as e:
-        warning = f"Error de conexión con el RUCT: {e}"
-    except requests.HTTPError as e:
-        warning = f"El servidor del RUCT devolvió un error: {e}"
+        _pause(rate_limiter, 0.4)  # Be polite to the server
+
+        r = session.get(next_url, timeout=timeout)
+        r.raise_for_status()
+        soup = BeautifulSoup(r.text, "lxml")
+
+        rows = _parse_table(soup)
+        if not rows:
+            if not _has_result_marker(soup.get_text()):
+                raise SearchSessionExpired(f"Página {page_num} sin resultados")
+            if cursor is not None:
+                cursor.next_url = None
+            break
+
+        results.extend(rows)
+        next_url = _next_page_url(soup)
+        if stats is not None:
+            stats["pages"] = page_num
+        if cursor is not None:
+            cursor.advance(page_num, next_url, len(rows))
+
+        if progress_callback:
+            progress_callback(page_num, len(results))
+        page_num += 1
+    return None
+
+
+_JSESSIONID_RE = re.compile(r";jsessionid=[^?#]*", re.IGNORECASE)
+
+
+def _reopen_cursor(cursor: SearchCursor, timeout: int, rate_limiter: RateLimiter | None) -> None:
+    """
+    Re-establish a cursor's server-side search on a new session (new jsessionid):
+    open the form, post the same filters again and point next_url at that session.
+    """
+    session = SearchSession()
+    form_state = _form_state_for(session, timeout)
+    session.headers["Referer"] = FORM_URL
+    session.headers["Content-Type"] = "application/x-www-form-urlencoded"
+    _pause(rate_limiter, 0.3)
+    r = session.post(form_state["post_url"], data=_search_payload(form_state, cursor.params), timeout=timeout)
+    r.raise_for_status()
+    m = _JSESSIONID_RE.search(form_state["post_url"])
+    cursor.next_url = _JSESSIONID_RE.sub(m.group(0) if m else "", cursor.next_url or "") or None
+    cursor.session = session
+
+
+def resume_search(
+    cursor: SearchCursor,
+    max_paginas: int = 200,
+    timeout: int = 30,
+    progress_callback=None,
+    rate_limiter: RateLimiter | None = None,
+) -> tuple[pd.DataFrame, str | None]:
+    """
+    Continue a search_ruct run from its cursor with up to `max_paginas` more
+    pages, starting at the cursor's "Siguiente" URL. A missing or expired
+    session is re-established once (jsessionid renewed, filters re-posted).
+
+    Returns (DataFrame of the new rows only, warning_or_None), like search_ruct.
+    """
+    results: list = []
+    warning = None
+    if cursor.resumable:
+        last_page = cursor.page + max_paginas
+        for attempt in range(2):
+            try:
+                if cursor.session is None:
+                    _reopen_cursor(cursor, timeout, rate_limiter)
+                warning = _follow_pages(cursor.session, cursor.next_url, cursor.page + 1, last_page,
+                                        results, timeout, rate_limiter, progress_callback, cursor=cursor)
+                break
+            except SearchSessionExpired as e:
+                cursor.session = None
+                if attempt:
+                    warning = _request_warning(e, len(results))
+            except requests.RequestException as e:
+                warning = _request_warning(e, len(results))
+                break
+    df = pd.DataFrame(results) if results else pd.DataFrame(columns=RESULT_COLUMNS)
+    return df, warning
+
+
+# ─── Batch search ────────────────────────────────────────────────────────────
+
+class SessionPool:
+    """
+    Fixed-size pool of warm SearchSessions. A RUCT session holds server-side
+    paging state, so each session serves a single search at a time.
+    """
+
+    def __init__(self, size: int):
+        self._sessions: queue.Queue = queue.Queue()
+        for _ in range(max(1, size)):
+            self._sessions.put(SearchSession())
+
+    @contextmanager
+    def session(self):
+        s = self._sessions.get()
+        try:
+            yield s
+        finally:
+            self._sessions.put(s)
+
+    def close(self) -> None:
+        while not self._sessions.empty():
+            self._sessions.get_nowait().close()
+
+
+def _as_search_params(query, defaults: dict) -> dict:
+    """Normalize a batch query (plain text or a dict of search_ruct params)."""
+    params = dict(defaults)
+    if isinstance(query, dict):
+        params.update(query)
+    else:
+        params["descripcion"] = str(query)
+    return params
+
+
+def iter_search_ruct_many(
+    queries,
+    workers: int = 4,
+    rate: float = 2.5,
+    dedupe: bool = True,
+    rate_limiter: RateLimiter | None = None,
+    **filters,
+):
+    """
+    Run many RUCT searches concurrently and yield results as each one finishes.
+
+    queries   Iterable of degree names, or dicts of search_ruct keyword arguments
+    workers   Number of concurrent searches (each with its own warm session)
+    rate      Global request budget in requests per second, shared by all workers
+    dedupe    Drop rows whose `codigo` was already yielded by an earlier query
+    rate_limiter  Existing RateLimiter to share (overrides `rate`)
+    filters   Default search_ruct arguments applied to every query (tipo, estado…)
+
+    Yields (query, DataFrame_of_new_rows, warning_or_None) in completion order.
+    """
+    queries = list(queries)
+    limiter = rate_limiter or RateLimiter(rate)
+    pool = SessionPool(min(workers, len(queries)) or 1)
+    seen: set = set()
+
+    def _run(params):
+        with pool.session() as s:
+            return search_ruct(**params, session=s, rate_limiter=limiter)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+            futures = {
+                ex.submit(_run, _as_search_params(q, filters)): q for q in queries
+            }
+            for fut in as_completed(futures):
+                q = futures[fut]
+                try:
+                    df, warn = fut.result()
+                except Exception as e:  # never let one query abort the batch
+                    df, warn = pd.DataFrame(columns=RESULT_COLUMNS), str(e)
+                if dedupe and not df.empty:
+                    df = df[~df["codigo"].isin(seen)].drop_duplicates("codigo")
+                    seen.update(df["codigo"])
+                yield q, df, warn
+    finally:
+        pool.close()
+
+
+def search_ruct_many(
+    queries,
+    workers: int = 4,
+    rate: float = 2.5,
+    dedupe: bool = True,
+    output=None,
+    fmt: str = "csv",
+    progress_callback=None,
+    **filters,
+) -> tuple[pd.DataFrame | int, dict]:
+    """
+    Search the RUCT for several degree names at once.
+
+    Queries run concurrently on a pool of warm sessions under one global rate
+    limit, and rows are deduplicated by `codigo`. When `output` (a path or a
+    binary file object) is given, merged rows are streamed to it in `fmt`
+    ('csv', 'jsonl', 'xlsx' or 'parquet') as each query completes, and are
+    not kept in memory.
+
+    progress_callback  Optional callable(done: int, total: int, query)
+
+    Returns (merged DataFrame, or the number of rows written when `output` is
+    given; {query: warning} for queries that had warnings).
+    """
+    queries = list(queries)
+    warnings = {}
+
+    def _frames():
+        for i, (q, df, warn) in enumerate(
+            iter_search_ruct_many(queries, workers, rate, dedupe, **filters), start=1
+        ):
+            if warn:
+                warnings[str(q)] = warn
+            if progress_callback:
+                progress_callback(i, len(queries), q)
+            if not df.empty:
+                yield df
+
+    if output is None:
+        frames = list(_frames())
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=RESULT_COLUMNS)
+        return df, warnings
+
+    writer = {
+        "csv": write_csv,
+        "jsonl": write_jsonl,
+        "xlsx": write_excel,
+        "parquet": write_parquet,
+    }[fmt]
+    if isinstance(output, (str, bytes)) or hasattr(output, "__fspath__"):
+        if fmt == "parquet":
+            n_rows = writer(_frames(), output)
+        else:
+            with open(output, "wb") as fh:
+                n_rows = writer(_frames(), fh)
+    else:
+        n_rows = writer(_frames(), output)
+    return n_rows, warnings
+
+
+# ─── Query sharding planner ──────────────────────────────────────────────────
+
+# Form fields a broad query can be split on: (search_ruct parameter, load_form_options key)
+_SHARD_DIMENSIONS = [
+    ("universidad", "universidades"),
+    ("rama", "ramas"),
+    ("tipo", "tipos"),
+]
+
+
+def plan_shards(
+    params: dict,
+    total: int,
+    page_size: int,
+    max_paginas: int,
+    options: dict,
+    workers: int = 4,
+) -> list[dict]:
+    """
+    Split an oversized query into disjoint shard queries along one form field
+    that the query leaves open (university, branch or degree type).
+
+    Picks the coarsest dimension that still gives enough shards to stay under
+    `max_paginas` each and to keep `workers` busy; falls back to the finest one.
+    Returns [] when no open dimension is available.
+    """
+    pages_needed = -(-total // max(page_size, 1))
+    min_shards = max(2 * -(-pages_needed // max_paginas), 2 * workers)
+    candidates = []
+    for param, opt_key in _SHARD_DIMENSIONS:
+        if params.get(param):
+            continue
+        values = [v for _, v in options.get(opt_key, []) if v]
+        if len(values) >= 2:
+            candidates.append((param, values))
+    if not candidates:
+        return []
+    fitting = [c for c in candidates if len(c[1]) >= min_shards]
+    param, values = (
+        min(fitting, key=lambda c: len(c[1])) if fitting
+        else max(candidates, key=lambda c: len(c[1]))
+    )
+    return [{**params, param: v} for v in values]
+
+
+@coalesce("search_sharded", _search_flight_key)
+def search_ruct_sharded(
+    descripcion: str = "",
+    codigo: str = "",
+    universidad: str = "",
+    tipo: str = "G",
+    rama: str = "",
+    ambito: str = "",
+    estado: str = "P",
+    situacion: str = "A",
+    historico: str = "N",
+    timeout: int = 30,
+    max_paginas: int = 200,
+    workers: int = 4,
+    rate: float = 2.5,
+    options: dict | None = None,
+    progress_callback=None,
+    cursor: SearchCursor | None = None,
+) -> tuple[pd.DataFrame, str | None]:
+    """
+    search_ruct with a query planner for broad searches.
+
+    Page 1 is fetched first to read the total record count. Queries that fit
+    in `max_paginas` go on from that probe page (resume_search, so page 1 is
+    not fetched twice) and leave `cursor` resumable; larger ones are split into shards
+    by university, branch or type (see plan_shards) which run in parallel on
+    warm sessions under a shared rate limit. Shards that still hit the page cap
+    are split again on another field. Rows are merged and deduplicated by codigo.
+
+    progress_callback  Optional callable(step: int, total_rows: int)
+
+    Returns (DataFrame, warning_or_None), like search_ruct.
+    """
+    params = dict(
+        descripcion=descripcion, codigo=codigo, universidad=universidad,
+        tipo=tipo, rama=rama, ambito=ambito, estado=estado,
+        situacion=situacion, historico=historico, timeout=timeout,
+        max_paginas=max_paginas,
+    )
+    limiter = RateLimiter(rate)
+    cursor = cursor if cursor is not None else SearchCursor()
+
+    probe_stats: dict = {}
+    probe_df, probe_warn = search_ruct(
+        **{**params, "max_paginas": 1}, rate_limiter=limiter, stats=probe_stats, cursor=cursor,
+    )
+    if "total" not in probe_stats:
+        return probe_df, probe_warn  # connection / validation error
+    total = probe_stats["total"]
+    page_size = probe_stats["page_size"]
+    if page_size and total is not None and total <= page_size:
+        if progress_callback:
+            progress_callback(1, len(probe_df))
+        return probe_df, None
+    if not page_size or total is None or -(-total // page_size) <= max_paginas:
+        if progress_callback:
+            progress_callback(1, len(probe_df))
+        rest, warn = resume_search(cursor, max_paginas - 1, timeout, progress_callback, limiter)
+        return pd.concat([probe_df, rest], ignore_index=True) if len(rest) else probe_df, warn
+
+    if options is None:
+        options = load_form_options(timeout=timeout)
+
+    frames = []
+    warnings = []
+    step = 0
+
+    def _run(shards: list[dict]):
+        nonlocal step
+        retry = []
+        for shard, df, warn in iter_search_ruct_many(
+            shards, workers=workers, rate_limiter=limiter, dedupe=False,
+        ):
+            step += 1
+            if not df.empty:
+                frames.append(df)
+            shard_stats = shard["stats"]
+            if shard_stats.get("truncated"):
+                retry.append(shard)
+            elif warn:
+                warnings.append(warn)
+            if progress_callback:
+                progress_callback(step, sum(len(f) for f in frames))
+        for shard in retry:
+            # Fields already fixed by the shard are never chosen again
+            sub = plan_shards(
+                {k: v for k, v in shard.items() if k != "stats"},
+                shard["stats"].get("total") or 0, shard["stats"].get("page_size") or 1,
+                max_paginas, options, workers,
+            )
+            if sub:
+                _run([{**q, "stats": {}} for q in sub])
+            else:
+                warnings.append(
+                    f"Se alcanzó el límite de {max_paginas} páginas en una sub-consulta. "
+                    "Puede haber más resultados — reduce los filtros o aumenta el límite."
+                )
+
+    shards = plan_shards(params, total, page_size, max_paginas, options, workers)
+    if not shards:
+        return search_ruct(**params, rate_limiter=limiter, progress_callback=progress_callback,
+                           cursor=cursor)
+    cursor.session, cursor.next_url = None, None   # shard results cannot be resumed
+    _run([{**q, "stats": {}} for q in shards])
 
     df = (
-        pd.DataFrame(results)
-        if results
+        pd.concat(frames, ignore_index=True).drop_duplicates("codigo", ignore_index=True)
+        if frames
         else pd.DataFrame(columns=RESULT_COLUMNS)
     )
-    return df, warning
+    return df, (warnings[0] if warnings else None)
+
+
+SEARCH_CACHE_TTL = 3600  # seconds before a cached search is refreshed in the background
+
+
+def _search_cache_key(params: dict) -> str:
+    bound = inspect.signature(search_ruct_sharded).bind(**params)
+    bound.apply_defaults()
+    return json.dumps(
+        _search_flight_key({**bound.arguments, "progress_callback": None, "cursor": None}),
+        ensure_ascii=False,
+    )
+
+
+def search_ruct_cached(cursor: SearchCursor | None = None, **params) -> tuple[pd.DataFrame, str | None, bool]:
+    """
+    search_ruct_sharded behind the shared cache, stale-while-revalidate.
+
+    Concurrent identical calls share one upstream search. A cached result
+    for the same normalized filters is returned at once; past
+    SEARCH_CACHE_TTL it is flagged stale and refreshed in the background, so a
+    RUCT outage still serves the last good result. Failed searches are never
+    cached. A result cut short keeps its resume point in the cache: `cursor`
+    is set to it (without a session, re-established by resume_search).
+
+    Returns (DataFrame, warning_or_None, stale).
+    """
+    key = _search_cache_key(params)
+    runs = []     # (value, cursor) of loads run by this call or its background refresh
+
+    def run():
+        run_cursor = SearchCursor()
+        df, warn = search_ruct_sharded(**params, cursor=run_cursor)
+        value = {"rows": df.to_dict("records"), "warning": warn,
+                 "page": run_cursor.page, "next_url": run_cursor.next_url, "params": run_cursor.params}
+        runs.append((value, run_cursor))
+        return value
+
+    def load():
+        # The cursor makes search_ruct_sharded skip its own coalescing: coalesce here,
+        # on the normalized key (callers that waited resume from the cached cursor)
+        return flights.do(("search", key), run)
+
+    cached = resilience.swr_get(
+        "search", key, load, SEARCH_CACHE_TTL,
+        valid=lambda v: bool(v["rows"]) or v["warning"] is None,
+    )
+    value = cached.value
+    if cursor is not None:
+        live = next((c for v, c in runs if v is value), None)
+        if live is not None:        # searched just now: keep the warm session
+            cursor.params, cursor.session = live.params, live.session
+            cursor.page, cursor.next_url, cursor.rows = live.page, live.next_url, live.rows
+        else:
+            cursor.params, cursor.session = value.get("params") or {}, None
+            cursor.page, cursor.next_url = value.get("page", 0), value.get("next_url")
+            cursor.rows = len(value["rows"])
+    df = pd.DataFrame(value["rows"], columns=RESULT_COLUMNS)
+    return df, value["warning"], cached.stale
+
+
+def resume_search_cached(cursor: SearchCursor, df: pd.DataFrame, **params) -> tuple[pd.DataFrame, str | None]:
+    """
+    resume_search for a result df of search_ruct_cached(cursor, **params), with
+    up to its max_paginas more pages: returns the merged rows (deduplicated by
+    codigo) and updates the cached entry, so the same search later starts from
+    everything loaded so far.
+    """
+    new, warn = resume_search(cursor, params.get("max_paginas", 200), params.get("timeout", 30))
+    if new.empty:
+        return df, warn
+    merged = pd.concat([df, new], ignore_index=True).drop_duplicates("codigo", ignore_index=True)
+    get_store().put("search", _search_cache_key(params), {
+        "rows": merged.to_dict("records"), "warning": warn,
+        "page": cursor.page, "next_url": cursor.next_url, "params": cursor.params,
+    })
+    return merged, warn
 
 
 # ─── Internal helpers ────────────────────────────────────────────────────────
@@ -398,14 +1033,229 @@ def _next_page_url(soup: BeautifulSoup) -> str | None:
     return None
 
 
+_RECORD_COUNT_RE = re.compile(r"([\d.]+)\s+registros\s+encontrados", re.IGNORECASE)
+
+
+def _parse_record_count(soup: BeautifulSoup) -> int | None:
+    """
+    Return the total number of matches announced above the results table
+    ('1.234 registros encontrados, mostrando del 1 al 20'), or None if absent.
+    """
+    text = soup.get_text(" ")
+    m = _RECORD_COUNT_RE.search(text)
+    if m:
+        return int(m.group(1).replace(".", ""))
+    if re.search(r"\bun\s+registro\s+encontrado", text, re.IGNORECASE):
+        return 1
+    return None
+
+
 # ─── Export ──────────────────────────────────────────────────────────────────
 
+EXPORT_CHUNK_ROWS = 5000  # rows serialized per chunk by the streaming writers
+
+
+def _iter_frames(data, chunksize: int = EXPORT_CHUNK_ROWS):
+    """
+    Yield DataFrame chunks of at most `chunksize` rows from `data`.
+
+    `data` may be a DataFrame (sliced without copying the whole frame),
+    an iterable of DataFrames (passed through) or an iterable of row dicts
+    (batched), so results can be exported while they are still being scraped.
+    """
+    if isinstance(data, pd.DataFrame):
+        for start in range(0, len(data), chunksize):
+            yield data.iloc[start:start + chunksize]
+        return
+    batch = []
+    for item in data:
+        if isinstance(item, pd.DataFrame):
+            if batch:
+                yield pd.DataFrame(batch)
+                batch = []
+            if not item.empty:
+                yield item
+            continue
+        batch.append(item)
+        if len(batch) >= chunksize:
+            yield pd.DataFrame(batch)
+            batch = []
+    if batch:
+        yield pd.DataFrame(batch)
+
+
+def _cell_value(value):
+    """Convert a DataFrame value into something openpyxl can write."""
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple, dict, set)):
+        return str(value)
+    if isinstance(value, float) and value != value:  # NaN
+        return None
+    return value
+
+
+def _estimate_widths(df: pd.DataFrame, max_width: int = 60) -> list[int]:
+    """
+    Estimate Excel column widths from column statistics instead of visiting
+    every cell: the 95th percentile of the string length, at least the header.
+    """
+    widths = []
+    for col in df.columns:
+        lengths = df[col].astype(str).str.len()
+        p95 = int(lengths.quantile(0.95)) if len(lengths) else 0
+        widths.append(min(max(p95, len(str(col))) + 2, max_width))
+    return widths
+
+
+def write_csv(data, fileobj, chunksize: int = EXPORT_CHUNK_ROWS) -> int:
+    """
+    Stream `data` as UTF-8 BOM CSV into a binary file-like object, one chunk
+    at a time. Returns the number of data rows written.
+    """
+    n_rows = 0
+    columns = None
+    fileobj.write(b"\xef\xbb\xbf")
+    for chunk in _iter_frames(data, chunksize):
+        header = columns is None
+        if header:
+            columns = list(chunk.columns)
+        # Later chunks may come with their columns in another order
+        fileobj.write(chunk.reindex(columns=columns).to_csv(index=False, header=header).encode("utf-8"))
+        n_rows += len(chunk)
+    if columns is None:
+        # Nothing written: still emit the header so the file opens cleanly
+        cols = data.columns if isinstance(data, pd.DataFrame) else RESULT_COLUMNS
+        fileobj.write(pd.DataFrame(columns=cols).to_csv(index=False).encode("utf-8"))
+    return n_rows
+
+
+def write_jsonl(data, fileobj, chunksize: int = EXPORT_CHUNK_ROWS) -> int:
+    """
+    Stream `data` as JSON Lines (one UTF-8 object per row) into a binary
+    file-like object. Returns the number of rows written.
+    """
+    n_rows = 0
+    for chunk in _iter_frames(data, chunksize):
+        if chunk.empty:
+            continue
+        text = chunk.to_json(orient="records", lines=True, force_ascii=False)
+        fileobj.write(text.encode("utf-8"))
+        if not text.endswith("\n"):
+            fileobj.write(b"\n")
+        n_rows += len(chunk)
+    return n_rows
+
+
+def write_excel(
+    data,
+    fileobj,
+    sheet_name: str = "Resultados RUCT",
+    chunksize: int = EXPORT_CHUNK_ROWS,
+) -> int:
+    """
+    Stream `data` into an .xlsx file using openpyxl's write-only mode, which
+    keeps memory constant regardless of the number of rows.
+
+    Column widths are estimated from the first chunk, because write-only
+    sheets require them before the first row is appended.
+    Returns the number of data rows written.
+    """
+    from openpyxl import Workbook
+    from openpyxl.utils import get_column_letter
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=sheet_name)
+    n_rows = 0
+    columns = None
+    for chunk in _iter_frames(data, chunksize):
+        if columns is None:
+            columns = list(chunk.columns)
+            for idx, width in enumerate(_estimate_widths(chunk), start=1):
+                ws.column_dimensions[get_column_letter(idx)].width = width
+            ws.append(columns)
+        for row in chunk.reindex(columns=columns).itertuples(index=False, name=None):
+            ws.append([_cell_value(v) for v in row])
+        n_rows += len(chunk)
+    if columns is None:
+        ws.append(list(data.columns) if isinstance(data, pd.DataFrame) else RESULT_COLUMNS)
+    wb.save(fileobj)
+    return n_rows
+
+
+def _parquet_schema(chunk: pd.DataFrame, pa):
+    """
+    Schema for a streamed Parquet file, fixed from the first chunk but wide
+    enough for the later ones: RESULT_COLUMNS and text or all-null columns are
+    strings, integers widen to float64 (a later chunk may bring NaN or decimals).
+    """
+    fields = []
+    for name, inferred in zip(chunk.columns, pa.Table.from_pandas(chunk, preserve_index=False).schema):
+        if name in RESULT_COLUMNS or pa.types.is_null(inferred.type) or pa.types.is_string(inferred.type) \
+                or pa.types.is_large_string(inferred.type):
+            fields.append(pa.field(str(name), pa.string()))
+        elif pa.types.is_integer(inferred.type):
+            fields.append(pa.field(str(name), pa.float64()))
+        else:
+            fields.append(inferred)
+    return pa.schema(fields)
+
+
+def _conform_chunk(chunk: pd.DataFrame, schema) -> pd.DataFrame:
+    """Reorder a chunk to `schema` and turn the values of its string columns into text."""
+    import pyarrow as pa
+
+    chunk = chunk.reindex(columns=schema.names)
+    for name, kind in zip(schema.names, schema.types):
+        if pa.types.is_string(kind):
+            col = chunk[name]
+            chunk[name] = col.astype(object).where(col.isna(), col.astype(str))
+    return chunk
+
+
+def write_parquet(data, path_or_buf, chunksize: int = EXPORT_CHUNK_ROWS) -> int:
+    """
+    Stream `data` into a Parquet file, one row group per chunk.
+    Requires pyarrow; the schema is fixed from the first chunk (_parquet_schema)
+    and every chunk is converted to it. Returns the number of rows written.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("La exportación a Parquet requiere pyarrow (pip install pyarrow)") from e
+
+    writer = None
+    schema = None
+    n_rows = 0
+    try:
+        for chunk in _iter_frames(data, chunksize):
+            if chunk.empty:
+                continue
+            if writer is None:
+                schema = _parquet_schema(chunk, pa)
+                writer = pq.ParquetWriter(path_or_buf, schema)
+            table = pa.Table.from_pandas(_conform_chunk(chunk, schema), schema=schema, preserve_index=False)
+            writer.write_table(table)
+            n_rows += len(chunk)
+        if writer is None:
+            cols = data.columns if isinstance(data, pd.DataFrame) else RESULT_COLUMNS
+            empty = pa.Table.from_pandas(pd.DataFrame(columns=cols), preserve_index=False)
+            pq.write_table(empty, path_or_buf)
+    finally:
+        if writer is not None:
+            writer.close()
+    return n_rows
+
+
 def export_csv(df: pd.DataFrame) -> bytes:
     """
     Return the DataFrame as UTF-8 BOM CSV bytes.
     The BOM ensures Excel on Windows opens the file without encoding issues.
     """
-    return df.to_csv(index=False).encode("utf-8-sig")
+    buf = io.BytesIO()
+    write_csv(df, buf)
+    return buf.getvalue()
 
 
 def export_excel(df: pd.DataFrame) -> bytes:
@@ -414,16 +1264,7 @@ def export_excel(df: pd.DataFrame) -> bytes:
     Requires openpyxl to be installed.
     """
     buf = io.BytesIO()
-    with pd.ExcelWriter(buf, engine="openpyxl") as writer:
-        df.to_excel(writer, index=False, sheet_name="Resultados RUCT")
-        # Auto-adjust column widths
-        ws = writer.sheets["Resultados RUCT"]
-        for col_cells in ws.columns:
-            max_len = max(
-                (len(str(cell.value)) if cell.value else 0 for cell in col_cells),
-                default=10,
-            )
-            ws.column_dimensions[col_cells[0].column_letter].width = min(max_len + 2, 60)
+    write_excel(df, buf)
     return buf.getvalue()
 
 
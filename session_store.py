@@ -0,0 +1,212 @@
+"""
+session_store.py
+Bounded in-memory state for the Streamlit workers.
+
+Plans and fichas are decoded once per process into a shared, byte-budgeted
+LRU; each session keeps only small references to them (plus anything that
+could not be shared) in its own LRU with an item cap and a byte budget.
+Evicted shared objects are reloaded from the SQLite cache on the next access.
+memory_report() summarizes what a worker holds, to size containers.
+"""
+
+import os
+import sys
+import time
+import weakref
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping, MutableMapping
+from typing import NamedTuple
+
+from cache_store import get_store
+
+SHARED_BUDGET = int(float(os.environ.get("ECU_SHARED_CACHE_MB", "256")) * 1024 * 1024)
+SESSION_MAX_ITEMS = int(os.environ.get("ECU_SESSION_PLANS", "12"))
+SESSION_BUDGET = int(float(os.environ.get("ECU_SESSION_MB", "8")) * 1024 * 1024)
+
+
+def estimate_size(obj, _seen: set | None = None) -> int:
+    """Approximate deep size in bytes of JSON-like data and records (dicts, lists, strings, numbers)."""
+    seen = _seen if _seen is not None else set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(estimate_size(k, seen) + estimate_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, Mapping):      # slotted records: field names are shared class data
+        size += sum(estimate_size(v, seen) for v in obj.values())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(v, seen) for v in obj)
+    return size
+
+
+class LRUStore(MutableMapping):
+    """
+    Thread-safe mapping bounded by item count and total estimated bytes; the
+    least recently used entries are evicted first. The most recent entry is
+    always kept, even if it alone exceeds the byte budget.
+    """
+
+    def __init__(self, max_items: int | None = None, max_bytes: int | None = None, name: str = ""):
+        self.name = name
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.evictions = 0
+        self._data: OrderedDict = OrderedDict()   # key -> (value, size)
+        self._lock = threading.RLock()
+
+    def __getitem__(self, key):
+        with self._lock:
+            value, _ = self._data[key]
+            self._data.move_to_end(key)
+            return value
+
+    def __setitem__(self, key, value):
+        self.put(key, value)
+
+    def put(self, key, value, size: int | None = None) -> None:
+        """Insert with an explicit size (defaults to estimate_size(value))."""
+        size = estimate_size(value) if size is None else size
+        with self._lock:
+            if key in self._data:
+                self.nbytes -= self._data.pop(key)[1]
+            self._data[key] = (value, size)
+            self.nbytes += size
+            self._evict()
+
+    def _evict(self) -> None:
+        while len(self._data) > 1 and (
+            (self.max_items is not None and len(self._data) > self.max_items)
+            or (self.max_bytes is not None and self.nbytes > self.max_bytes)
+        ):
+            _, (_, size) = self._data.popitem(last=False)
+            self.nbytes -= size
+            self.evictions += 1
+
+    def __delitem__(self, key):
+        with self._lock:
+            self.nbytes -= self._data.pop(key)[1]
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._data))
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+
+    def stats(self) -> dict:
+        return {"items": len(self._data), "bytes": self.nbytes, "evictions": self.evictions,
+                "max_items": self.max_items, "max_bytes": self.max_bytes}
+
+
+# ─── Shared objects ───────────────────────────────────────────────────────────
+
+shared = LRUStore(max_bytes=SHARED_BUDGET, name="shared")
+
+
+class SharedRef(NamedTuple):
+    """Per-session pointer to an object in `shared` (reloadable from the SQLite cache)."""
+    kind: str
+    key: str
+    meta: dict      # small per-session extras merged on deref (e.g. the stale flag)
+
+
+_REF_SIZE = 256     # rough bytes of a SharedRef with its meta dict
+
+
+def share(kind: str, key: str, value, meta: dict | None = None) -> SharedRef:
+    """Place value in the shared LRU (replacing an older copy) and return a reference to it."""
+    shared.put((kind, key), value)
+    return SharedRef(kind, key, meta or {})
+
+
+def deref(entry):
+    """
+    Resolve a session entry: SharedRef -> shared object (with its meta merged in,
+    reloaded from the SQLite cache if it was evicted); anything else as is.
+    Returns None when the object is gone from both.
+    """
+    if not isinstance(entry, SharedRef):
+        return entry
+    value = shared.get((entry.kind, entry.key))
+    if value is None:
+        value = get_store().get(entry.kind, entry.key)
+        if value is None:
+            return None
+        shared.put((entry.kind, entry.key), value)
+    return {**value, **entry.meta} if entry.meta else value
+
+
+# ─── Per-session stores ───────────────────────────────────────────────────────
+
+_session_stores: "weakref.WeakSet[SessionLRU]" = weakref.WeakSet()
+
+
+class SessionLRU(LRUStore):
+    """LRUStore for one session; SharedRef entries are charged at their reference size."""
+
+    __eq__ = object.__eq__      # identity semantics, so live stores can sit in a WeakSet
+    __hash__ = object.__hash__
+
+    def __init__(self, name: str, max_items: int = SESSION_MAX_ITEMS, max_bytes: int = SESSION_BUDGET):
+        super().__init__(max_items, max_bytes, name)
+        _session_stores.add(self)
+
+    def put(self, key, value, size: int | None = None) -> None:
+        if size is None and isinstance(value, SharedRef):
+            size = _REF_SIZE
+        super().put(key, value, size)
+
+
+def session_lru(state, name: str, max_items: int = SESSION_MAX_ITEMS,
+                max_bytes: int = SESSION_BUDGET) -> SessionLRU:
+    """Get (or create) the bounded store `name` in a session-state mapping."""
+    store = state.get(name)
+    if not isinstance(store, SessionLRU):
+        store = SessionLRU(name, max_items, max_bytes)
+        if isinstance(state.get(name), dict):
+            for k, v in state[name].items():  # carry over a plain dict from older code
+                store[k] = v
+        state[name] = store
+    return store
+
+
+# ─── Memory report ────────────────────────────────────────────────────────────
+
+def _rss_bytes() -> int | None:
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        try:
+            import resource
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return peak if sys.platform == "darwin" else peak * 1024
+        except Exception:
+            return None
+
+
+def memory_report() -> dict:
+    """Per-process memory summary: RSS, shared-object LRU and every live session store."""
+    sessions: dict[str, dict] = {}
+    for store in list(_session_stores):
+        agg = sessions.setdefault(store.name, {"stores": 0, "items": 0, "bytes": 0, "evictions": 0})
+        agg["stores"] += 1
+        agg["items"] += len(store)
+        agg["bytes"] += store.nbytes
+        agg["evictions"] += store.evictions
+    return {
+        "pid": os.getpid(),
+        "time": time.time(),
+        "rss_bytes": _rss_bytes(),
+        "shared": shared.stats(),
+        "sessions": sessions,
+        "session_budget": {"max_items": SESSION_MAX_ITEMS, "max_bytes": SESSION_BUDGET},
+    }
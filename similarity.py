@@ -0,0 +1,233 @@
+"""
+similarity.py
+"Similar degrees" engine: curriculum similarity between study plans.
+
+Each plan is reduced to the set of its normalized subject names and summarized
+by a MinHash signature (NumPy). Locality-sensitive hashing over signature bands
+proposes candidate pairs, which are scored in batches by signature agreement
+(an estimate of the Jaccard similarity). The top-k neighbours of every codigo
+are precomputed, so lookups at render time are a dict access.
+
+    python similarity.py build --k 10
+    python similarity.py similar 2502090
+"""
+
+import os
+import gzip
+import json
+import hashlib
+import threading
+
+import numpy as np
+
+from cache_store import DATA_DIR, get_store
+from subject_index import plan_subjects, tokenize
+
+SIMILARITY_PATH = os.path.join(DATA_DIR, "similar_degrees.npz")
+
+NUM_PERM = 128          # MinHash permutations (signature length)
+LSH_BANDS = 32          # bands × rows = NUM_PERM; threshold ≈ (1/bands)^(1/rows) ≈ 0.42
+LSH_ROWS = NUM_PERM // LSH_BANDS
+MAX_BUCKET = 500        # larger buckets are near-duplicates; cap the pairs they add
+_PRIME = np.uint64(4294967291)  # largest 32-bit prime
+
+_rng = np.random.default_rng(20240521)  # fixed seed: signatures must be reproducible
+_PERM_A = _rng.integers(1, 2**32 - 1, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.integers(0, 2**31 - 1, size=NUM_PERM, dtype=np.uint64)
+
+
+def normalize_subject(nombre: str) -> str:
+    """Comparable form of a subject name: folded tokens without stopwords or numbering."""
+    return " ".join(t for t in tokenize(nombre) if not t.isdigit())
+
+
+def _feature_hashes(subjects) -> np.ndarray:
+    """Stable 32-bit hashes of the distinct normalized subject names of a plan."""
+    names = {normalize_subject(s.get("nombre", "")) for s in subjects}
+    names.discard("")
+    return np.array(
+        sorted(int.from_bytes(hashlib.blake2b(n.encode(), digest_size=4).digest(), "little")
+               for n in names),
+        dtype=np.uint64,
+    )
+
+
+def minhash(subjects) -> np.ndarray | None:
+    """MinHash signature (NUM_PERM uint32 values) of a subject list, or None if empty."""
+    h = _feature_hashes(subjects)
+    if h.size == 0:
+        return None
+    # (a·x + b) mod p for every permutation × feature, then the minimum per permutation
+    vals = (_PERM_A[:, None] * h[None, :] + _PERM_B[:, None]) % _PRIME
+    return vals.min(axis=1).astype(np.uint32)
+
+
+class SimilarityIndex:
+    """Precomputed top-k neighbours per codigo, plus the signatures for live queries."""
+
+    def __init__(self, codigos: list[str], signatures: np.ndarray, degrees: dict,
+                 topk: dict | None = None):
+        self.codigos = list(codigos)
+        self.signatures = signatures
+        self.degrees = degrees
+        self.topk: dict[str, list[tuple[str, float]]] = topk or {}
+        self._pos = {c: i for i, c in enumerate(self.codigos)}
+        self._buckets: list[dict] | None = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.codigos)
+
+    # ── Build ────────────────────────────────────────────────────────────────
+
+    @classmethod
+    def build(cls, plans, k: int = 10) -> "SimilarityIndex":
+        """Build from an iterable of (codigo, plan_dict) pairs and precompute top-k."""
+        codigos, sigs, degrees = [], [], {}
+        for codigo, plan in plans:
+            sig = minhash(plan_subjects(plan))
+            if sig is None:
+                continue
+            ficha = plan.get("ficha", {})
+            codigos.append(codigo)
+            sigs.append(sig)
+            degrees[codigo] = {
+                "titulo": plan.get("titulo") or ficha.get("denominacion", ""),
+                "universidad": plan.get("universidad") or ficha.get("universidad", ""),
+                "url_ruct": plan.get("url_ruct", ""),
+                "url_plan": plan.get("url_plan", ""),
+            }
+        signatures = (np.vstack(sigs) if sigs
+                      else np.zeros((0, NUM_PERM), dtype=np.uint32))
+        idx = cls(codigos, signatures, degrees)
+        idx.topk = idx._all_topk(k)
+        return idx
+
+    def _band_buckets(self) -> list[dict]:
+        """One dict per band: band bytes -> array of row positions sharing them."""
+        if self._buckets is None:
+            n = len(self.codigos)
+            bands = self.signatures.reshape(n, LSH_BANDS, LSH_ROWS)
+            buckets = []
+            for b in range(LSH_BANDS):
+                keys = np.ascontiguousarray(bands[:, b, :]).view(
+                    np.dtype((np.void, LSH_ROWS * 4))
+                ).ravel()
+                _, inverse = np.unique(keys, return_inverse=True)
+                order = np.argsort(inverse, kind="stable")
+                splits = np.flatnonzero(np.diff(inverse[order])) + 1
+                table = {}
+                for group in np.split(order, splits):
+                    if len(group) > 1:
+                        table[keys[group[0]].tobytes()] = group[:MAX_BUCKET]
+                buckets.append(table)
+            self._buckets = buckets
+        return self._buckets
+
+    def _candidates(self, sig: np.ndarray) -> np.ndarray:
+        bands = sig.reshape(LSH_BANDS, LSH_ROWS)
+        found = [
+            table[bands[b].tobytes()]
+            for b, table in enumerate(self._band_buckets())
+            if bands[b].tobytes() in table
+        ]
+        return np.unique(np.concatenate(found)) if found else np.array([], dtype=np.int64)
+
+    def _score(self, sig: np.ndarray, cands: np.ndarray, k: int, exclude: int = -1):
+        """Batched estimate of Jaccard similarity against candidate rows; top-k pairs."""
+        cands = cands[cands != exclude]
+        if cands.size == 0:
+            return []
+        scores = (self.signatures[cands] == sig[None, :]).mean(axis=1)
+        top = np.argsort(-scores, kind="stable")[:k]
+        return [(self.codigos[cands[i]], round(float(scores[i]), 3)) for i in top]
+
+    def _all_topk(self, k: int) -> dict:
+        with self._lock:
+            return {
+                codigo: self._score(self.signatures[i], self._candidates(self.signatures[i]), k, i)
+                for i, codigo in enumerate(self.codigos)
+            }
+
+    # ── Query ────────────────────────────────────────────────────────────────
+
+    def similar(self, codigo: str, k: int = 10) -> list[dict]:
+        """Precomputed most similar degrees to a codigo: [{codigo, score, titulo, …}]."""
+        return [
+            {"codigo": c, "score": score, **self.degrees.get(c, {})}
+            for c, score in self.topk.get(codigo, [])[:k]
+        ]
+
+    def similar_to_plan(self, plan: dict, k: int = 10, codigo: str = "") -> list[dict]:
+        """Live LSH query for a plan that was not part of the last build."""
+        if codigo in self.topk:
+            return self.similar(codigo, k)
+        sig = minhash(plan_subjects(plan))
+        if sig is None or not len(self.codigos):
+            return []
+        with self._lock:
+            pairs = self._score(sig, self._candidates(sig), k, self._pos.get(codigo, -1))
+        return [{"codigo": c, "score": s, **self.degrees.get(c, {})} for c, s in pairs]
+
+    # ── Persistence ──────────────────────────────────────────────────────────
+
+    def save(self, path: str = SIMILARITY_PATH) -> None:
+        """Write signatures (npz) and metadata/top-k atomically."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        meta = json.dumps({"codigos": self.codigos, "degrees": self.degrees, "topk": self.topk},
+                          ensure_ascii=False, separators=(",", ":"))
+        tmp = f"{path}.tmp.npz"
+        np.savez_compressed(
+            tmp, signatures=self.signatures,
+            meta=np.frombuffer(gzip.compress(meta.encode("utf-8")), dtype=np.uint8),
+        )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str = SIMILARITY_PATH) -> "SimilarityIndex":
+        """Load a saved index; an empty one if the file does not exist."""
+        if not os.path.exists(path):
+            return cls([], np.zeros((0, NUM_PERM), dtype=np.uint32), {})
+        with np.load(path) as data:
+            signatures = data["signatures"]
+            meta = json.loads(gzip.decompress(data["meta"].tobytes()).decode("utf-8"))
+        topk = {c: [tuple(p) for p in pairs] for c, pairs in meta["topk"].items()}
+        return cls(meta["codigos"], signatures, meta["degrees"], topk)
+
+
+def index_version(path: str = SIMILARITY_PATH) -> str:
+    """Change marker of the saved index: a rebuild changes it ('' when there is none)."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return ""
+    return f"{st.st_mtime_ns}-{st.st_size}"
+
+
+def build_from_cache(k: int = 10, path: str = SIMILARITY_PATH) -> SimilarityIndex:
+    """Rebuild the similarity index from every plan in the shared cache and save it."""
+    idx = SimilarityIndex.build(get_store().iter("plan"), k=k)
+    idx.save(path)
+    return idx
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Titulaciones similares por plan de estudios.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_build = sub.add_parser("build", help="Reconstruir el índice desde la caché de planes")
+    p_build.add_argument("--k", type=int, default=10, help="Vecinos precalculados por título")
+    p_sim = sub.add_parser("similar", help="Mostrar las titulaciones más parecidas a un código")
+    p_sim.add_argument("codigo")
+    p_sim.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.cmd == "build":
+        index = build_from_cache(k=args.k)
+        print(f"{len(index)} planes con asignaturas indexados")
+    else:
+        index = SimilarityIndex.load()
+        for hit in index.similar(args.codigo, k=args.k):
+            print(f"{hit['score']:.2f}  {hit['codigo']}  {hit.get('titulo', '')} "
+                  f"({hit.get('universidad', '')})")
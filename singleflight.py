@@ -0,0 +1,93 @@
+"""
+singleflight.py
+Process-wide request coalescing: while a fetch for a key is in flight, identical
+calls from other threads (Streamlit sessions, API requests) wait for it and get
+the same result, or the same exception, instead of repeating the upstream work.
+
+Results are shared between the callers and must be treated as read-only.
+"""
+
+import inspect
+import threading
+import functools
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: BaseException | None = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Deduplicate concurrent calls by key (the Go `singleflight` pattern)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict = {}
+        self.executed = 0     # calls that actually ran fn
+        self.coalesced = 0    # calls served by another caller's execution
+
+    def do(self, key, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) once per key at a time; concurrent callers share the outcome."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+flights = SingleFlight()
+
+
+def coalesce(kind: str, key_fn):
+    """
+    Decorator: coalesce concurrent calls of a function through the shared `flights`.
+
+    key_fn receives the bound arguments (defaults applied) as a dict and returns
+    the normalized key, or None to run the call without coalescing (e.g. when a
+    caller passes its own session or progress callback).
+    """
+    def decorator(fn):
+        sig = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            bound = sig.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = key_fn(bound.arguments)
+            if key is None:
+                return fn(*args, **kwargs)
+            return flights.do((kind, key), fn, *args, **kwargs)
+
+        return wrapper
+    return decorator
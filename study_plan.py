@@ -0,0 +1,1519 @@
+"""
+study_plan.py
+Fetches the full ficha of a degree from the RUCT (datos básicos, estudio.action,
+módulos/materias) and its study plan from the BOE, and parses both into
+structured subjects and ECTS breakdowns.
+
+Kept free of Streamlit so the app, the offline tools and the JSON API share it.
+"""
+
+import re
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from bs4 import BeautifulSoup
+
+import resilience
+import subject_index
+from cache_store import get_store
+from records import Ficha, Subject
+from resilience import Cached, ResilientSession
+from ruct_scraper import _clean_text
+from profiling import profiled
+from singleflight import coalesce
+
+# ─── Study plan scraper ───────────────────────────────────────────────────────
+_WEB_HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+        "AppleWebKit/537.36 (KHTML, like Gecko) "
+        "Chrome/120.0.0.0 Safari/537.36"
+    )
+}
+
+_RUCT_INIT_URL = "https://www.educacion.gob.es/ruct/consultaestudios.action"
+_RUCT_MODULES_URL = (
+    "https://www.educacion.gob.es/ruct/solicitud/datosModulo"
+    "?actual=menu.solicitud.planificacion.materiasSin&codModulo=0"
+)
+
+
+def _codigo_from_url(url_ruct: str) -> str:
+    """Return the RUCT codigoEstudio embedded in an estudio/detalles URL, or ''."""
+    m = re.search(r"codigoEstudio=(\d+)", url_ruct or "")
+    return m.group(1) if m else ""
+
+
+def _degree_flight_key(args: dict):
+    """Coalescing key for per-degree fetches: the codigo, or the URLs when it is unknown."""
+    url_ruct, url_plan = args.get("url_ruct") or "", args.get("url_plan") or ""
+    return _codigo_from_url(url_ruct) or _codigo_from_url(url_plan) or (url_ruct, url_plan)
+
+
+def _boe_flight_key(args: dict):
+    """Coalescing key for BOE fetches: the BOE-A-… identifier, or the URL."""
+    m = re.search(r"BOE-[A-Z]-\d{4}-\d+", args.get("url") or "")
+    return m.group(0) if m else args.get("url")
+
+
+def _boe_pdf_to_html(pdf_url: str) -> str:
+    """Convert a BOE PDF URL to its HTML equivalent (txt.php).
+    e.g. .../pdfs/BOE-A-2013-7517.pdf -> https://www.boe.es/diario_boe/txt.php?id=BOE-A-2013-7517
+    """
+    m = re.search(r"(BOE-[A-Z]-\d{4}-\d+)\.pdf", pdf_url)
+    return f"https://www.boe.es/diario_boe/txt.php?id={m.group(1)}" if m else ""
+
+
+def _ruct_session() -> ResilientSession:
+    """A fresh RUCT session (the init page sets up its server-side state)."""
+    session = ResilientSession()
+    session.headers.update(_WEB_HEADERS)
+    try:
+        session.get(_RUCT_INIT_URL, timeout=15)
+    except Exception:
+        session.close()
+        raise
+    return session
+
+
+def _plan_url_from_ruct(url_ruct: str, url_plan: str = "") -> str:
+    """detalles.action URL of a degree, built from the codigoEstudio of url_ruct when missing."""
+    if not url_plan and url_ruct:
+        m = re.search(r"codigoEstudio=(\d+)", url_ruct)
+        if m:
+            url_plan = (
+                f"https://www.educacion.gob.es/ruct/detalles.action"
+                f"?codigoEstudio={m.group(1)}&actual=detallesbasicos"
+            )
+    return url_plan
+
+
+def _parse_detalles(html: str) -> dict:
+    """detalles.action — datos basicos: denominacion, profesion regulada, norma, menciones/especialidades."""
+    ficha: dict = {}
+    soup_det = BeautifulSoup(html, "lxml")
+
+    def _inp(name):
+        el = soup_det.find("input", {"name": name})
+        return el["value"].strip() if el and el.get("value") else ""
+
+    ficha["denominacion"] = _inp("denominacion")
+    ficha["habilita"] = _inp("habilita")
+    ficha["profesion_regulada"] = _inp("codigoProfesionRegulada")
+
+    for for_val, key in [("acuerdo", "acuerdo"), ("norma", "norma")]:
+        lbl = soup_det.find("label", {"for": for_val})
+        if lbl:
+            a = lbl.find("a")
+            if a:
+                ficha[key] = a.get_text(strip=True)
+
+    for fs in soup_det.find_all("fieldset"):
+        leg = fs.find("legend")
+        if not leg:
+            continue
+        leg_text = leg.get_text(strip=True).lower()
+        tbl = fs.find("table")
+        if not tbl:
+            continue
+        items = []
+        for tr in tbl.find_all("tr")[1:]:
+            cells = tr.find_all("td")
+            if len(cells) >= 2:
+                nombre = cells[1].get_text(strip=True)
+                cred = cells[2].get_text(strip=True) if len(cells) > 2 else ""
+                if nombre:
+                    items.append({"nombre": nombre, "creditos": cred})
+        if "menci" in leg_text:
+            ficha["menciones"] = items
+        elif "especialidad" in leg_text:
+            ficha["especialidades"] = items
+    return ficha
+
+
+def _crawl_subjects(session: ResilientSession, url_plan: str) -> list[Subject]:
+    """
+    Subject list (datosModulo) and details (datosMateria) of a degree. The
+    session's server-side context must be the degree's detalles.action page.
+    """
+    # Navigate to materiasSin context before datosModulo
+    if url_plan:
+        nav_url = re.sub(r"actual=[^&]*", "actual=menu.solicitud.planificacion.materiasSin", url_plan)
+        session.get(nav_url, timeout=15)
+    r_mod = session.get(_RUCT_MODULES_URL, timeout=15)
+    if r_mod.status_code == 200:
+        soup_mod = BeautifulSoup(r_mod.text, "lxml")
+        mod_table = soup_mod.find("table")
+        if mod_table:
+            import urllib.parse as _uparse
+            # Each entry: (absolute_url, codModulo, codMateria)
+            subject_triples = []
+            top_ids = []
+            rows = mod_table.find_all("tr")[1:]
+            for tr in rows:
+                cells = tr.find_all("td")
+                if not cells:
+                    continue
+                found = False
+                for td in cells:
+                    a = td.find("a", href=True)
+                    if a and "datosMateria" in a["href"]:
+                        href = a["href"]
+                        if href.startswith("http"):
+                            abs_url = href
+                        elif href.startswith("/"):
+                            abs_url = f"https://www.educacion.gob.es{href}"
+                        else:
+                            abs_url = f"https://www.educacion.gob.es/ruct/solicitud/{href}"
+                        qs = _uparse.parse_qs(_uparse.urlparse(abs_url).query)
+                        cm = qs.get("codMateria", [""])[0]
+                        mo = qs.get("codModulo", ["0"])[0]
+                        if cm.isdigit():
+                            subject_triples.append((abs_url, mo, cm))
+                            found = True
+                        break
+                if not found:
+                    sid = cells[0].get_text(strip=True)
+                    if sid.isdigit():
+                        top_ids.append(sid)
+
+            # Fallback when no hrefs found in table
+            if not subject_triples:
+                if len(top_ids) > 10:
+                    for sid in top_ids:
+                        url_fb = (
+                            "https://www.educacion.gob.es/ruct/solicitud/"
+                            f"datosMateria!consulta.action?codModulo=0&codMateria={sid}"
+                            "&actual=menu.solicitud.planificacion.materias.datos"
+                        )
+                        subject_triples.append((url_fb, "0", sid))
+                else:
+                    for mod_id in top_ids:
+                        sub_url = (
+                            "https://www.educacion.gob.es/ruct/solicitud/datosModulo"
+                            f"?actual=menu.solicitud.planificacion.materiasSin&codModulo={mod_id}"
+                        )
+                        r_sub = session.get(sub_url, timeout=15)
+                        if r_sub.status_code == 200:
+                            soup_sub = BeautifulSoup(r_sub.text, "lxml")
+                            sub_table = soup_sub.find("table")
+                            if sub_table:
+                                for tr2 in sub_table.find_all("tr")[1:]:
+                                    cells2 = tr2.find_all("td")
+                                    if cells2:
+                                        sid2 = cells2[0].get_text(strip=True)
+                                        if sid2.isdigit():
+                                            url_fb = (
+                                                "https://www.educacion.gob.es/ruct/solicitud/"
+                                                f"datosMateria!consulta.action?codModulo={mod_id}&codMateria={sid2}"
+                                                "&actual=menu.solicitud.planificacion.materias.datos"
+                                            )
+                                            subject_triples.append((url_fb, mod_id, sid2))
+                    if not subject_triples:
+                        for sid in top_ids:
+                            url_fb = (
+                                "https://www.educacion.gob.es/ruct/solicitud/"
+                                f"datosMateria!consulta.action?codModulo=0&codMateria={sid}"
+                                "&actual=menu.solicitud.planificacion.materias.datos"
+                            )
+                            subject_triples.append((url_fb, "0", sid))
+
+            def _fetch_subject(mat_url):
+                rr = session.get(mat_url, timeout=10)
+                if rr.status_code != 200:
+                    return None
+                sp = BeautifulSoup(rr.text, "lxml")
+                el = sp.find("input", {"name": "descripcion"})
+                nom = _clean_text(el.get("value", "")) if el else ""
+                if not nom:
+                    return None
+                el = sp.find("input", {"name": "datosBasicos.caracter.codigo"})
+                car = _clean_text(el.get("value", "")) if el else ""
+                el = sp.find("input", {"name": "datosBasicos.ectsMateria"})
+                ects_val = 0.0
+                if el:
+                    try:
+                        ects_val = float(el.get("value", "0").replace(",", "."))
+                    except ValueError:
+                        pass
+                sem_num = 0
+                periodos = [inp.get("value", "") for inp in sp.find_all("input", {"name": "periodo"})]
+                ects_pp  = [inp.get("value", "") for inp in sp.find_all("input", {"name": "ects"})]
+                for p_str, e_str in zip(periodos, ects_pp):
+                    try:
+                        if float(e_str.replace(",", ".")) > 0:
+                            sem_num = int(p_str)
+                            break
+                    except (ValueError, TypeError):
+                        pass
+                curso    = f"{(sem_num + 1) // 2}º" if sem_num > 0 else ""
+                semestre = f"S{sem_num}" if sem_num > 0 else ""
+                cat = _categorize_ects(car) or "otros"
+                return Subject(
+                    nombre=nom, caracter=car, categoria=cat,
+                    ects=ects_val, curso=curso, semestre=semestre,
+                )
+
+            _subjects = []
+            for mat_url, mo, cm in subject_triples:
+                try:
+                    result = _fetch_subject(mat_url)
+                    if result:
+                        _subjects.append(result)
+                except Exception:
+                    continue
+
+            return _subjects
+    return []
+
+
+def _parse_estudio(html: str) -> dict:
+    """estudio.action — nivel, MECES, rama, campo, ECTS by type, centro, CCAA, BOE URL."""
+    ficha: dict = {"boe_plan_url": ""}
+    soup_est = BeautifulSoup(html, "lxml")
+
+    def _sid(span_id):
+        el = soup_est.find(id=span_id)
+        return el.get_text(strip=True) if el else ""
+
+    nivel_raw = _sid("estudio_descripcionTipo")
+    meces = _sid("estudio_nivelMeces")
+    nivel_clean = nivel_raw.split(" - ")[0].strip() if " - " in nivel_raw else nivel_raw
+    ficha["nivel"] = nivel_clean
+    ficha["meces"] = meces
+    ficha["rama"] = _sid("estudio_descripcionRama")
+    ficha["campo"] = _sid("estudio_descripcionAmbito")
+
+    # Extract ECTS credit distribution by type
+    _ects_labels = [
+        ("estudio_creditos_fbasic",  "Formación Básica",           "basica"),
+        ("estudio_creditos_obl",     "Obligatorios",                "obligatoria"),
+        ("estudio_creditos_opt",     "Optativos",                   "optativa"),
+        ("estudio_creditos_pracext", "Prácticas Externas",          "practicas"),
+        ("estudio_creditos_trbfin",  "Trabajo Fin de Grado/Máster", "tfg_tfm"),
+    ]
+    creditos = {}
+    for lbl_for, nombre, cat in _ects_labels:
+        el = soup_est.find("label", {"for": lbl_for})
+        if el:
+            txt = el.get_text(strip=True)
+            idx = txt.rfind(":")
+            if idx >= 0:
+                try:
+                    creditos[cat] = {"nombre": nombre, "ects": float(txt[idx+1:].strip().replace(",", "."))}
+                except ValueError:
+                    pass
+    if creditos:
+        ficha["creditos"] = creditos
+
+    tthree = soup_est.find("div", id="tthree")
+    if tthree:
+        tbl = tthree.find("table", id="centro")
+        if tbl:
+            rows = tbl.find_all("tr")[1:]
+            if rows:
+                cells = rows[0].find_all("td")
+                if len(cells) >= 3:
+                    ficha["universidad"] = cells[0].get_text(strip=True)
+                    ficha["centro"] = cells[2].get_text(strip=True)
+
+    ttwo = soup_est.find("div", id="ttwo")
+    if ttwo:
+        ccaa_tbl = ttwo.find("table", id="ccaa")
+        if ccaa_tbl:
+            rows = ccaa_tbl.find_all("tr")[1:]
+            if rows:
+                cells = rows[0].find_all("td")
+                if len(cells) >= 3:
+                    ficha["ccaa"] = cells[2].get_text(strip=True)
+        plan_label = ttwo.find("label", {"for": "f_plan"})
+        if plan_label:
+            a = plan_label.find("a", href=True)
+            if a:
+                ficha["boe_plan_url"] = _boe_pdf_to_html(a["href"])
+        if not ficha["boe_plan_url"]:
+            for label in ttwo.find_all("label"):
+                if "Plan Estudios" in label.get_text():
+                    a = label.find("a", href=True)
+                    if a and "boe.es" in a["href"] and ".pdf" in a["href"]:
+                        ficha["boe_plan_url"] = _boe_pdf_to_html(a["href"])
+                        break
+    return ficha
+
+
+# ─── Fetch stage graph ────────────────────────────────────────────────────────
+_STAGE_WORKERS = 4
+
+
+def _run_stages(stages: dict) -> dict:
+    """
+    Run a small task graph {name: (fn, deps)} and return {name: result}.
+
+    fn(done) receives the results of the stages finished so far and starts as
+    soon as its deps are done, so independent branches overlap and the wall time
+    is that of the longest branch. A stage that raises gets the result None,
+    and so do the stages depending on it (like the try/except around a
+    sequential scrape).
+    """
+    done: dict = {}
+    pending = dict(stages)
+    running: dict = {}
+    with ThreadPoolExecutor(max_workers=_STAGE_WORKERS, thread_name_prefix="plan-stage") as ex:
+        while True:
+            ready = [n for n, (_, deps) in pending.items() if all(d in done for d in deps)]
+            for name in ready:
+                fn, deps = pending.pop(name)
+                if any(done[d] is None for d in deps):
+                    done[name] = None
+                else:
+                    running[ex.submit(fn, dict(done))] = name
+            if ready and not running:
+                continue            # skipped stages may have unblocked others
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                name = running.pop(fut)
+                try:
+                    done[name] = fut.result()
+                except Exception:
+                    done[name] = None
+    for name in pending:            # deps that are not stages of the graph
+        done[name] = None
+    return done
+
+
+def _ficha_stages(url_ruct: str, url_plan: str) -> dict:
+    """
+    Stages of the full ficha scrape. detalles.action and the subject crawl
+    share one session (datosModulo reads the degree from its server-side
+    context); estudio.action runs on a session of its own, concurrently.
+    """
+    def detalles(done):
+        session = _ruct_session()
+        try:
+            r_det = session.get(url_plan, timeout=15)
+        except Exception:
+            session.close()
+            raise
+        return session, (_parse_detalles(r_det.text) if r_det.status_code < 400 else {})
+
+    def subjects(done):
+        session = done["detalles"][0]      # handed over by detalles: closed here
+        try:
+            return _crawl_subjects(session, url_plan)
+        finally:
+            session.close()
+
+    def estudio(done):
+        with _ruct_session() as session:
+            r_est = session.get(url_ruct, timeout=15)
+        r_est.raise_for_status()
+        return _parse_estudio(r_est.text)
+
+    return {
+        "detalles": (detalles, ()),
+        "subjects": (subjects, ("detalles",)),
+        "estudio": (estudio, ()),
+    }
+
+
+def _ficha_from_stages(done: dict) -> dict:
+    """The full ficha dict (as _fetch_ruct_ficha returns it) from the results of _ficha_stages."""
+    ficha = {
+        "denominacion": "", "universidad": "", "centro": "", "ccaa": "",
+        "nivel": "", "meces": "", "rama": "", "campo": "",
+        "habilita": "", "profesion_regulada": "", "acuerdo": "", "norma": "",
+        "menciones": [], "especialidades": [], "boe_plan_url": "",
+    }
+    if done.get("detalles"):
+        ficha.update(done["detalles"][1])
+    if done.get("subjects"):
+        ficha["modules"] = done["subjects"]
+    if done.get("estudio"):
+        ficha.update(done["estudio"])
+    return ficha
+
+
+@coalesce("ficha", _degree_flight_key)
+def _fetch_ruct_ficha(url_ruct: str, url_plan: str) -> dict:
+    """
+    Fetch full degree metadata from RUCT and the BOE study plan URL.
+
+    Stages (see _ficha_stages), two sessions in parallel:
+      a. GET consultaestudios.action → detalles.action (datos basicos: denominacion,
+         profesion regulada, norma, menciones/especialidades) → datosModulo/datosMateria
+      b. GET consultaestudios.action → estudio.action (nivel, MECES, rama, campo,
+         centro, CCAA, BOE URL)
+
+    Returns a dict with all available fields (empty string/list when not found).
+    """
+    if not url_ruct:
+        return _ficha_from_stages({})
+    return _ficha_from_stages(_run_stages(_ficha_stages(url_ruct, _plan_url_from_ruct(url_ruct, url_plan))))
+
+
+@coalesce("ficha_quick", _degree_flight_key)
+def _fetch_ruct_ficha_quick(url_ruct: str, url_plan: str = "") -> dict:
+    """
+    Lightweight version of _fetch_ruct_ficha that skips subject fetching.
+    Only retrieves metadata + ECTS credit distribution. Used for the comparator.
+    """
+    ficha: dict = {"boe_plan_url": ""}
+    url_plan = _plan_url_from_ruct(url_ruct, url_plan)
+    try:
+        with _ruct_session() as session:
+            r_det = session.get(url_plan, timeout=15)
+            if r_det.status_code < 400:
+                ficha.update(_parse_detalles(r_det.text))
+            r_est = session.get(url_ruct, timeout=15)
+        r_est.raise_for_status()
+        ficha.update(_parse_estudio(r_est.text))
+    except Exception:
+        pass
+    return Ficha.from_dict(ficha)
+
+
+def _html_table_to_md(table) -> str:
+    """Convert a BS4 table tag to a Markdown table string."""
+    rows = []
+    for i, tr in enumerate(table.find_all("tr")):
+        cells = [td.get_text(separator=" ", strip=True) for td in tr.find_all(["th", "td"])]
+        if not cells:
+            continue
+        rows.append("| " + " | ".join(cells) + " |")
+        if i == 0:
+            rows.append("|" + "|".join([" --- "] * len(cells)) + "|")
+    return "\n".join(rows)
+
+
+def _detect_header_cols(cells_text: list[str]):
+    """Return (nom_col, car_col, ects_col, cur_col, sem_col) from a list of header cell texts.
+
+    Prioritises 'asignatura' / 'denominaci' over broader terms like 'módulo' / 'materia'
+    so that tables with [Módulo, Materia, Asignatura, ECTS, Carácter] headers correctly
+    use the 'Asignatura' column as the subject name (enabling rowspan offset to work).
+    """
+    nom_col = car_col = ects_col = cur_col = sem_col = None
+    specific_nom_col = None   # asignatura / denominacion — highest priority
+
+    for idx, h in enumerate(cells_text):
+        hl = h.lower()
+        if any(k in hl for k in ["asignatura", "denominaci"]):
+            if specific_nom_col is None:
+                specific_nom_col = idx
+        elif any(k in hl for k in ["nombre", "materia"]):
+            # Exclude "tipo de materia", "carácter de materia", etc. — those are type columns
+            if nom_col is None and not any(excl in hl for excl in ["tipo", "carácter", "caracter"]):
+                nom_col = idx
+        elif any(k in hl for k in ["módulo", "modulo"]):
+            # "módulo" is last resort: it names groups, not individual subjects
+            if nom_col is None:
+                nom_col = idx
+        elif any(k in hl for k in ["carácter", "caracter", "tipo", "naturaleza"]):
+            car_col = idx
+        elif any(k in hl for k in ["ects", "crédito", "credito"]):
+            if ects_col is None:
+                ects_col = idx
+        elif "curso" in hl and "recursos" not in hl:
+            cur_col = idx
+        elif any(k in hl for k in ["semestre", "período", "periodo", "cuatr"]):
+            sem_col = idx
+
+    # Prefer specific match ('asignatura'/'denominaci') over generic ('módulo'/'materia')
+    if specific_nom_col is not None:
+        nom_col = specific_nom_col
+
+    return nom_col, car_col, ects_col, cur_col, sem_col
+
+
+def _adj_col(col, n_header, n_cells):
+    """Adjust a column index for rows with fewer cells than the header (due to rowspan)."""
+    if col is None:
+        return None
+    adjusted = col - max(0, n_header - n_cells)
+    return adjusted if 0 <= adjusted < n_cells else None
+
+
+_ORDINAL_TO_CURSO = {
+    "primer": "1º", "primero": "1º", "first": "1º",
+    "segundo": "2º", "second": "2º",
+    "tercer": "3º", "tercero": "3º", "third": "3º",
+    "cuarto": "4º", "fourth": "4º",
+    "quinto": "5º", "fifth": "5º",
+    "sexto": "6º", "sixth": "6º",
+}
+
+
+def _section_to_curso(text: str) -> str:
+    """Convert a section header to a short course label ('1º', '2º', …).
+
+    Handles all BOE heading patterns:
+      - "PRIMER CURSO"          → keyword after ordinal  → prefix has ordinal
+      - "2.º Curso"             → keyword after digit    → prefix has digit
+      - "Curso 1.º"             → keyword before digit   → suffix has digit
+      - "Segundo curso (primer semestre)" → prefix has ordinal
+      - "Primero" / "Segundo"   → no keyword, ordinal word only
+
+    Safety rules:
+      - Digits (1-6) are only used when a course keyword (\bcurso\b|\baño\b|\byear\b)
+        is present in the text, preventing false positives from law article numbers,
+        ECTS credit counts, etc.
+      - Without a course keyword, only explicit ordinal words are matched.
+      - Uses word-boundary regex for keyword detection so 'años'/'cursos' don't match.
+    """
+    t = text.lower().strip().rstrip(".")
+
+    kw_match = re.search(r'\b(curso|año|year)\b', t)
+    if kw_match:
+        prefix = t[:kw_match.start()]
+        suffix = t[kw_match.end():]
+        # Search prefix first, then suffix (handles both "Primer Curso" and "Curso 1.º")
+        for segment in (prefix, suffix):
+            m = re.search(r"(\d+)", segment)
+            if m:
+                n = int(m.group(1))
+                if 1 <= n <= 6:
+                    return f"{n}º"
+            for word, label in _ORDINAL_TO_CURSO.items():
+                if re.search(r"\b" + re.escape(word) + r"\b", segment):
+                    return label
+        return ""  # Course keyword present but no year identifier found
+
+    # No course keyword → digits are never reliable; only match ordinal words
+    for word, label in _ORDINAL_TO_CURSO.items():
+        if re.search(r"\b" + re.escape(word) + r"\b", t):
+            return label
+    return ""
+
+
+_ROMAN_VALUES = {"I": 1, "V": 5, "X": 10, "L": 50, "C": 100}
+
+
+def _roman_to_int(s: str) -> int:
+    """Convert a Roman numeral string (I–XII) to an integer, or 0 if unrecognised."""
+    s = s.upper().strip()
+    result, prev = 0, 0
+    for ch in reversed(s):
+        val = _ROMAN_VALUES.get(ch, 0)
+        if not val:
+            return 0
+        result += val if val >= prev else -val
+        prev = val
+    return result
+
+
+def _sem_to_curso(sem: str) -> str:
+    """Derive the academic year from a semester label (2 semesters per year).
+
+    Handles Roman numerals (I, II, III, … VIII) and Arabic digits (1, 2, … 8),
+    including ranges like 'I-II' or '3-4' (takes the first value).
+    Returns '' if the label cannot be parsed as a semester number.
+    """
+    if not sem:
+        return ""
+    s = sem.strip()
+    # Take the first token before any separator (-, /, space, comma)
+    first = re.split(r"[-/\s,]", s)[0].strip()
+    # Try Roman numeral first (UAX style: I, II, III…)
+    n = _roman_to_int(first)
+    if not n:
+        # Try leading Arabic digits — re.match handles "1º", "2º" etc.
+        m = re.match(r"(\d+)", first)
+        n = int(m.group(1)) if m else 0
+    if 1 <= n <= 12:
+        return f"{(n + 1) // 2}º"
+    return ""
+
+
+def _parse_boe_subjects_from_content(content) -> list[dict]:
+    """
+    Extract per-subject rows from an already-fetched BOE #textoxslt BeautifulSoup element.
+
+    Iterates ALL direct children in DOM order so that <p>/<h*> elements immediately before
+    a <table> (e.g. "Curso 1.º") are captured as the course label for that table.
+    Also handles section-header rows inside tables and rowspan-shortened data rows.
+    """
+    from bs4 import Tag
+    subjects = []
+    seen_names: set = set()
+    current_curso = ""
+
+    for element in content.children:
+        if not isinstance(element, Tag):
+            continue
+
+        # ── Paragraph / heading: check for course indicator ────────────────────
+        if element.name in ("p", "h2", "h3", "h4", "h5"):
+            txt = element.get_text(" ", strip=True)
+            curso = _section_to_curso(txt)
+            if curso:
+                current_curso = curso
+            continue
+
+        if element.name != "table":
+            continue
+
+        if element.find_parent("table"):
+            continue
+
+        # ── Table ──────────────────────────────────────────────────────────────
+        rows = element.find_all("tr")
+        if len(rows) < 3:
+            continue
+
+        nom_col = car_col = ects_col = cur_col = sem_col = None
+        header_row_idx = 0
+        hcells = []
+        for try_idx in range(min(2, len(rows))):
+            hcells = [th.get_text(strip=True) for th in rows[try_idx].find_all(["th", "td"])]
+            nom_col, car_col, ects_col, cur_col, sem_col = _detect_header_cols(hcells)
+            if nom_col is not None and ects_col is not None:
+                header_row_idx = try_idx
+                break
+
+        if nom_col is None or ects_col is None:
+            continue
+
+        n_header = len(hcells)
+
+        # Course label priority: in-table section row > preceding <p>
+        section_curso = current_curso
+        if header_row_idx == 1:
+            sec_text = " ".join(rows[0].get_text(strip=True).split())
+            from_section = _section_to_curso(sec_text)
+            if from_section:
+                section_curso = from_section
+
+        table_subjects = []
+        for tr in rows[header_row_idx + 1:]:
+            cells = tr.find_all(["td", "th"])
+            if not cells:
+                continue
+            n = len(cells)
+            # Single-cell rows inside the body are section labels (year/course indicator)
+            if n == 1:
+                label = _section_to_curso(cells[0].get_text(" ", strip=True))
+                if label:
+                    section_curso = label
+                continue
+            nc  = _adj_col(nom_col,  n_header, n)
+            ec  = _adj_col(ects_col, n_header, n)
+            cc  = _adj_col(car_col,  n_header, n)
+            urc = _adj_col(cur_col,  n_header, n)
+            sc  = _adj_col(sem_col,  n_header, n)
+            if nc is None or ec is None:
+                continue
+            nom = _clean_text(cells[nc].get_text(strip=True))
+            if not nom or any(k in nom.lower() for k in ["total", "suma", "créditos"]):
+                continue
+            try:
+                ects_val = float(cells[ec].get_text(strip=True).replace(",", ".").strip())
+                if ects_val <= 0 or ects_val > 30:
+                    continue
+            except (ValueError, IndexError):
+                continue
+            car = _clean_text(cells[cc].get_text(strip=True))  if cc  is not None else ""
+            cur = _clean_text(cells[urc].get_text(strip=True)) if urc is not None else ""
+            sem = _clean_text(cells[sc].get_text(strip=True))  if sc  is not None else ""
+            # Normalize bare digit course number from "Curso" column (e.g. "1" → "1º")
+            if cur and re.fullmatch(r"\d+", cur):
+                n = int(cur)
+                if 1 <= n <= 6:
+                    cur = f"{n}º"
+            if not cur:
+                cur = section_curso or _sem_to_curso(sem)
+            cat = _categorize_ects(car) or "otros"
+            table_subjects.append(Subject(
+                nombre=nom, caracter=car, categoria=cat,
+                ects=ects_val, curso=cur, semestre=sem,
+            ))
+
+        if len(table_subjects) >= 3:
+            # Skip module-summary tables: title row before headers, no course info,
+            # and we already have subject data from previous tables.
+            is_module_summary = (
+                header_row_idx == 1
+                and not section_curso
+                and subjects
+                and all(s["curso"] == "" for s in table_subjects)
+            )
+            if not is_module_summary:
+                existing_per_year: dict = {}
+                for s in subjects:
+                    if s["curso"]:
+                        existing_per_year[s["curso"]] = existing_per_year.get(s["curso"], 0) + 1
+                table_per_year: dict = {}
+                for s in table_subjects:
+                    if s["curso"]:
+                        table_per_year[s["curso"]] = table_per_year.get(s["curso"], 0) + 1
+                for s in table_subjects:
+                    if s["nombre"] not in seen_names:
+                        cur = s["curso"]
+                        if cur and existing_per_year.get(cur, 0) > table_per_year.get(cur, 0):
+                            continue
+                        subjects.append(s)
+                        seen_names.add(s["nombre"])
+    return subjects
+
+
+class _BoeXmlSubjectParser:
+    """
+    Incremental extraction of per-subject rows from the children of a BOE <texto>.
+
+    Children must be fed IN DOM ORDER so that <p> elements immediately before
+    a <table> (e.g. "Curso 1.º") are captured as the course label for that table.
+    Also handles section-header rows inside tables (e.g. 'PRIMER CURSO' as row 0)
+    and rowspan-shortened data rows. Holds no reference to fed elements, so the
+    caller may clear them right after feed() (streaming iterparse).
+    """
+
+    def __init__(self):
+        self.subjects: list[dict] = []
+        self._seen_names: set = set()
+        self._current_curso = ""    # course label from a preceding <p>/<h*> element
+
+    def feed(self, element) -> int:
+        """Process one direct child of <texto>; return the number of subjects added."""
+        tag = element.tag
+
+        # ── Paragraph / heading: check for course indicator ────────────────────
+        if tag in ("p", "h2", "h3", "h4", "h5"):
+            txt = " ".join(element.itertext()).strip()
+            curso = _section_to_curso(txt)
+            if curso:
+                self._current_curso = curso
+            return 0
+
+        if tag != "table":
+            return 0
+
+        # ── Table ──────────────────────────────────────────────────────────────
+        rows = element.findall(".//tr")
+        if len(rows) < 3:
+            return 0
+
+        # Try row 0, then row 1 as column-header row.
+        # Some BOEs use <th> for headers instead of <td>.
+        nom_col = car_col = ects_col = cur_col = sem_col = None
+        header_row_idx = 0
+        hcells_text = []
+        for try_idx in range(min(2, len(rows))):
+            ths = rows[try_idx].findall(".//th")
+            hcells_text = ([" ".join(th.itertext()).strip() for th in ths]
+                           if ths else
+                           [" ".join(td.itertext()).strip() for td in rows[try_idx].findall(".//td")])
+            nom_col, car_col, ects_col, cur_col, sem_col = _detect_header_cols(hcells_text)
+            if nom_col is not None and ects_col is not None:
+                header_row_idx = try_idx
+                break
+
+        if nom_col is None or ects_col is None:
+            return 0
+
+        n_header = len(hcells_text)
+
+        # Course label priority: in-table section row > preceding <p>
+        section_curso = self._current_curso
+        if header_row_idx == 1:
+            sec_text = " ".join("".join(rows[0].itertext()).split())
+            from_section = _section_to_curso(sec_text)
+            if from_section:
+                section_curso = from_section
+
+        table_subjects = []
+        for tr in rows[header_row_idx + 1:]:
+            cells = tr.findall(".//td")
+            if not cells:
+                continue
+            n = len(cells)
+            # Single-cell rows inside the body are section labels (year/course indicator)
+            if n == 1:
+                label = _section_to_curso(" ".join(cells[0].itertext()).strip())
+                if label:
+                    section_curso = label
+                continue
+            nc  = _adj_col(nom_col,  n_header, n)
+            ec  = _adj_col(ects_col, n_header, n)
+            cc  = _adj_col(car_col,  n_header, n)
+            urc = _adj_col(cur_col,  n_header, n)
+            sc  = _adj_col(sem_col,  n_header, n)
+            if nc is None or ec is None:
+                continue
+            nom = _clean_text(" ".join(cells[nc].itertext()).strip())
+            if not nom or any(k in nom.lower() for k in ["total", "suma", "créditos"]):
+                continue
+            try:
+                ects_val = float(" ".join(cells[ec].itertext()).strip().replace(",", "."))
+                if ects_val <= 0 or ects_val > 30:
+                    continue
+            except (ValueError, IndexError):
+                continue
+            car = _clean_text(" ".join(cells[cc].itertext()).strip())  if cc  is not None else ""
+            cur = _clean_text(" ".join(cells[urc].itertext()).strip()) if urc is not None else ""
+            sem = _clean_text(" ".join(cells[sc].itertext()).strip())  if sc  is not None else ""
+            # Normalize bare digit course number from "Curso" column (e.g. "1" → "1º")
+            if cur and re.fullmatch(r"\d+", cur):
+                n = int(cur)
+                if 1 <= n <= 6:
+                    cur = f"{n}º"
+            if not cur:
+                cur = section_curso or _sem_to_curso(sem)
+            cat = _categorize_ects(car) or "otros"
+            table_subjects.append(Subject(nombre=nom, caracter=car, categoria=cat,
+                                          ects=ects_val, curso=cur, semestre=sem))
+
+        if len(table_subjects) < 3:
+            return 0
+
+        subjects = self.subjects
+        # Skip module-summary tables: title row before headers, no course info on
+        # any entry, and we already have subject data from previous tables.
+        # Example: UCM "Plan de estudios resumido (por módulo)" table.
+        is_module_summary = (
+            header_row_idx == 1
+            and not section_curso
+            and subjects
+            and all(s["curso"] == "" for s in table_subjects)
+        )
+        if is_module_summary:
+            return 0
+        # Prefer finer granularity: if a year already has MORE subjects than
+        # this table contributes for that year, skip this table's entries for
+        # that year (avoids mixing individual subjects + module aggregates).
+        existing_per_year: dict = {}
+        for s in subjects:
+            if s["curso"]:
+                existing_per_year[s["curso"]] = existing_per_year.get(s["curso"], 0) + 1
+        table_per_year: dict = {}
+        for s in table_subjects:
+            if s["curso"]:
+                table_per_year[s["curso"]] = table_per_year.get(s["curso"], 0) + 1
+        added = 0
+        for s in table_subjects:
+            if s["nombre"] not in self._seen_names:
+                cur = s["curso"]
+                if cur and existing_per_year.get(cur, 0) > table_per_year.get(cur, 0):
+                    continue  # existing data is more granular for this year
+                subjects.append(s)
+                self._seen_names.add(s["nombre"])
+                added += 1
+        return added
+
+
+def _parse_boe_subjects_from_xml(texto) -> list[dict]:
+    """
+    Extract per-subject rows from the <texto> element of a BOE xml.php response.
+    See _BoeXmlSubjectParser for the parsing rules.
+    """
+    parser = _BoeXmlSubjectParser()
+    for element in texto:       # iterate direct children IN ORDER
+        parser.feed(element)
+    return parser.subjects
+
+
+def _xml_table_to_md(table) -> str:
+    """Convert an ElementTree <table> from BOE xml.php to a Markdown table string."""
+    md_rows = []
+    for i, tr in enumerate(table.findall(".//tr")):
+        cells = [" ".join(td.itertext()).strip() for td in tr.findall(".//td")]
+        if not cells:
+            continue
+        md_rows.append("| " + " | ".join(cells) + " |")
+        if i == 0:
+            md_rows.append("|" + "|".join([" --- "] * len(cells)) + "|")
+    return "\n".join(md_rows)
+
+
+_BOE_TEXT_BUDGET = 14000     # characters of plan markdown kept for display
+
+
+def _stream_boe_xml(xml_url: str):
+    """
+    Stream a BOE xml.php document with iterparse and return (plan_text, subjects),
+    or None when the response has no <texto> element.
+
+    Each direct child of <texto> is fed to _BoeXmlSubjectParser and appended to
+    the markdown as soon as it is complete, then removed from the tree, so memory
+    stays flat regardless of bulletin size. The text budget only trims the
+    markdown: the subject parser reads up to the end of <texto>, since later
+    tables (optativas, another itinerary, an annex) still add subjects, and
+    reading stops (closing the connection) right there.
+    """
+    import xml.etree.ElementTree as _ET
+    with resilience.get(xml_url, headers=_WEB_HEADERS, timeout=15, stream=True) as rx:
+        if rx.status_code != 200:
+            return None
+        rx.raw.decode_content = True
+
+        parser = _BoeXmlSubjectParser()
+        parts = []
+        text_len = 0
+        past_first_table = False
+        depth = 0
+        texto = None
+        for event, el in _ET.iterparse(rx.raw, events=("start", "end")):
+            if event == "start":
+                depth += 1
+                if depth == 2 and el.tag == "texto":
+                    texto = el
+                continue
+            depth -= 1
+            if texto is None or depth != 2:
+                if depth == 1:
+                    if el is texto:
+                        break       # end of <texto>: nothing else is needed
+                    el.clear()      # <metadatos>, <analisis>, … — not used
+                continue
+
+            # ── A direct child of <texto> is complete ───────────────────────────
+            parser.feed(el)
+            if text_len < _BOE_TEXT_BUDGET:
+                part = ""
+                if el.tag == "table":
+                    past_first_table = True
+                    part = _xml_table_to_md(el)
+                elif el.tag in ("p", "h2", "h3", "h4") and past_first_table:
+                    part = " ".join(el.itertext()).strip()
+                if part:
+                    parts.append(part)
+                    text_len += len(part) + 2
+
+            texto.remove(el)
+
+        if texto is None:
+            return None
+        return "\n\n".join(parts)[:_BOE_TEXT_BUDGET], parser.subjects
+
+
+def _boe_txt_to_xml_url(txt_url: str) -> str:
+    """Convert a BOE txt.php URL to its xml.php equivalent."""
+    return txt_url.replace("txt.php", "xml.php")
+
+
+@coalesce("boe_plan", _boe_flight_key)
+def _fetch_boe_plan(url: str) -> tuple[str, list]:
+    """
+    Fetch a BOE plan page and return (plan_text, subjects_list).
+    Tries xml.php first (structured API, more reliable on cloud), falls back to txt.php HTML.
+    """
+    if not url:
+        return "", []
+
+    # ── Try XML endpoint first (streamed) ─────────────────────────────────────
+    try:
+        streamed = _stream_boe_xml(_boe_txt_to_xml_url(url))
+        if streamed is not None:
+            return streamed
+    except Exception:
+        pass
+
+    # ── Fallback: HTML txt.php ────────────────────────────────────────────────
+    try:
+        r = resilience.get(url, headers=_WEB_HEADERS, timeout=15)
+        if r.status_code >= 400:
+            return "", []
+        soup = BeautifulSoup(r.text, "lxml")
+        content = soup.find(id="textoxslt")
+        if not content:
+            return "", []
+
+        subjects = _parse_boe_subjects_from_content(content)
+
+        for el in content(["script", "style", "a"]):
+            el.decompose()
+
+        parts = []
+        past_first_table = False
+        for el in content.find_all(["table", "p", "h2", "h3", "h4"]):
+            if el.find_parent("table"):
+                continue
+            if el.name == "table":
+                past_first_table = True
+                md = _html_table_to_md(el)
+                if md:
+                    parts.append(md)
+            elif past_first_table:
+                text = el.get_text(strip=True)
+                if text:
+                    parts.append(text)
+
+        if not parts:
+            paragraphs = [
+                el.get_text(strip=True)
+                for el in content.find_all(["p", "h2", "h3", "h4"])
+                if not el.find_parent("table") and el.get_text(strip=True)
+            ]
+            if len(paragraphs) > 2:
+                parts = paragraphs[2:]
+
+        return "\n\n".join(parts)[:_BOE_TEXT_BUDGET], subjects
+    except Exception:
+        return "", []
+
+
+# ─── RUCT module table (datosModulo) ──────────────────────────────────────────
+_MODULES_CACHE_TTL = 7 * 24 * 3600   # seconds a module table stays fresh in the shared cache
+
+# Header keywords of the datosModulo columns (Spanish and English RUCT pages)
+_MODULE_COL_KEYWORDS = {
+    "nombre":   ["denominaci", "nombre", "materia", "módulo", "modulo",
+                 "subject", "module", "denomination", "asignatura"],
+    "caracter": ["carácter", "caracter", "tipo", "naturaleza", "character", "nature", "type"],
+    "ects":     ["ects", "crédito", "credito", "credit"],
+    "curso":    ["curso", "year"],
+    "semestre": ["semestre", "período", "periodo", "cuatr", "semester", "term", "period"],
+}
+
+
+def _detalles_url(url_plan: str) -> str:
+    """detalles.action URL of a degree (url_plan may also be its estudio.action link)."""
+    if "detalles.action" not in url_plan and "estudio.action" in url_plan:
+        codigo = _codigo_from_url(url_plan)
+        if codigo:
+            return (
+                f"https://www.educacion.gob.es/ruct/detalles.action"
+                f"?codigoEstudio={codigo}&actual=detallesbasicos"
+            )
+    return url_plan
+
+
+def _module_columns(header_cells: list[str]) -> dict:
+    """Column index per field of a datosModulo header row (None when absent)."""
+    cols = dict.fromkeys(_MODULE_COL_KEYWORDS)
+    for idx, h in enumerate(header_cells):
+        for name, keywords in _MODULE_COL_KEYWORDS.items():
+            if any(k in h for k in keywords):
+                if cols[name] is None or name in ("caracter", "curso", "semestre"):
+                    cols[name] = idx
+                break
+    # Fallback column positions (typical RUCT table: idx | nombre | carácter | ECTS)
+    if cols["nombre"] is None:
+        cols["nombre"] = 1 if len(header_cells) >= 2 else 0
+    if cols["ects"] is None and len(header_cells) >= 2:
+        cols["ects"] = len(header_cells) - 1
+    if cols["caracter"] is None and cols["nombre"] > 0 and cols["nombre"] + 1 != cols["ects"]:
+        cols["caracter"] = cols["nombre"] + 1
+    return cols
+
+
+def _read_module_table(html: str) -> dict:
+    """
+    The datosModulo table as plain text: {"header": [lower-cased header cells],
+    "rows": [[cell text…]…]}. Each consumer applies its own column rules to it.
+    """
+    table = BeautifulSoup(html, "lxml").find("table")
+    rows = table.find_all("tr") if table else []
+    if not rows:
+        return {"header": [], "rows": []}
+    return {
+        "header": [th.get_text(separator=" ", strip=True).lower()
+                   for th in rows[0].find_all(["th", "td"])],
+        "rows": [[td.get_text(strip=True) for td in tr.find_all(["td", "th"])] for tr in rows[1:]],
+    }
+
+
+def _module_subjects(table: dict) -> list[Subject]:
+    """Rows of a datosModulo table as Subjects (ects 0.0 when the cell has no number)."""
+    cols = _module_columns(table["header"])
+
+    def cell(cells, name):
+        idx = cols[name]
+        return _clean_text(cells[idx]) if idx is not None and idx < len(cells) else ""
+
+    subjects = []
+    for cells in table["rows"]:
+        if len(cells) < 2:
+            continue
+        nom = cell(cells, "nombre")
+        if not nom:
+            continue
+        first = cells[0].lower()
+        if any(k in nom.lower() or k in first for k in ["total", "suma"]):
+            continue
+        m = re.search(r"\d+(?:[.,]\d+)?", cell(cells, "ects"))
+        car = cell(cells, "caracter")
+        subjects.append(Subject(
+            nombre=nom,
+            caracter=car,
+            categoria=_categorize_ects(car) or "otros",
+            ects=float(m.group().replace(",", ".")) if m else 0.0,
+            curso=cell(cells, "curso"),
+            semestre=cell(cells, "semestre"),
+        ))
+    return subjects
+
+
+def _scrape_module_table(url_plan: str) -> dict:
+    """
+    One datosModulo round trip:
+      1. GET consultaestudios.action  — init session
+      2. GET url_plan (lupa link)     — register degree in server session
+      3. GET datosModulo              — static HTML table with the modules/subjects
+    """
+    with ResilientSession() as session:
+        session.headers.update(_WEB_HEADERS)
+        session.get(_RUCT_INIT_URL, timeout=15)
+        session.get(url_plan, timeout=15)
+        r = session.get(_RUCT_MODULES_URL, timeout=15)
+        r.raise_for_status()
+        return _read_module_table(r.text)
+
+
+def _is_module_table(value) -> bool:
+    """A cached datosModulo table (entries of the older Subject-column form are refetched)."""
+    return isinstance(value, dict) and "rows" in value
+
+
+@coalesce("modulos", lambda args: _codigo_from_url(args.get("url_plan")) or args.get("url_plan"))
+def _fetch_ruct_module_table(url_plan: str) -> dict:
+    """
+    The datosModulo table of a degree (see _read_module_table), cached per
+    codigoEstudio. The module markdown, the subject list and the ECTS fallback
+    are all derived from it. Its rows are empty when the page cannot be
+    fetched or has no table.
+    """
+    empty = {"header": [], "rows": []}
+    if not url_plan:
+        return empty
+    url_plan = _detalles_url(url_plan)
+
+    def load():
+        try:
+            return _scrape_module_table(url_plan)
+        except Exception:
+            return empty
+
+    codigo = _codigo_from_url(url_plan)
+    if not codigo:
+        return load()
+    try:
+        return resilience.swr_get("modulos", codigo, load, _MODULES_CACHE_TTL,
+                                  valid=lambda t: bool(t["rows"]), usable=_is_module_table).value
+    except Exception:
+        return load()
+
+
+def _fetch_ruct_modules(url_plan: str) -> tuple[str, list[dict]]:
+    """
+    Fallback: the 'Módulos o Materias' list of a degree from RUCT.
+
+    Returns (markdown_text, subjects_list). subjects_list entries:
+      {nombre, caracter, categoria, ects, curso, semestre}
+    """
+    subjects = _module_subjects(_fetch_ruct_module_table(url_plan))
+    if not subjects:
+        return "", []
+    text = "**Módulos y materias**\n\n" + "\n".join(f"- {s.nombre}" for s in subjects)
+    return text, subjects
+
+
+def _parse_ruct_subjects(url_plan: str) -> list[dict]:
+    """
+    Subjects of the RUCT 'datosModulo' table with a plausible ECTS value.
+    Returns list of records: {nombre, caracter, categoria, ects, curso, semestre}
+    """
+    return [s for s in _module_subjects(_fetch_ruct_module_table(url_plan)) if 0 < s.ects <= 400]
+
+
+# Bump whenever the plan scrapers change, so cached plans are rebuilt
+_PLAN_VERSION = "v35"
+_PLAN_CACHE_TTL = 7 * 24 * 3600   # seconds a plan stays valid in the shared cache
+
+
+@coalesce("study_plan", _degree_flight_key)
+@profiled("find_study_plan")
+def _find_study_plan(title: str, university: str, url_ruct: str = "", url_plan: str = "") -> dict:
+    """
+    Fetch the RUCT degree ficha (metadata) and locate the study plan.
+
+    Returns {"ficha": dict, "page_text": str, "source_url": str}
+    """
+    if not url_ruct:
+        return _plan_from_parts(_fetch_ruct_ficha(url_ruct, url_plan))
+
+    def boe(done):
+        boe_url = done["estudio"]["boe_plan_url"]
+        return _fetch_boe_plan(boe_url) if boe_url else ("", [])
+
+    # The BOE plan is fetched as soon as estudio.action gives its URL, while the
+    # subject crawl is still running: the critical path is the longest branch
+    stages = _ficha_stages(url_ruct, _plan_url_from_ruct(url_ruct, url_plan))
+    stages["boe"] = (boe, ("estudio",))
+    done = _run_stages(stages)
+    return _plan_from_parts(_ficha_from_stages(done), *(done["boe"] or ("", [])))
+
+
+def _plan_from_parts(ficha, plan_text: str = "", boe_subjects: list | None = None) -> dict:
+    """A plan from a scraped full ficha (with its 'modules') and, if any, its BOE plan."""
+    # modules fetched inside _fetch_ruct_ficha session (step 4)
+    modules_subjects = ficha.get("modules", [])
+    # A new record: the scraped dict may be shared with coalesced callers
+    ficha = Ficha.from_dict({k: v for k, v in ficha.items() if k != "modules"})
+    boe_url = ficha.get("boe_plan_url", "")
+    return {
+        "ficha": ficha,
+        "page_text": plan_text if boe_url else "",
+        "subjects_boe": (boe_subjects or []) if boe_url else [],
+        "subjects_ruct": modules_subjects,
+        "source_url": boe_url,
+        "_v": _PLAN_VERSION,
+    }
+
+
+def _plan_has_data(plan: dict) -> bool:
+    """False for failed scrapes, which are never cached."""
+    ficha = plan.get("ficha", {})
+    return bool(ficha.get("nivel") or plan.get("subjects_boe") or plan.get("subjects_ruct"))
+
+
+def _plan_record(plan: dict, title: str, university: str, url_ruct: str, url_plan: str) -> dict:
+    """A plan as stored in the shared cache: the scrape plus how to find the degree again."""
+    ficha = plan.get("ficha", {})
+    return {
+        **plan,
+        "titulo": title or ficha.get("denominacion", ""),
+        "universidad": university or ficha.get("universidad", ""),
+        "url_ruct": url_ruct, "url_plan": url_plan,
+    }
+
+
+def _index_plan(codigo: str, record: dict) -> None:
+    """Journal a plan for the subject index of every process (never fails the scrape)."""
+    try:
+        subject_index.record_plan(codigo, record)
+    except Exception:
+        pass
+
+
+def _store_plan(codigo: str, plan: dict, title: str = "", university: str = "",
+                url_ruct: str = "", url_plan: str = "") -> bool:
+    """Store a freshly scraped plan in the shared cache; False for failed scrapes (never cached)."""
+    if not codigo or not _plan_has_data(plan):
+        return False
+    record = _plan_record(plan, title, university, url_ruct, url_plan)
+    get_store().put("plan", codigo, record)
+    _index_plan(codigo, record)
+    return True
+
+
+def get_study_plan(codigo: str, title: str, university: str,
+                   url_ruct: str = "", url_plan: str = "") -> Cached:
+    """
+    Plan of a degree through the shared cache, stale-while-revalidate.
+
+    Plans older than _PLAN_CACHE_TTL are served at once (Cached.stale) and
+    re-scraped in the background; while the RUCT is down the last good plan
+    keeps being served. Cached.stored_at is None when the scrape failed and
+    nothing was cached.
+    """
+    def load():
+        record = _plan_record(_find_study_plan(title, university, url_ruct, url_plan),
+                              title, university, url_ruct, url_plan)
+        if codigo and _plan_has_data(record):
+            _index_plan(codigo, record)
+        return record
+
+    if not codigo:
+        return Cached(load(), False, None)
+    return resilience.swr_get(
+        "plan", codigo, load, _PLAN_CACHE_TTL,
+        valid=_plan_has_data, usable=lambda p: p.get("_v") == _PLAN_VERSION,
+    )
+
+
+# ─── ECTS breakdown parser ────────────────────────────────────────────────────
+_ECTS_CATS = [
+    ("basica",      ["básic", "formación bás", "formacion bas", "basica", "básica", "fbc", "fbr",
+                    "basic", "formation", "general education"]),
+    ("obligatoria", ["obligatori", "compulsory", "mandatory", "required", "core"]),
+    ("optativa",    ["optativ", "optional", "elective", "free choice"]),
+    ("practicas",   ["práctic", "practic", "practicum", "internship", "placement", "clinical"]),
+    ("tfg_tfm",     ["trabajo fin", "trabajo de fin", "tfg", "tfm",
+                    "final degree", "final project", "dissertation", "thesis"]),
+]
+
+# BOE abbreviations used in 'Carácter' columns of detailed subject tables
+_ECTS_ABBREVS = {
+    "fb": "basica", "fbc": "basica", "fbr": "basica",
+    "ob": "obligatoria",
+    "op": "optativa",
+    "pe": "practicas",
+    "tfg": "tfg_tfm", "tfm": "tfg_tfm",
+    # English abbreviations used in some RUCT pages
+    "ba": "basica", "co": "obligatoria", "el": "optativa",
+    "in": "practicas", "fd": "tfg_tfm",
+}
+
+
+def _categorize_ects(text: str):
+    t = text.lower().strip()
+    # Exact abbreviation match (e.g. carácter column contains just 'OB', 'FB', etc.)
+    if t in _ECTS_ABBREVS:
+        return _ECTS_ABBREVS[t]
+    # Strip trailing punctuation and try again
+    t_clean = t.rstrip(".,; ")
+    if t_clean in _ECTS_ABBREVS:
+        return _ECTS_ABBREVS[t_clean]
+    # Keyword substring match
+    for cat, keywords in _ECTS_CATS:
+        if any(kw in t for kw in keywords):
+            return cat
+    return None
+
+
+def _parse_ects_breakdown(boe_url: str) -> dict:
+    """
+    Fetch a BOE study plan page and parse ECTS credits by category.
+    Looks for the summary table (few rows, total 30-400 ECTS) and uses only that,
+    ignoring detailed per-subject tables which would cause double counting.
+    Returns dict: {"basica": N, "obligatoria": N, "optativa": N,
+                   "practicas": N, "tfg_tfm": N, "otros": N, "total": N}
+    """
+    result = {"basica": 0, "obligatoria": 0, "optativa": 0,
+              "practicas": 0, "tfg_tfm": 0, "otros": 0, "total": 0}
+    if not boe_url:
+        return result
+    try:
+        r = resilience.get(boe_url, headers=_WEB_HEADERS, timeout=15)
+        if r.status_code >= 400:
+            return result
+        soup = BeautifulSoup(r.text, "lxml")
+        content = soup.find(id="textoxslt")
+        if not content:
+            return result
+
+        def _parse_single_table(table):
+            """Parse one table and return (totals_dict, n_data_rows) or (None, 0)."""
+            rows = table.find_all("tr")
+            if not rows:
+                return None, 0
+            header_cells = [th.get_text(separator=" ", strip=True).lower()
+                            for th in rows[0].find_all(["th", "td"])]
+            ects_col = None
+            char_col = None
+            for idx, h in enumerate(header_cells):
+                if any(k in h for k in ["ects", "crédito", "credito"]):
+                    ects_col = idx
+                if any(k in h for k in ["carácter", "caracter", "tipo", "naturaleza"]):
+                    char_col = idx
+            # Last column named "total" → per-row aggregate (e.g. ECTS split by year)
+            if ects_col is None and header_cells and header_cells[-1].strip() == "total":
+                ects_col = len(header_cells) - 1
+                if char_col is None:
+                    char_col = 0
+            # 2-3 column table without explicit ECTS header: col0=tipo, last=ECTS
+            if ects_col is None and 2 <= len(header_cells) <= 3:
+                ects_col = len(header_cells) - 1
+                char_col = 0
+            if ects_col is None:
+                return None, 0
+            totals = {"basica": 0.0, "obligatoria": 0.0, "optativa": 0.0,
+                      "practicas": 0.0, "tfg_tfm": 0.0, "otros": 0.0}
+            n_rows = 0
+            for tr in rows[1:]:
+                cells = tr.find_all(["td", "th"])
+                if not cells:
+                    continue
+                if len(cells) <= ects_col:
+                    continue
+                # Skip total/summary rows
+                first_text = cells[0].get_text(strip=True).lower()
+                if "total" in first_text or "suma" in first_text:
+                    continue
+                m = re.search(r"(\d+(?:[.,]\d+)?)", cells[ects_col].get_text(separator=" ", strip=True))
+                val = float(m.group(1).replace(",", ".")) if m else 0.0
+                if val <= 0:
+                    continue
+                n_rows += 1
+                if char_col is not None and char_col < len(cells):
+                    cat_text = cells[char_col].get_text(separator=" ", strip=True)
+                else:
+                    cat_text = " ".join(
+                        cells[j].get_text(separator=" ", strip=True)
+                        for j in range(min(ects_col, len(cells)))
+                    )
+                cat = _categorize_ects(cat_text)
+                totals[cat if cat else "otros"] += val
+            return totals, n_rows
+
+        # Strategy: find the summary table — few rows (≤15), total in [60, 400].
+        # Among valid candidates, prefer the table with the highest total (most
+        # complete), breaking ties by fewest rows. This avoids picking a single-
+        # module partial table (e.g. "Obligatoria: 42") over the real 240-ECTS summary.
+        best = None
+        best_total = -1
+        best_rows = 9999
+        for table in content.find_all("table"):
+            if table.find_parent("table"):
+                continue
+            totals, n_rows = _parse_single_table(table)
+            if totals is None:
+                continue
+            table_total = sum(totals.values())
+            if 60 <= table_total <= 400 and n_rows <= 15:
+                if table_total > best_total or (table_total == best_total and n_rows < best_rows):
+                    best = totals
+                    best_total = table_total
+                    best_rows = n_rows
+
+        if best:
+            for k in best:
+                result[k] = int(round(best[k]))
+            result["total"] = sum(result[k] for k in best)
+    except Exception:
+        pass
+    return result
+
+
+def _parse_ects_from_ruct(url_plan: str) -> dict:
+    """
+    Fallback ECTS parser: aggregate the credits of the RUCT 'Módulos o Materias'
+    table (see _fetch_ruct_module_table) by category (Básica, Obligatoria,
+    Optativa, Prácticas, TFG/TFM).
+
+    Its columns are not the subject list's: carácter is the last carácter/tipo
+    header (a "tipo de materia" column is carácter here, not a name) or else
+    column 0, and every row with credits counts, named or not.
+
+    Returns same dict format as _parse_ects_breakdown.
+    """
+    result = {"basica": 0, "obligatoria": 0, "optativa": 0,
+              "practicas": 0, "tfg_tfm": 0, "otros": 0, "total": 0}
+    table = _fetch_ruct_module_table(url_plan)
+    header_cells = table["header"]
+    char_col = None
+    ects_col = None
+    for idx, h in enumerate(header_cells):
+        if any(k in h for k in ["carácter", "caracter", "tipo", "naturaleza"]):
+            char_col = idx
+        if any(k in h for k in ["ects", "crédito", "credito"]):
+            ects_col = idx
+    # Fallback: assume last column = ECTS, first = carácter
+    if ects_col is None:
+        if len(header_cells) < 2:
+            return result
+        ects_col = len(header_cells) - 1
+    if char_col is None:
+        char_col = 0
+
+    totals = {"basica": 0.0, "obligatoria": 0.0, "optativa": 0.0,
+              "practicas": 0.0, "tfg_tfm": 0.0, "otros": 0.0}
+    for cells in table["rows"]:
+        if not cells or len(cells) <= ects_col:
+            continue
+        first_text = cells[0].lower()
+        if "total" in first_text or "suma" in first_text:
+            continue
+        m = re.search(r"(\d+(?:[.,]\d+)?)", cells[ects_col])
+        val = float(m.group(1).replace(",", ".")) if m else 0.0
+        if val <= 0:
+            continue
+        cat = _categorize_ects(cells[char_col] if char_col < len(cells) else "")
+        totals[cat if cat else "otros"] += val
+
+    grand_total = sum(totals.values())
+    if 30 <= grand_total <= 500:
+        for k in totals:
+            result[k] = int(round(totals[k]))
+        result["total"] = sum(result[k] for k in totals)
+    return result
@@ -0,0 +1,391 @@
+"""
+subject_index.py
+Cross-catalogue inverted index over study-plan subjects.
+
+Maps accent-folded tokens of subject names to the subjects of every cached or
+crawled plan, so questions like "which Grados include Machine Learning in 1º?"
+are answered in milliseconds without scraping.
+
+The index lives on disk as a compacted snapshot (INDEX_PATH) plus an
+append-only journal (JOURNAL_PATH): every plan stored in the shared cache, by
+the app or the crawler, is appended to the journal (record_plan), and each
+process catches up with the lines written since its last look (sync). A plan
+whose subjects did not change since it was last journaled is not appended
+again. A rebuild, or a compaction once the journal or its superseded entries
+grow past a threshold (compact, run by refresher.py), writes a new snapshot
+and starts a new journal.
+
+    python subject_index.py build                       # rebuild from the plan cache
+    python subject_index.py compact                     # fold the journal in if it grew past the thresholds
+    python subject_index.py search "machine learning" --curso 1
+"""
+
+import os
+import re
+import gzip
+import json
+import bisect
+import hashlib
+import threading
+from contextlib import contextmanager
+
+from cache_store import DATA_DIR, get_store
+from ruct_scraper import _strip_accents
+
+INDEX_PATH = os.path.join(DATA_DIR, "subject_index.json.gz")
+JOURNAL_PATH = os.path.join(DATA_DIR, "subject_index.journal.jsonl")
+
+COMPACT_JOURNAL_BYTES = 8 * 1024 * 1024   # journal size that triggers a compaction
+COMPACT_DEAD_RATIO = 0.2                  # share of superseded entries that triggers one
+
+# Words that carry no meaning in subject names
+_STOPWORDS = {
+    "a", "al", "de", "del", "e", "el", "en", "la", "las", "lo", "los",
+    "o", "para", "por", "u", "un", "una", "y", "i", "ii", "iii", "iv",
+    "the", "of", "and", "to", "in", "for",
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> list[str]:
+    """Lower-case, accent-folded word tokens of a subject name, without stopwords."""
+    folded = _strip_accents(text).lower()
+    return [t for t in _TOKEN_RE.findall(folded) if t not in _STOPWORDS]
+
+
+def _normalize_curso(curso) -> str:
+    """'1', 1, '1º', '1.º' -> '1º'; '' stays ''."""
+    m = re.search(r"\d+", str(curso or ""))
+    return f"{int(m.group())}º" if m else ""
+
+
+def plan_subjects(plan: dict) -> list[dict]:
+    """Subjects of a _find_study_plan result, BOE first, as shown in the detail view."""
+    return plan.get("subjects_boe") or plan.get("subjects_ruct") or []
+
+
+def _plan_entries(codigo: str, plan: dict, titulo: str = "", universidad: str = "") -> tuple[dict, list]:
+    """The degree record and subject entries of one plan, as stored in the index."""
+    ficha = plan.get("ficha", {})
+    degree = {
+        "titulo": titulo or plan.get("titulo") or ficha.get("denominacion", ""),
+        "universidad": universidad or plan.get("universidad") or ficha.get("universidad", ""),
+    }
+    entries = [
+        (codigo, s["nombre"], _normalize_curso(s.get("curso")),
+         s.get("semestre", ""), float(s.get("ects") or 0), s.get("categoria", ""))
+        for s in plan_subjects(plan) if s.get("nombre")
+    ]
+    return degree, entries
+
+
+class SubjectIndex:
+    """
+    In-memory inverted index: token -> sorted posting list of subject entries.
+    Entries are (codigo, nombre, curso, semestre, ects, categoria) tuples;
+    degree titles and universities are kept once per codigo.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.entries: list[tuple | None] = []
+        self.postings: dict[str, list[int]] = {}
+        self.degrees: dict[str, dict] = {}
+        self._by_codigo: dict[str, list[int]] = {}
+        self._vocab: list[str] | None = None    # sorted tokens, for prefix lookups
+        self._journal = (None, 0)               # (inode, offset) of the journal lines applied
+
+    def __len__(self) -> int:
+        return len(self._by_codigo)
+
+    def add_plan(self, codigo: str, plan: dict, titulo: str = "", universidad: str = "") -> int:
+        """(Re)index the subjects of one plan. Returns the number of subjects indexed."""
+        if not codigo:
+            return 0
+        degree, entries = _plan_entries(codigo, plan, titulo, universidad)
+        return self._add_entries(codigo, degree, entries)
+
+    def _add_entries(self, codigo: str, degree: dict, entries: list) -> int:
+        with self._lock:
+            self.remove(codigo)
+            self.degrees[codigo] = degree
+            ids = []
+            for entry in entries:
+                eid = len(self.entries)
+                self.entries.append(tuple(entry))
+                ids.append(eid)
+                for tok in set(tokenize(entry[1])):
+                    self.postings.setdefault(tok, []).append(eid)  # ids grow: stays sorted
+            self._by_codigo[codigo] = ids
+            self._vocab = None
+            return len(ids)
+
+    def dead_ratio(self) -> float:
+        """Share of entries that are tombstones (superseded by a later version of their plan)."""
+        with self._lock:
+            return (len(self.entries) - sum(map(len, self._by_codigo.values()))) / max(len(self.entries), 1)
+
+    def remove(self, codigo: str) -> None:
+        """Drop a degree; its entries become tombstones until the next save()/load()."""
+        with self._lock:
+            for eid in self._by_codigo.pop(codigo, []):
+                self.entries[eid] = None
+            self.degrees.pop(codigo, None)
+
+    def _matching_ids(self, token: str, prefix: bool) -> set[int]:
+        ids = set(self.postings.get(token, ()))
+        if prefix and len(token) >= 3:
+            if self._vocab is None:
+                self._vocab = sorted(self.postings)
+            i = bisect.bisect_left(self._vocab, token)
+            while i < len(self._vocab) and self._vocab[i].startswith(token):
+                ids.update(self.postings[self._vocab[i]])
+                i += 1
+        return ids
+
+    def search(
+        self,
+        query: str,
+        curso=None,
+        categoria: str | None = None,
+        limit: int = 200,
+    ) -> list[dict]:
+        """
+        Return subjects whose name contains every query token (the last token
+        also matches as a prefix, so partial words work while typing).
+
+        curso      Optional course filter ('1º', '1' or 1)
+        categoria  Optional ECTS category filter ('basica', 'obligatoria', …)
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        curso = _normalize_curso(curso) if curso else ""
+        with self._lock:
+            ids = None
+            for i, tok in enumerate(tokens):
+                found = self._matching_ids(tok, prefix=(i == len(tokens) - 1))
+                ids = found if ids is None else ids & found
+                if not ids:
+                    return []
+            hits = []
+            for eid in sorted(ids):
+                entry = self.entries[eid]
+                if entry is None:
+                    continue
+                codigo, nombre, e_curso, semestre, ects, cat = entry
+                if curso and e_curso != curso:
+                    continue
+                if categoria and cat != categoria:
+                    continue
+                degree = self.degrees.get(codigo, {})
+                hits.append({
+                    "codigo": codigo,
+                    "titulo": degree.get("titulo", ""),
+                    "universidad": degree.get("universidad", ""),
+                    "asignatura": nombre,
+                    "curso": e_curso,
+                    "semestre": semestre,
+                    "ects": ects,
+                    "categoria": cat,
+                })
+                if len(hits) >= limit:
+                    break
+        return hits
+
+    # ── Persistence ──────────────────────────────────────────────────────────
+
+    def save(self, path: str = INDEX_PATH) -> None:
+        """Write the index (compacted: tombstones dropped) atomically to disk."""
+        with self._lock:
+            entries = [e for e in self.entries if e is not None]
+            data = {"degrees": self.degrees, "entries": entries}
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = f"{path}.tmp"
+        with gzip.open(tmp, "wt", encoding="utf-8") as fh:
+            json.dump(data, fh, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str = INDEX_PATH, journal_path: str = JOURNAL_PATH) -> "SubjectIndex":
+        """
+        Load a saved index and replay the journal; postings are rebuilt in
+        memory. Empty index if neither exists.
+        """
+        idx = cls()
+        if os.path.exists(path):
+            with gzip.open(path, "rt", encoding="utf-8") as fh:
+                data = json.load(fh)
+            idx.degrees = data.get("degrees", {})
+            for entry in data.get("entries", []):
+                eid = len(idx.entries)
+                idx.entries.append(tuple(entry))
+                idx._by_codigo.setdefault(entry[0], []).append(eid)
+                for tok in set(tokenize(entry[1])):
+                    idx.postings.setdefault(tok, []).append(eid)
+        idx.sync(journal_path)
+        return idx
+
+    def sync(self, journal_path: str = JOURNAL_PATH) -> int:
+        """Apply the journal lines written (by any process) since the last sync. Returns how many."""
+        try:
+            st = os.stat(journal_path)
+        except FileNotFoundError:
+            return 0
+        with self._lock:
+            inode, offset = self._journal
+            if inode != st.st_ino or st.st_size < offset:
+                offset = 0      # a new journal (after a rebuild): replaying it again is harmless
+            if st.st_size == offset:
+                self._journal = (st.st_ino, offset)
+                return 0
+            with open(journal_path, "rb") as fh:
+                fh.seek(offset)
+                data = fh.read(st.st_size - offset)
+            data = data[:data.rfind(b"\n") + 1]    # a line still being written waits for the next sync
+            n = 0
+            for line in data.splitlines():
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue
+                self._add_entries(rec["codigo"], rec["degree"], rec["entries"])
+                n += 1
+            self._journal = (st.st_ino, offset + len(data))
+            return n
+
+    @classmethod
+    def build(cls, plans) -> "SubjectIndex":
+        """Build an index from an iterable of (codigo, plan_dict) pairs."""
+        idx = cls()
+        for codigo, plan in plans:
+            idx.add_plan(codigo, plan)
+        return idx
+
+
+def record_plan(codigo: str, plan: dict, titulo: str = "", universidad: str = "",
+                journal_path: str = JOURNAL_PATH) -> bool:
+    """
+    Append a stored plan to the journal, for every process's index to pick up.
+    Skipped (False) when its entries are those last journaled for the codigo,
+    going by a digest kept in the shared cache.
+    """
+    import fcntl
+
+    if not codigo:
+        return False
+    degree, entries = _plan_entries(codigo, plan, titulo, universidad)
+    line = json.dumps({"codigo": codigo, "degree": degree, "entries": entries},
+                      ensure_ascii=False, separators=(",", ":")) + "\n"
+    digest = hashlib.sha1(line.encode("utf-8")).hexdigest()
+    store = get_store()
+    if store.get("indice", codigo) == digest:
+        return False
+    os.makedirs(os.path.dirname(journal_path) or ".", exist_ok=True)
+    while True:
+        with open(journal_path, "a", encoding="utf-8") as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)      # one whole line per writer
+            try:
+                current = os.fstat(fh.fileno()).st_ino == os.stat(journal_path).st_ino
+            except FileNotFoundError:
+                current = False
+            if current:                         # not set aside by a compaction meanwhile
+                fh.write(line)
+                break
+    store.put("indice", codigo, digest)
+    return True
+
+
+def index_version(path: str = INDEX_PATH) -> str:
+    """Change marker of the saved index: a rebuild changes it ('' when there is none)."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return ""
+    return f"{st.st_mtime_ns}-{st.st_size}"
+
+
+@contextmanager
+def _journal_set_aside(journal_path: str = JOURNAL_PATH):
+    """
+    Move the journal aside for a snapshot rewrite and yield its new path: plans
+    stored meanwhile go to a new journal. One rewrite at a time; a journal left
+    aside by an interrupted rewrite is reused, so none of its lines is lost.
+    """
+    import fcntl
+
+    old_journal = f"{journal_path}.old"
+    os.makedirs(os.path.dirname(journal_path) or ".", exist_ok=True)
+    with open(f"{journal_path}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if not os.path.exists(old_journal) and os.path.exists(journal_path):
+            os.replace(journal_path, old_journal)
+        if os.path.exists(old_journal):
+            with open(old_journal, "a") as fh:
+                fcntl.flock(fh, fcntl.LOCK_EX)  # writers that opened it before the move are done
+        yield old_journal
+        if os.path.exists(old_journal):
+            os.remove(old_journal)
+
+
+def build_from_cache(path: str = INDEX_PATH, journal_path: str = JOURNAL_PATH) -> SubjectIndex:
+    """
+    Rebuild the index from every plan in the shared cache and save it. The
+    journal is set aside first: plans stored during the rebuild go to a new one.
+    """
+    with _journal_set_aside(journal_path):
+        idx = SubjectIndex.build(get_store().iter("plan"))
+        idx.save(path)
+    idx.sync(journal_path)
+    return idx
+
+
+def compact(path: str = INDEX_PATH, journal_path: str = JOURNAL_PATH,
+            max_journal_bytes: int = COMPACT_JOURNAL_BYTES, max_dead_ratio: float = COMPACT_DEAD_RATIO) -> dict:
+    """
+    Fold the journal into the snapshot when it passes max_journal_bytes or
+    its superseded entries pass max_dead_ratio of the index, so processes
+    start from a compact snapshot instead of replaying every update.
+    """
+    try:
+        size = os.path.getsize(journal_path)
+    except FileNotFoundError:
+        size = 0
+    interrupted = os.path.exists(f"{journal_path}.old")
+    if not size and not interrupted:
+        return {"compacted": False, "journal_bytes": 0}
+    if size < max_journal_bytes and not interrupted:
+        dead = SubjectIndex.load(path, journal_path).dead_ratio()
+        if dead < max_dead_ratio:
+            return {"compacted": False, "journal_bytes": size, "dead_ratio": round(dead, 3)}
+    with _journal_set_aside(journal_path) as old_journal:
+        idx = SubjectIndex.load(path, old_journal)
+        dead = idx.dead_ratio()
+        idx.save(path)
+    return {"compacted": True, "journal_bytes": size, "dead_ratio": round(dead, 3), "plans": len(idx)}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Índice de asignaturas de todos los planes en caché.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("build", help="Reconstruir el índice desde la caché de planes")
+    sub.add_parser("compact", help="Incorporar el diario al índice si ha crecido demasiado")
+    p_search = sub.add_parser("search", help="Buscar titulaciones por asignatura")
+    p_search.add_argument("query")
+    p_search.add_argument("--curso")
+    p_search.add_argument("--categoria")
+    args = parser.parse_args()
+
+    if args.cmd == "build":
+        index = build_from_cache()
+        print(f"{len(index)} planes, {sum(e is not None for e in index.entries)} asignaturas indexadas")
+    elif args.cmd == "compact":
+        print(compact())
+    else:
+        index = SubjectIndex.load()
+        for hit in index.search(args.query, curso=args.curso, categoria=args.categoria):
+            print(f"{hit['curso'] or '-':>3}  {hit['ects']:>4.1f}  {hit['asignatura']}  "
+                  f"— {hit['titulo']} ({hit['universidad']})")
@@ -0,0 +1,94 @@
+"""
+test_study_plan.py
+Offline checks of the study_plan parsers: streamed BOE xml.php and the RUCT
+datosModulo table.
+
+    python -m unittest discover tests
+"""
+
+import io
+import unittest
+from unittest import mock
+
+import study_plan
+
+
+def _table(curso: int, names: list[str]) -> str:
+    rows = "".join(
+        f"<tr><td>{name}</td><td>Obligatoria</td><td>6</td></tr>" for name in names
+    )
+    return (f"<p>Curso {curso}.º</p>"
+            "<table><tr><td>Asignatura</td><td>Carácter</td><td>ECTS</td></tr>"
+            f"{rows}</table>")
+
+
+class _Response:
+    """Minimal streamed response: status_code, raw, context manager."""
+
+    def __init__(self, body: str):
+        self.status_code = 200
+        self.raw = io.BytesIO(body.encode("utf-8"))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class StreamBoeXmlTest(unittest.TestCase):
+
+    def _stream(self, texto: str):
+        body = f'<?xml version="1.0" encoding="UTF-8"?><documento><metadatos/><texto>{texto}</texto></documento>'
+        with mock.patch.object(study_plan.resilience, "get", return_value=_Response(body)):
+            return study_plan._stream_boe_xml("https://www.boe.es/diario_boe/xml.php?id=BOE-A-0")
+
+    def test_later_table_after_long_text_keeps_its_subjects(self):
+        first = [f"Asignatura troncal {i}" for i in range(4)]
+        optativas = [f"Optativa {i}" for i in range(4)]
+        # Enough prose between the tables to fill the text budget many times over.
+        filler = "".join(f"<p>{'Texto del anexo. ' * 40}{i}</p>" for i in range(60))
+        text, subjects = self._stream(_table(1, first) + filler + _table(4, optativas))
+
+        self.assertEqual([s["nombre"] for s in subjects], first + optativas)
+        self.assertEqual({s["curso"] for s in subjects[4:]}, {"4º"})
+        self.assertLessEqual(len(text), study_plan._BOE_TEXT_BUDGET)
+
+    def test_missing_texto_returns_none(self):
+        body = '<?xml version="1.0" encoding="UTF-8"?><documento><metadatos/></documento>'
+        with mock.patch.object(study_plan.resilience, "get", return_value=_Response(body)):
+            self.assertIsNone(study_plan._stream_boe_xml("https://www.boe.es/diario_boe/xml.php?id=BOE-A-0"))
+
+
+class ModuleTableTest(unittest.TestCase):
+
+    def _ects(self, html: str) -> dict:
+        table = study_plan._read_module_table(html)
+        with mock.patch.object(study_plan, "_fetch_ruct_module_table", return_value=table):
+            return study_plan._parse_ects_from_ruct("https://www.educacion.gob.es/ruct/estudio.action")
+
+    def test_ects_fallback_reads_tipo_de_materia_as_caracter(self):
+        ects = self._ects(
+            "<table><tr><th>Tipo de materia</th><th>Créditos ECTS</th></tr>"
+            "<tr><td>Formación básica</td><td>60</td></tr>"
+            "<tr><td>Obligatoria</td><td>120</td></tr>"
+            "<tr><td>Optativa</td><td>48</td></tr>"
+            "<tr><td>Trabajo fin de grado</td><td>12</td></tr>"
+            "<tr><td>Total</td><td>240</td></tr></table>"
+        )
+        self.assertEqual((ects["basica"], ects["obligatoria"], ects["optativa"], ects["tfg_tfm"], ects["otros"]),
+                         (60, 120, 48, 12, 0))
+
+    def test_subjects_skip_unnamed_rows_the_ects_fallback_counts(self):
+        html = ("<table><tr><th>#</th><th>Denominación</th><th>Carácter</th><th>ECTS</th></tr>"
+                "<tr><td>1</td><td>Matemáticas</td><td>Básica</td><td>30</td></tr>"
+                "<tr><td>2</td><td>Física</td><td>Obligatoria</td><td>30</td></tr>"
+                "<tr><td>3</td><td></td><td>Optativa</td><td>6</td></tr></table>")
+        subjects = study_plan._module_subjects(study_plan._read_module_table(html))
+        self.assertEqual([(s.nombre, s.categoria) for s in subjects],
+                         [("Matemáticas", "basica"), ("Física", "obligatoria")])
+        self.assertEqual(self._ects(html)["total"], 66)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,252 @@
+"""
+warmup.py
+Usage log and popularity-driven cache warming.
+
+The app logs every RUCT search and every "Ver" / "Comparar" click to a small
+SQLite file. The warming job reads the most requested searches, plans and
+fichas of the last days and runs them through the same cached entry points
+the app uses, so after a deploy the first users find them in the shared cache
+instead of waiting for full scrapes. Fresh entries cost nothing; missing ones
+are scraped and stale ones refreshed, all under the crawler's shared rate
+budget (crawler.SharedRateBudget), so warming never adds to the politeness
+limit.
+
+The app starts one scheduled warmer per host when it boots (ECU_WARMUP_EVERY
+hours between runs, 0 to disable); it can also be run by hand or from cron:
+
+    python warmup.py run                   # once
+    python warmup.py run --every 6         # every 6 hours
+    python warmup.py top                   # what would be warmed
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import sqlite3
+import threading
+import subprocess
+
+from cache_store import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+USAGE_PATH = os.path.join(DATA_DIR, "usage.sqlite3")
+LOCK_PATH = os.path.join(DATA_DIR, "warmup.lock")
+LOG_PATH = os.path.join(DATA_DIR, "warmup.log")
+
+TOP_K = int(os.environ.get("ECU_WARMUP_TOP", "50"))              # items warmed per kind
+WINDOW_DAYS = float(os.environ.get("ECU_WARMUP_DAYS", "14"))     # events counted
+RATE = float(os.environ.get("ECU_WARMUP_RATE", "1.0"))           # requests/s, shared with the crawler
+EVERY_HOURS = float(os.environ.get("ECU_WARMUP_EVERY", "6"))     # 0: the app does not start it
+RETENTION_DAYS = 90
+
+KINDS = ("search", "view", "compare")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    ts    REAL NOT NULL,
+    kind  TEXT NOT NULL,           -- search | view | compare
+    key   TEXT NOT NULL,           -- normalized search key or degree codigo
+    item  TEXT NOT NULL            -- JSON needed to replay it (search params or degree)
+);
+CREATE INDEX IF NOT EXISTS events_kind_ts ON events (kind, ts);
+"""
+
+
+# ─── Usage log ────────────────────────────────────────────────────────────────
+
+class UsageLog:
+    """Append-only event log on SQLite (WAL, shared by every app worker)."""
+
+    def __init__(self, path: str = USAGE_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def add(self, kind: str, items: list[tuple[str, dict]]) -> None:
+        """Record one event per (key, item)."""
+        now = time.time()
+        rows = [(now, kind, key, json.dumps(item, ensure_ascii=False, default=str))
+                for key, item in items if key]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany("INSERT INTO events (ts, kind, key, item) VALUES (?, ?, ?, ?)", rows)
+            self._conn.commit()
+
+    def top(self, kind: str, k: int = TOP_K, days: float = WINDOW_DAYS) -> list[tuple[dict, int]]:
+        """The k most requested items of a kind in the last `days`: [(item, requests)]."""
+        with self._lock:
+            rows = self._conn.execute(
+                # the bare `item` column comes from the row holding MAX(ts): the latest one
+                "SELECT item, COUNT(*) AS n, MAX(ts) FROM events WHERE kind = ? AND ts > ?"
+                " GROUP BY key ORDER BY n DESC, MAX(ts) DESC LIMIT ?",
+                (kind, time.time() - days * 86400, k),
+            ).fetchall()
+        return [(json.loads(item), n) for item, n, _ in rows]
+
+    def prune(self, days: float = RETENTION_DAYS) -> int:
+        with self._lock:
+            n = self._conn.execute("DELETE FROM events WHERE ts < ?", (time.time() - days * 86400,)).rowcount
+            self._conn.commit()
+        return n
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_log: UsageLog | None = None
+_log_lock = threading.Lock()
+
+
+def _usage_log() -> UsageLog:
+    global _log
+    with _log_lock:
+        if _log is None:
+            _log = UsageLog()
+        return _log
+
+
+def _degree_item(deg: dict) -> tuple[str, dict]:
+    item = {k: deg.get(k, "") or "" for k in ("codigo", "title", "university", "url_ruct", "url_plan")}
+    return item["codigo"] or item["url_ruct"], item
+
+
+def log_search(params: dict) -> None:
+    """Log a RUCT search (the search_ruct_cached keyword arguments, without options)."""
+    from ruct_scraper import _search_cache_key
+
+    try:
+        _usage_log().add("search", [(_search_cache_key(params), params)])
+    except Exception as e:      # the log must never break the app
+        logger.debug(f"Usage log failed: {e}")
+
+
+def log_degrees(kind: str, degrees: list[dict]) -> None:
+    """Log 'view' / 'compare' events for degrees ({codigo, title, university, url_ruct, url_plan})."""
+    try:
+        _usage_log().add(kind, [_degree_item(d) for d in degrees])
+    except Exception as e:
+        logger.debug(f"Usage log failed: {e}")
+
+
+# ─── Warming ──────────────────────────────────────────────────────────────────
+
+def warm(k: int = TOP_K, rate: float = RATE, days: float = WINDOW_DAYS, path: str = USAGE_PATH) -> dict:
+    """
+    Run the k most requested searches, plans ("Ver") and fichas ("Comparar")
+    through the shared cache under the shared rate budget, waiting for the
+    stale entries' background refreshes. Returns {kind: items warmed}.
+    """
+    import resilience
+    import comparator
+    import ruct_scraper
+    from crawler import CRAWL_PATH, SharedRateBudget
+    from study_plan import get_study_plan
+
+    usage = UsageLog(path)
+    usage.prune()
+    top = {kind: [item for item, _ in usage.top(kind, k, days)] for kind in KINDS}
+    usage.close()
+    done = dict.fromkeys(KINDS, 0)
+    if not any(top.values()):
+        return done
+
+    resilience.set_request_gate(SharedRateBudget(CRAWL_PATH, rate).wait)
+    try:
+        # Plans first: they are the slow scrapes users wait for
+        for deg in top["view"]:
+            try:
+                got = get_study_plan(deg["codigo"], deg["title"], deg["university"],
+                                     deg["url_ruct"], deg["url_plan"])
+                done["view"] += got.stored_at is not None
+            except Exception as e:
+                logger.warning(f"Plan {deg.get('codigo')}: {e}")
+
+        fichas = comparator.fetch_fichas(top["compare"], workers=2)
+        done["compare"] = sum(bool(f and f.get("creditos")) for f in fichas)
+
+        options = None
+        for params in top["search"]:
+            if options is None:
+                options = ruct_scraper.load_form_options(timeout=20)
+            try:
+                df, warn, _ = ruct_scraper.search_ruct_cached(**params, options=options)
+                done["search"] += bool(len(df)) or warn is None
+            except Exception as e:
+                logger.warning(f"Búsqueda {params.get('descripcion')!r}: {e}")
+
+        resilience.wait_for_refreshes()
+    finally:
+        resilience.set_request_gate(None)
+    return done
+
+
+def run_forever(every_hours: float, k: int = TOP_K, rate: float = RATE) -> None:
+    """Warm now and then every `every_hours`, while holding the host-wide warmer lock."""
+    import fcntl
+
+    os.makedirs(DATA_DIR, exist_ok=True)
+    lock = open(LOCK_PATH, "w")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        logger.info("Ya hay un precalentador en marcha en este equipo")
+        return
+    while True:
+        t0 = time.time()
+        try:
+            done = warm(k, rate)
+            logger.info(f"Caché precalentada en {time.time() - t0:.0f} s: {done}")
+        except Exception as e:
+            logger.warning(f"Precalentamiento fallido: {e}")
+        time.sleep(max(60.0, every_hours * 3600 - (time.time() - t0)))
+
+
+def start_background(every_hours: float = EVERY_HOURS) -> subprocess.Popen | None:
+    """
+    Start the scheduled warmer as a detached process (called once per app
+    process; extra ones exit at once on the host-wide lock).
+    """
+    if every_hours <= 0:
+        return None
+    os.makedirs(DATA_DIR, exist_ok=True)
+    with open(LOG_PATH, "a") as out:
+        return subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "run", "--every", str(every_hours)],
+            stdout=out, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Precalentar la caché con lo más consultado.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_run = sub.add_parser("run", help="Precalentar (una vez o periódicamente)")
+    p_run.add_argument("--every", type=float, default=0, help="Repetir cada N horas (0: una vez)")
+    p_run.add_argument("-k", type=int, default=TOP_K, help="Elementos por tipo")
+    p_run.add_argument("--rate", type=float, default=RATE,
+                       help="Peticiones por segundo como máximo (compartido con crawler.py)")
+    p_top = sub.add_parser("top", help="Lo más consultado")
+    p_top.add_argument("-k", type=int, default=TOP_K)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr, format="%(asctime)s %(message)s")
+    if args.cmd == "top":
+        log = UsageLog()
+        for kind in KINDS:
+            print(f"{kind}:")
+            for item, n in log.top(kind, args.k):
+                label = (item.get("descripcion") or item.get("universidad")) if kind == "search" else f"{item['title']} — {item['university']}"
+                print(f"  {n:>5}  {label}")
+    elif args.every > 0:
+        run_forever(args.every, args.k, args.rate)
+    else:
+        print(warm(args.k, args.rate))